@@ -0,0 +1,79 @@
+"""
+Domanda per articolo e settimana: rollup nel catalogo contro lettura di tutti i forecast.
+
+Scrive N forecast sintetici in una directory temporanea, li indicizza in un
+catalogo temporaneo (rollup incluso) e confronta:
+- query_demand + demand_pivot sul rollup (percorso della pagina Demand);
+- lettura di tutti i file, concatenazione e groupby (approccio senza rollup).
+
+Uso (dalla root del progetto):
+    python -m benchmarks.demand_rollup --forecasts 20 --rows 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from src.edi.demand import weekly_demand, demand_pivot
+from src.edi.parser import parse_edi_bytes
+from src.edi.synthetic import synthetic_print
+from src.utils import forecast_index
+from src.utils.config import ensure_data_dirs
+from src.utils.forecast_store import get_backend, read_forecast
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark demand rollups")
+    parser.add_argument("--forecasts", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=2_000, help="Rows per forecast")
+    parser.add_argument("--format", default="json", choices=["json", "parquet"])
+    parser.add_argument("--repeat", type=int, default=5, help="Queries per measure (best time is kept)")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    backend = get_backend(args.format)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Catalogo temporaneo, senza sincronizzazione con OUTPUT_DIR
+        forecast_index.FORECAST_INDEX_FILE = os.path.join(tmp, "index.db")
+        forecast_index._synced = True
+
+        paths = []
+        index_s = 0.0
+        for i in range(args.forecasts):
+            df = parse_edi_bytes(synthetic_print(args.rows, seed=i))
+            path = os.path.join(tmp, f"forecast_Bench_20250101_{i:06d}{backend.extension}")
+            meta = {"customer": "Bench", "timestamp": f"20250101_{i:06d}", "original_filename": f"bench_{i}.txt"}
+            backend.write(path, meta, df)
+            start = time.perf_counter()
+            forecast_index.index_forecast(path, {**meta, "row_count": len(df)}, df)
+            index_s += time.perf_counter() - start
+            paths.append(path)
+
+        def best(run):
+            elapsed = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = run()
+                elapsed = min(elapsed, time.perf_counter() - start)
+            return result, elapsed
+
+        def scan():
+            frames = [read_forecast(path)[1] for path in paths]
+            return demand_pivot(weekly_demand(pd.concat(frames, ignore_index=True)))
+
+        rollup_pivot, rollup_s = best(lambda: demand_pivot(forecast_index.query_demand("Bench")))
+        scan_pivot, scan_s = best(scan)
+        pd.testing.assert_frame_equal(rollup_pivot, scan_pivot, check_dtype=False)
+
+        total_rows = args.forecasts * args.rows
+        print(f"{args.forecasts} forecasts x {args.rows} rows = {total_rows} rows ({args.format}), "
+              f"{len(rollup_pivot)} articles x {len(rollup_pivot.columns) - 1} weeks")
+        print(f"Index + rollup on save: {index_s / args.forecasts * 1000:.1f} ms per forecast")
+        print(f"Demand from rollup:     {rollup_s * 1000:.1f} ms")
+        print(f"Demand from files:      {scan_s * 1000:.1f} ms ({scan_s / rollup_s:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
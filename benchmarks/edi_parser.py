@@ -0,0 +1,117 @@
+"""
+Benchmark del parser EDI (src/edi/parser.py) su stampe sintetiche.
+
+Misura righe/s e picco di memoria del parser streaming confrontandolo con il
+parser storico (split su stringa intera + DataFrame.apply per le date).
+Ogni misura gira in un processo separato: il picco RSS e quello del memory
+pool Arrow non sono così influenzati dalle esecuzioni precedenti.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.edi_parser --rows 100000 1000000
+    python -m benchmarks.edi_parser --rows 1000000 --skip-legacy
+"""
+import argparse
+import gc
+import multiprocessing
+import resource
+import time
+import tracemalloc
+
+import pandas as pd
+import pyarrow as pa
+
+from src.edi.parser import HEADERS, parse_edi_bytes
+from src.edi.synthetic import synthetic_print
+from src.utils.config import ensure_data_dirs
+
+
+def _legacy_parse(raw: bytes) -> pd.DataFrame:
+    """Parser storico della pagina di upload, per confronto."""
+    lines = raw.decode("utf-8").split("\n")
+    data_rows = []
+    for line in lines[6:]:
+        if not line.strip() or line.strip().startswith(("-", "+")):
+            continue
+        cols = line.split("!")
+        if cols and cols[0].strip() == "":
+            cols.pop(0)
+        if cols and cols[-1].strip() == "":
+            cols.pop()
+        if len(cols) >= 8:
+            data_rows.append([col.strip() for col in cols[:8]])
+    df = pd.DataFrame(data_rows, columns=HEADERS).dropna(how="all")
+
+    def format_date(date_str):
+        date_str = "".join(c for c in str(date_str).strip() if c.isdigit())
+        if len(date_str) == 8:
+            return f"{date_str[:2]}.{date_str[2:4]}.{date_str[4:]}"
+        elif len(date_str) == 7:
+            return f"0{date_str[0]}.{date_str[1:3]}.{date_str[3:]}"
+        elif len(date_str) == 6:
+            return f"{date_str[:2]}.{date_str[2:4]}.20{date_str[4:]}"
+        elif len(date_str) == 5:
+            return f"0{date_str[0]}.{date_str[1:3]}.20{date_str[3:]}"
+        return date_str
+
+    df["CONSEGNA"] = df["CONSEGNA"].apply(format_date)
+    return df
+
+
+_PARSERS = {"streaming": parse_edi_bytes, "legacy": _legacy_parse}
+
+
+def _measure(name, rows, queue):
+    """
+    Eseguito in un processo dedicato, così picco RSS e pool Arrow partono da zero.
+    Mette in coda (righe, secondi, picco heap Python MB, picco RSS MB, picco pool Arrow MB).
+    """
+    raw = synthetic_print(rows)
+    gc.collect()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = _PARSERS[name](raw)
+    elapsed = time.perf_counter() - start
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((
+        len(df),
+        elapsed,
+        py_peak / 2**20,
+        max(0, rss_after - rss_before) / 1024,  # ru_maxrss è in KiB su Linux
+        pa.default_memory_pool().max_memory() / 2**20,
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming EDI parser")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--skip-legacy", action="store_true", help="Do not run the legacy parser")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    names = ["streaming"] if args.skip_legacy else ["streaming", "legacy"]
+    ctx = multiprocessing.get_context("spawn")
+
+    print(f"{'rows':>10} {'parser':>10} {'seconds':>9} {'rows/s':>12} {'py heap MB':>11} {'RSS MB':>8} {'arrow MB':>9}")
+    for rows in args.rows:
+        for name in names:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure, args=(name, rows, queue))
+            proc.start()
+            parsed, elapsed, py_peak, rss_peak, arrow_peak = queue.get()
+            proc.join()
+            print(f"{rows:>10} {name:>10} {elapsed:>9.3f} {parsed / elapsed:>12,.0f} "
+                  f"{py_peak:>11.1f} {rss_peak:>8.1f} {arrow_peak:>9.1f}")
+
+    # Verifica di equivalenza su un campione ridotto
+    sample = synthetic_print(5_000)
+    if not _legacy_parse(sample).reset_index(drop=True).equals(parse_edi_bytes(sample)):
+        print("WARNING: streaming and legacy parser outputs differ")
+
+
+if __name__ == "__main__":
+    main()
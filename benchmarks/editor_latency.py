@@ -0,0 +1,79 @@
+"""
+Costo di una modifica nel data editor: DataFrame completo contro pagina con PatchLog.
+
+Per forecast sintetici di dimensione crescente misura il lavoro che ogni
+rerun dopo una modifica di cella fa lato server:
+- editor completo (comportamento precedente): copia del DataFrame e
+  serializzazione Arrow dell'intero forecast inviato al browser;
+- editor a pagine: costruzione della finestra dal PatchLog, copia e
+  serializzazione della sola pagina, registrazione della modifica.
+Riporta anche i byte inviati al browser ad ogni rerun (che il frontend deve
+ricevere e ridisegnare) e la ricostruzione del DataFrame completo al salvataggio.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.editor_latency --sizes 5000 20000 50000 100000 --page-size 500
+"""
+import argparse
+import time
+
+from streamlit import dataframe_util
+
+from src.edi.parser import parse_edi_bytes
+from src.edi.patch_log import PatchLog
+from src.edi.schema import to_compact
+from src.edi.synthetic import synthetic_print
+from src.utils.config import ensure_data_dirs
+
+
+def _best(run, repeat):
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark data editor latency per edit")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5_000, 20_000, 50_000, 100_000])
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measure (best time is kept)")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    print(f"{'rows':>8} {'full editor':>12} {'sent':>9} {'paged editor':>13} {'sent':>9} {'materialize':>12}")
+    for size in args.sizes:
+        df = to_compact(parse_edi_bytes(synthetic_print(size, seed=1)))
+        df.insert(0, "Index", range(1, len(df) + 1))
+        column = df.columns.get_loc("QUANTITA")
+
+        sent = {}
+
+        def full_rerun():
+            data = dataframe_util.convert_anything_to_pandas_df(df, ensure_copy=True)
+            sent["full"] = len(dataframe_util.convert_pandas_df_to_arrow_bytes(data))
+            data.iat[3, column] = 99.5
+
+        log = PatchLog(df)
+        page = size // args.page_size // 2
+        offset = page * args.page_size
+        key = f"editor_{page}"
+
+        def paged_rerun():
+            window = log.window(df, offset, offset + args.page_size, key)
+            data = dataframe_util.convert_anything_to_pandas_df(window, ensure_copy=True)
+            sent["paged"] = len(dataframe_util.convert_pandas_df_to_arrow_bytes(data))
+            data.iat[3, column] = 99.5
+            log.stage(key, window, data, {"edited_rows": {3: {"QUANTITA": 99.5}}})
+
+        full_s = _best(full_rerun, args.repeat)
+        paged_s = _best(paged_rerun, args.repeat)
+        materialize_s = _best(lambda: log.materialize(df), args.repeat)
+        assert log.materialize(df).iat[offset + 3, column] == 99.5
+        print(f"{size:>8} {full_s * 1000:>10.1f}ms {sent['full'] / 1024:>7.0f}KB {paged_s * 1000:>11.1f}ms "
+              f"{sent['paged'] / 1024:>7.0f}KB {materialize_s * 1000:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
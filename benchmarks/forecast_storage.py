@@ -0,0 +1,60 @@
+"""
+Confronto dimensione/tempo di caricamento tra i backend di storage dei forecast.
+
+Scrive lo stesso forecast sintetico con ogni backend di src/utils/forecast_store.py
+e misura dimensione su disco, tempo di scrittura e tempo di lettura.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.forecast_storage --rows 1000 10000 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pyarrow.parquet as pq
+
+from src.edi.parser import parse_edi_bytes
+from src.edi.synthetic import synthetic_print
+from src.utils.config import ensure_data_dirs
+from src.utils.forecast_store import BACKENDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare forecast storage backends")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Reads per measure (best time is kept)")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    meta = {"customer": "Navistar", "timestamp": "20250101_000000", "original_filename": "bench.txt"}
+
+    print(f"{'rows':>8} {'backend':>8} {'size KB':>10} {'write ms':>9} {'read ms':>9} {'bytes/row':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            df = parse_edi_bytes(synthetic_print(rows))
+            for backend in BACKENDS.values():
+                path = os.path.join(tmp, f"forecast_bench_{rows}{backend.extension}")
+
+                start = time.perf_counter()
+                backend.write(path, meta, df)
+                write_s = time.perf_counter() - start
+
+                read_s = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    _, loaded = backend.read(path)
+                    read_s = min(read_s, time.perf_counter() - start)
+                assert loaded.equals(df), f"{backend.name} round-trip mismatch"
+
+                size = os.path.getsize(path)
+                print(f"{rows:>8} {backend.name:>8} {size / 1024:>10.1f} {write_s * 1000:>9.1f} "
+                      f"{read_s * 1000:>9.1f} {size / rows:>10.1f}")
+
+            schema = pq.read_schema(os.path.join(tmp, f"forecast_bench_{rows}.parquet"))
+            print(f"{'':>8} parquet schema: QUANTITA={schema.field('QUANTITA').type}, "
+                  f"CONSEGNA={schema.field('CONSEGNA').type}")
+
+
+if __name__ == "__main__":
+    main()
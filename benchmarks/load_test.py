@@ -0,0 +1,398 @@
+"""
+Load test delle pagine con più pianificatori concorrenti, interamente offline.
+
+Ogni pianificatore è una sessione che usa le pagine vere tramite AppTest di
+Streamlit:
+- login: richiesta dell'OTP, che arriva via email a un Mailjet simulato
+  (server HTTP locale su MAILJET_URL, l'invio passa dalla coda di invio vera),
+  e accesso con il codice ricevuto;
+- upload di una stampa CBDELFORNA sintetica (file caricato simulato: AppTest
+  non gestisce st.file_uploader), salvataggio e reset dell'interfaccia;
+- view: apertura, pagina successiva, righe del primo forecast ed export Excel
+  fino alla comparsa del pulsante di download.
+
+AppTest non si può usare da più thread dello stesso processo: la concorrenza
+è data da --processes processi, ognuno dei quali alterna --sessions sessioni
+un'azione alla volta (come un processo Streamlit che serve più utenti). L'RSS
+riportato è quello di questi processi. Tutti lavorano su una directory dei
+dati temporanea (EDI_DATA_DIR) con --existing forecast già salvati.
+
+Per ogni azione riporta p50/p95/p99; con --save i risultati vengono scritti
+in JSON e con --baseline confrontati con un'esecuzione precedente (uscita 1
+se p95 o RSS di picco peggiorano oltre --tolerance, o se ci sono errori).
+
+Uso (dalla root del progetto):
+    python -m benchmarks.load_test --processes 2 --sessions 2 --cycles 3
+    python -m benchmarks.load_test --save baseline.json
+    python -m benchmarks.load_test --baseline baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ACTIONS = ("open_app", "request_otp", "otp_delivery", "login", "upload_open", "upload", "save", "reset",
+           "view_open", "view_next_page", "view_rows", "download")
+
+
+# -----------------------------
+# MAILJET SIMULATO
+# -----------------------------
+class _MailjetStub(BaseHTTPRequestHandler):
+    """POST: email Mailjet (il codice OTP viene registrato); GET /otp/<email>: ultimo codice ricevuto."""
+
+    codes = {}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        for message in body.get("Messages", []):
+            code = re.search(r"codice di \w+ è: ([A-Z0-9]+)", message.get("TextPart", ""))
+            if code:
+                for recipient in message.get("To", []):
+                    self.codes[recipient["Email"]] = code.group(1)
+        self._reply(200, {"Messages": [{"Status": "success"}]})
+
+    def do_GET(self):
+        code = self.codes.pop(self.path.rsplit("/", 1)[-1], None)
+        self._reply(200 if code else 404, {"code": code})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _wait_for_otp(stub_url, email, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{stub_url}/otp/{email}") as response:
+                return json.load(response)["code"]
+        except urllib.error.HTTPError:
+            time.sleep(0.02)
+    raise TimeoutError(f"No OTP delivered to {email} within {timeout}s")
+
+
+# -----------------------------
+# SESSIONI
+# -----------------------------
+def _page_script(module_name):
+    """
+    Script di AppTest: la pagina `module_name`, con il file caricato preso da
+    st.session_state e l'id della sessione del pianificatore (AppTest usa lo
+    stesso id per tutte le sessioni, che si dividerebbero il session store).
+    """
+    import importlib
+    import io
+
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx and st.session_state.get("_load_test_session"):
+        ctx.session_id = st.session_state["_load_test_session"]
+
+    if not getattr(st.file_uploader, "load_test", False):
+        upload_widget = st.file_uploader
+
+        def file_uploader(*args, **kwargs):
+            upload = st.session_state.get("_load_test_upload")
+            if upload is None or kwargs.get("accept_multiple_files"):
+                return upload_widget(*args, **kwargs)
+            uploaded = io.BytesIO(upload[1])
+            uploaded.name = upload[0]
+            return uploaded
+
+        file_uploader.load_test = True
+        st.file_uploader = file_uploader
+
+    importlib.import_module(f"pages.{module_name}").page()
+
+
+def _app_test(module_name, args, planner, email=None):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_function(_page_script, args=(module_name,), default_timeout=args.timeout)
+    at.session_state["_load_test_session"] = f"load-test-{planner}"
+    if email:
+        at.session_state["logged_in"] = True
+        at.session_state["user_email"] = email
+    return at
+
+
+def _button(at, label=None, key=None):
+    for button in at.button:
+        if (key is not None and button.key == key) or (label is not None and label in button.label):
+            return button
+    raise LookupError(f"Button {key or label} not found")
+
+
+def _session(planner, args, stub_url, record):
+    """Azioni di un pianificatore: generatore che si ferma dopo ogni azione."""
+    from streamlit.testing.v1 import AppTest
+
+    from src.edi.synthetic import synthetic_print
+
+    email = f"planner{planner}@iph.it"
+
+    app = AppTest.from_file(os.path.join(ROOT, "src", "app.py"), default_timeout=args.timeout)
+    record("open_app", app, app.run)
+    yield
+
+    login = _app_test("login_page", args, planner)
+    login.run()
+    login.text_input(key="request_otp_email").set_value(email)
+    requested = time.perf_counter()
+    record("request_otp", login, _button(login, "Send OTP").click().run)
+    code = _wait_for_otp(stub_url, email, args.timeout)
+    record("otp_delivery", None, seconds=time.perf_counter() - requested)
+    login.text_input(key="login_email").set_value(email)
+    login.text_input(key="login_code").set_value(code)
+    record("login", login, _button(login, "Login").click().run)
+    if not login.session_state["logged_in"]:
+        raise RuntimeError(f"Login failed for {email}")
+    yield
+
+    upload = _app_test("upload_forecast_page", args, planner, email)
+    record("upload_open", upload, upload.run)
+    yield
+
+    for cycle in range(args.cycles):
+        name = f"CBDELFORNA_LT{planner}_{cycle % 2}.txt"
+        upload.session_state["_load_test_upload"] = (name, synthetic_print(args.rows, seed=planner * 1000 + cycle))
+        upload.run()
+        upload.selectbox(key=f"cliente_input_{upload.session_state['widget_version']}").set_value("Navistar")
+        record("upload", upload, _button(upload, "Upload file").click().run)
+        yield
+        record("save", upload, _button(upload, "SAVE").click().run)
+        yield
+        upload.session_state["_load_test_upload"] = None  # dopo il reset l'uploader è vuoto
+        record("reset", upload, _button(upload, key="reset_after_save").click().run)
+        yield
+
+        # Un AppTest nuovo per ogni giro: AppTest non supporta i rerun dopo un download_button con key
+        view = _app_test("view_forecast_page", args, planner, email)
+        record("view_open", view, view.run)
+        yield
+        show = next(toggle for toggle in view.toggle if toggle.key.startswith("show_"))
+        record("view_rows", view, show.set_value(True).run)
+        yield
+
+        def download():
+            prepare = next(button for button in view.button if button.key.startswith("prepare_"))
+            prepare.click().run()
+            deadline = time.monotonic() + args.timeout
+            while not view.get("download_button") and time.monotonic() < deadline:
+                time.sleep(0.05)
+                view.run()
+            if not view.get("download_button"):
+                raise TimeoutError("Export not ready")
+        record("download", view, download)
+        yield
+
+        # Paginazione su un AppTest a parte: dopo il cambio di pagina i widget precedenti non esistono più
+        pages = _app_test("view_forecast_page", args, planner, email)
+        pages.run()
+        next_page = _button(pages, key="next_bottom")
+        if not next_page.disabled:
+            record("view_next_page", pages, next_page.click().run)
+            yield
+
+
+def _process(planners, args, stub_url, results):
+    """Processo di load test: alterna le azioni delle sessioni dei pianificatori `planners`."""
+    samples, rss = [], []
+
+    def record(action, at, run=None, seconds=None):
+        error = None
+        if run is not None:
+            start = time.perf_counter()
+            try:
+                run()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            seconds = time.perf_counter() - start
+        if error is None and at is not None and (at.exception or at.error):
+            error = "; ".join([e.value for e in at.exception] + [e.value for e in at.error])[:300]
+        samples.append({"action": action, "seconds": seconds, "error": error})
+        rss.append(_rss_mb())
+
+    sessions = {planner: _session(planner, args, stub_url, record) for planner in planners}
+    rss.append(_rss_mb())
+    while sessions:
+        for planner, session in list(sessions.items()):
+            try:
+                next(session)
+            except StopIteration:
+                del sessions[planner]
+            except Exception as e:
+                samples.append({"action": "session", "seconds": 0, "error": f"planner {planner}: {type(e).__name__}: {e}"})
+                del sessions[planner]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put({"samples": samples, "rss_start_mb": rss[0], "rss_end_mb": rss[-1], "rss_peak_mb": peak})
+
+
+def _rss_mb():
+    """RSS corrente (Linux), altrimenti il picco."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# -----------------------------
+# PREPARAZIONE E REPORT
+# -----------------------------
+def _prepare(args):
+    """Utenti attivi dei pianificatori e forecast già salvati, nella directory dei dati del test."""
+    from datetime import datetime
+
+    from src.edi.synthetic import populate_forecasts
+    from src.utils.config import ensure_data_dirs
+    from src.utils.user_repository import get_user_repository
+
+    ensure_data_dirs()
+    repo = get_user_repository()
+    for planner in range(args.processes * args.sessions):
+        repo.add({"name": "Planner", "surname": str(planner), "email": f"planner{planner}@iph.it",
+                  "role": "sales_user", "is_active": True, "created_at": datetime.now().isoformat()})
+    populate_forecasts(args.existing, seed=10_000, index=True)
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(outcomes) -> dict:
+    samples = [sample for outcome in outcomes for sample in outcome["samples"]]
+    actions = {}
+    for action in ACTIONS + ("session",):
+        done = [s for s in samples if s["action"] == action]
+        seconds = sorted(s["seconds"] for s in done if s["error"] is None)
+        if not done:
+            continue
+        actions[action] = {
+            "count": len(done),
+            "errors": len(done) - len(seconds),
+            **({f"p{q}": _percentile(seconds, q / 100) for q in (50, 95, 99)} if seconds else {}),
+            "max": seconds[-1] if seconds else None,
+        }
+    return {
+        "actions": actions,
+        "errors": [s["error"] for s in samples if s["error"]],
+        "rss_peak_mb": max(outcome["rss_peak_mb"] for outcome in outcomes),
+        "processes": [{key: outcome[key] for key in ("rss_start_mb", "rss_end_mb", "rss_peak_mb")} for outcome in outcomes],
+    }
+
+
+def compare(summary, baseline, tolerance) -> list[str]:
+    """Peggioramenti rispetto a `baseline` oltre la tolleranza (p95 per azione e RSS di picco)."""
+    regressions = []
+    for action, stats in summary["actions"].items():
+        before = baseline["actions"].get(action, {}).get("p95")
+        if before and stats.get("p95") and stats["p95"] > before * (1 + tolerance):
+            regressions.append(f"{action}: p95 {before * 1000:.0f} ms -> {stats['p95'] * 1000:.0f} ms")
+    if summary["rss_peak_mb"] > baseline["rss_peak_mb"] * (1 + tolerance):
+        regressions.append(f"peak RSS {baseline['rss_peak_mb']:.0f} MB -> {summary['rss_peak_mb']:.0f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the login, upload and view pages")
+    parser.add_argument("--processes", type=int, default=2, help="Server processes running sessions")
+    parser.add_argument("--sessions", type=int, default=2, help="Concurrent planner sessions per process")
+    parser.add_argument("--cycles", type=int, default=3, help="Upload/save/view/download cycles per session")
+    parser.add_argument("--rows", type=int, default=2_000, help="Rows per uploaded print")
+    parser.add_argument("--existing", type=int, default=30, help="Synthetic forecasts in the data directory before the test")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout of a single action (seconds)")
+    parser.add_argument("--save", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with the JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95/RSS increase over the baseline")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary data directory")
+    args = parser.parse_args()
+
+    stub = ThreadingHTTPServer(("127.0.0.1", 0), _MailjetStub)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{stub.server_port}"
+
+    # Prima di importare src: i processi figli ereditano l'ambiente
+    data_dir = tempfile.mkdtemp(prefix="edi_load_test_")
+    os.environ.update({
+        "EDI_DATA_DIR": data_dir,
+        "MAILJET_URL": f"{stub_url}/v3.1/send",
+        "MAILJET_API_KEY": "load-test",
+        "MAILJET_API_SECRET": "load-test",
+        "APPRISE_NOTFICATION_ENABLED": "false",
+        "METRICS_PORT": "0",
+        "STARTUP_WARMUP": "false",
+    })
+    os.environ.setdefault("APP_LOG_LEVEL", "WARNING")
+    sys.path.insert(0, os.path.join(ROOT, "src"))  # "pages.*", come con streamlit run src/app.py
+
+    try:
+        _prepare(args)
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        planners = list(range(args.processes * args.sessions))
+        workers = [ctx.Process(target=_process, args=(planners[i::args.processes], args, stub_url, results))
+                   for i in range(args.processes)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        stub.shutdown()
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    summary = summarize(outcomes)
+    print(f"{len(planners)} planners ({args.processes} processes x {args.sessions} sessions), {args.cycles} cycles of "
+          f"{args.rows} rows, {args.existing} existing forecasts: {elapsed:.1f}s")
+    print(f"{'action':<16} {'count':>6} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for action, stats in summary["actions"].items():
+        times = " ".join(f"{stats[key] * 1000:>7.0f}ms" if stats.get(key) is not None else f"{'-':>9}"
+                         for key in ("p50", "p95", "p99", "max"))
+        print(f"{action:<16} {stats['count']:>6} {stats['errors']:>7} {times}")
+    for number, process in enumerate(summary["processes"]):
+        print(f"process {number}: RSS {process['rss_start_mb']:.0f} MB at start, {process['rss_end_mb']:.0f} MB at end, "
+              f"peak {process['rss_peak_mb']:.0f} MB")
+    for error in summary["errors"][:10]:
+        print(f"  ERROR: {error}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"  REGRESSION: {regression}")
+        print("  baseline: OK" if not regressions else f"  baseline: {len(regressions)} regressions")
+    raise SystemExit(1 if summary["errors"] or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
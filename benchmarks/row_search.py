@@ -0,0 +1,83 @@
+"""
+Ricerca di righe nei forecast: tabella forecast_rows del catalogo contro lettura dei file.
+
+Indicizza N forecast sintetici in un catalogo temporaneo e misura la ricerca
+"articolo X in consegna nei prossimi 90 giorni" (conteggio + prima pagina)
+e la paginazione di un singolo forecast, confrontandole con la lettura di
+tutti i file e il filtro in pandas.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.row_search --forecasts 20 --rows 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+from src.edi.parser import parse_edi_bytes
+from src.edi.synthetic import synthetic_print
+from src.utils import forecast_index
+from src.utils.config import ensure_data_dirs
+from src.utils.forecast_store import get_backend, read_forecast
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row search over forecasts")
+    parser.add_argument("--forecasts", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=5_000, help="Rows per forecast")
+    parser.add_argument("--repeat", type=int, default=5, help="Queries per measure (best time is kept)")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    backend = get_backend("json")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Catalogo temporaneo, senza sincronizzazione con OUTPUT_DIR
+        forecast_index.FORECAST_INDEX_FILE = os.path.join(tmp, "index.db")
+        forecast_index._synced = True
+
+        paths = []
+        for i in range(args.forecasts):
+            df = parse_edi_bytes(synthetic_print(args.rows, seed=i))
+            path = os.path.join(tmp, f"forecast_Bench_20250101_{i:06d}{backend.extension}")
+            meta = {"customer": "Bench", "timestamp": f"20250101_{i:06d}", "original_filename": f"bench_{i}.txt"}
+            backend.write(path, meta, df)
+            forecast_index.index_forecast(path, {**meta, "row_count": len(df)}, df)
+            paths.append(path)
+
+        article = df["COD. ART"].iloc[0]
+        start_date = pd.to_datetime(df["CONSEGNA"].iloc[0], format="%d.%m.%Y").date()
+        filters = {"article": article, "date_from": start_date, "date_to": start_date + timedelta(days=90)}
+
+        def best(run):
+            elapsed = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = run()
+                elapsed = min(elapsed, time.perf_counter() - start)
+            return result, elapsed
+
+        def scan():
+            frame = pd.concat([read_forecast(path)[1] for path in paths], ignore_index=True)
+            delivery = pd.to_datetime(frame["CONSEGNA"], format="%d.%m.%Y", errors="coerce").dt.date
+            mask = (frame["COD. ART"] == article) & (delivery >= filters["date_from"]) & (delivery <= filters["date_to"])
+            return int(mask.sum())
+
+        (total, _), search_s = best(lambda: (forecast_index.count_rows(**filters),
+                                             forecast_index.query_rows(limit=50, **filters)))
+        scanned, scan_s = best(scan)
+        assert total == scanned, f"row count mismatch: {total} != {scanned}"
+        last_page = (args.rows // 50 - 1) * 50
+        _, page_s = best(lambda: forecast_index.query_rows(limit=50, offset=last_page, filename=os.path.basename(paths[-1])))
+
+        print(f"{args.forecasts} forecasts x {args.rows} rows = {args.forecasts * args.rows} rows indexed")
+        print(f"Article {article}, 90 days: {total} rows")
+        print(f"  forecast_rows: {search_s * 1000:.1f} ms (count + first page)")
+        print(f"  read files:    {scan_s * 1000:.1f} ms ({scan_s / search_s:.0f}x slower)")
+        print(f"Last page of one forecast (50 rows): {page_s * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Stress test dei salvataggi concorrenti (src/edi/pipeline.py).
+
+Più processi, ciascuno con più thread, salvano forecast sintetici dello
+stesso cliente su pochi file originali, così molti salvataggi si contendono
+lo stesso forecast. Con --kill alcuni processi vengono terminati a metà
+salvataggio (come un riavvio del container) e, come all'avvio dell'app,
+i loro salvataggi interrotti vengono recuperati dal giornale. Alla fine
+verifica che:
+- per ogni file originale esista un solo forecast, leggibile per intero e
+  uguale a una delle versioni salvate (nessun file troncato o mescolato);
+- il catalogo punti a quel forecast e l'ultima revisione dello storico
+  coincida con il suo contenuto;
+- non restino copie di ripristino (.rollback) né giornali;
+- senza --kill, backup e revisioni siano tanti quanti i salvataggi riusciti.
+
+Lavora sulla directory dei dati configurata con un cliente dedicato
+(STRESSTEST) e alla fine elimina forecast, voci di backup e storico creati
+(--keep per conservarli).
+
+Uso (dalla root del progetto):
+    python -m benchmarks.save_concurrency --processes 4 --threads 4 --saves 10 --files 3
+    python -m benchmarks.save_concurrency --kill 3
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from src.edi.parser import parse_edi_bytes
+from src.edi.pipeline import recover_interrupted_saves, save_forecast
+from src.edi.schema import to_display
+from src.edi.synthetic import synthetic_print
+from src.utils.backup_store import list_backups, remove_backup
+from src.utils.config import JOURNAL_DIR, OUTPUT_DIR, REVISION_DIR, ensure_data_dirs
+from src.utils.forecast_index import find_by_original_filename, remove_forecast, sync_index
+from src.utils.forecast_store import read_forecast
+from src.utils.revision_store import list_revisions, load_revision
+
+CUSTOMER = "STRESSTEST"
+
+
+def _original_filename(number):
+    return f"stress_{number}.txt"
+
+
+def _version(seed, rows):
+    """Contenuto e DataFrame di una versione: il seed rende ogni versione distinguibile."""
+    content = synthetic_print(rows, seed=seed).decode("utf-8")
+    return content, parse_edi_bytes(content.encode("utf-8"))
+
+
+def _worker(worker, args, results):
+    """Processo di salvataggio: `threads` thread, `saves` salvataggi ciascuno."""
+    rnd = random.Random(worker)
+
+    def run(thread):
+        outcomes = []
+        for save in range(args.saves):
+            seed = worker * 1_000_000 + thread * 1_000 + save
+            original = _original_filename(rnd.randrange(args.files))
+            content, df = _version(seed, args.rows)
+            start = time.perf_counter()
+            try:
+                save_forecast(CUSTOMER, original, content, df)
+                error = None
+            except Exception as e:
+                error = str(e)
+            outcomes.append({"original": original, "sha256": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+                             "seed": seed, "error": error, "seconds": time.perf_counter() - start})
+        return outcomes
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for outcomes in pool.map(run, range(args.threads)):
+            results.extend(outcomes)
+
+
+def _killed_worker(worker, args):
+    """Processo che salva senza sosta finché non viene terminato."""
+    rnd = random.Random(worker)
+    seed = worker * 1_000_000
+    while True:
+        seed += 1
+        content, df = _version(seed, args.rows)
+        save_forecast(CUSTOMER, _original_filename(rnd.randrange(args.files)), content, df)
+
+
+def _check(args, outcomes):
+    """Verifica l'integrità dei forecast salvati; ritorna la lista dei problemi."""
+    problems = []
+    sync_index()
+    saved = [o for o in outcomes if o["error"] is None]
+    by_sha = {o["sha256"]: o for o in outcomes}
+    names = os.listdir(OUTPUT_DIR)
+    for number in range(args.files):
+        original = _original_filename(number)
+        files = []
+        for name in names:
+            if not name.startswith(f"forecast_{CUSTOMER}_") or ".tmp" in name or name.endswith(".rollback"):
+                continue
+            meta, df = read_forecast(os.path.join(OUTPUT_DIR, name))  # un file troncato solleva qui
+            if meta.get("original_filename") == original:
+                files.append((name, meta, df))
+        if not files:
+            if any(o["original"] == original for o in saved):
+                problems.append(f"{original}: no forecast on disk")
+            continue
+        if len(files) > 1:
+            problems.append(f"{original}: {len(files)} forecasts on disk ({', '.join(f[0] for f in files)})")
+        name, meta, df = files[0]
+        version = by_sha.get(meta.get("content_sha256"))
+        if version is None and not args.kill:
+            problems.append(f"{name}: content of an unknown save")
+        seed = version["seed"] if version else None
+        if seed is not None and not df.equals(to_display(_version(seed, args.rows)[1])):
+            problems.append(f"{name}: rows do not match the saved version")
+        entry = find_by_original_filename(original)
+        if not entry or entry["filename"] != name:
+            problems.append(f"{original}: catalog points to {entry and entry['filename']}, not {name}")
+        revisions = list_revisions(original)
+        if revisions and not load_revision(original)[1].equals(df):
+            problems.append(f"{original}: latest revision differs from the forecast")
+        if not args.kill:
+            expected = sum(o["original"] == original for o in saved)
+            if len(revisions) != expected:
+                problems.append(f"{original}: {len(revisions)} revisions for {expected} saves")
+            backups = len(list_backups(original, CUSTOMER))
+            if backups != expected:
+                problems.append(f"{original}: {backups} backups for {expected} saves")
+    leftovers = [name for name in names if name.startswith(f"forecast_{CUSTOMER}_") and
+                 (".tmp" in name or name.endswith(".rollback"))]
+    # I .tmp di un processo terminato durante la scrittura restano (mai letti); le copie di ripristino no
+    if any(name.endswith(".rollback") for name in leftovers) or (leftovers and not args.kill):
+        problems.append(f"Leftover temporary files: {', '.join(leftovers)}")
+    journals = [name for name in os.listdir(JOURNAL_DIR) if name.startswith("stress_")]
+    if journals:
+        problems.append(f"Unrecovered save journals: {', '.join(journals)}")
+    return problems, leftovers
+
+
+def _cleanup(args):
+    for name in os.listdir(OUTPUT_DIR):
+        if name.startswith(f"forecast_{CUSTOMER}_"):
+            remove_forecast(name)
+            os.remove(os.path.join(OUTPUT_DIR, name))
+    for entry in list_backups(customer=CUSTOMER):
+        remove_backup(entry["id"])
+    for number in range(args.files):
+        shutil.rmtree(os.path.join(REVISION_DIR, f"stress_{number}"), ignore_errors=True)
+        journal = os.path.join(JOURNAL_DIR, f"stress_{number}.json")
+        if os.path.exists(journal):
+            os.remove(journal)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test concurrent forecast saves")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="Saving threads per process")
+    parser.add_argument("--saves", type=int, default=10, help="Saves per thread")
+    parser.add_argument("--files", type=int, default=3, help="Distinct original files (fewer = more contention)")
+    parser.add_argument("--rows", type=int, default=2_000)
+    parser.add_argument("--kill", type=int, default=0, help="Extra processes killed mid-save")
+    parser.add_argument("--keep", action="store_true", help="Keep the saved forecasts, backups and history")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    _cleanup(args)
+    manager = multiprocessing.Manager()
+    results = manager.list()
+    workers = [multiprocessing.Process(target=_worker, args=(i + 1, args, results)) for i in range(args.processes)]
+    victims = [multiprocessing.Process(target=_killed_worker, args=(1_000 + i, args)) for i in range(args.kill)]
+
+    start = time.perf_counter()
+    for process in workers + victims:
+        process.start()
+    killer = None
+    if victims:
+        def kill_victims():
+            for process in victims:
+                time.sleep(random.uniform(0.5, 3))
+                process.kill()
+        killer = threading.Thread(target=kill_victims)
+        killer.start()
+    for process in workers:
+        process.join()
+    if killer:
+        killer.join()
+    for process in victims:
+        process.join()
+    elapsed = time.perf_counter() - start
+    recovered = recover_interrupted_saves()  # come al riavvio dell'app
+
+    outcomes = list(results)
+    saved = [o for o in outcomes if o["error"] is None]
+    seconds = sorted(o["seconds"] for o in saved)
+    print(f"{len(outcomes)} saves by {args.processes}x{args.threads} savers on {args.files} files "
+          f"({args.rows} rows each) in {elapsed:.1f}s, {len(victims)} savers killed, "
+          f"{recovered} interrupted saves recovered")
+    print(f"  ok: {len(saved)}  failed: {len(outcomes) - len(saved)}")
+    for error, count in Counter(o["error"] for o in outcomes if o["error"]).most_common(5):
+        print(f"    {count} x {error}")
+    if seconds:
+        print(f"  save time: median {statistics.median(seconds) * 1000:.0f} ms, "
+              f"p95 {seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))] * 1000:.0f} ms, "
+              f"max {seconds[-1] * 1000:.0f} ms")
+
+    problems, leftovers = _check(args, outcomes)
+    if leftovers:
+        print(f"  leftover files from killed saves: {', '.join(leftovers)}")
+    for problem in problems:
+        print(f"  PROBLEM: {problem}")
+    print("  integrity: OK" if not problems else f"  integrity: {len(problems)} problems")
+
+    if not args.keep:
+        _cleanup(args)
+    raise SystemExit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Memoria per sessione del forecast caricato: DataFrame stringa contro schema compatto.
+
+Analizza una stampa sintetica e confronta il DataFrame restituito dal parser
+(tutte stringhe Python) con la forma compatta di src.edi.schema tenuta in
+session_state dalla pagina di upload: memoria (stringhe comprese), dimensione
+serializzata (pickle, come nei risultati dei worker dell'upload multiplo) e
+costo delle conversioni. Verifica anche che to_display restituisca
+esattamente i valori originali.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.session_memory --rows 20000
+"""
+import argparse
+import pickle
+import time
+
+import pandas as pd
+
+from src.edi.parser import parse_edi_bytes
+from src.edi.schema import to_compact, to_display, frame_memory
+from src.edi.synthetic import synthetic_print
+from src.utils.config import ensure_data_dirs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark session memory of parsed forecasts")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent sessions for the projection")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    df = parse_edi_bytes(synthetic_print(args.rows, seed=1))
+
+    start = time.perf_counter()
+    compact = to_compact(df)
+    compact_s = time.perf_counter() - start
+    start = time.perf_counter()
+    display = to_display(compact)
+    display_s = time.perf_counter() - start
+    pd.testing.assert_frame_equal(display, df)
+
+    strings_bytes, compact_bytes = frame_memory(df), frame_memory(compact)
+    mb = 1024 * 1024
+    print(f"{args.rows} rows")
+    print(f"  {'column':<12} {'string':>10} {'compact':>10}  dtype")
+    strings_usage, compact_usage = df.memory_usage(deep=True), compact.memory_usage(deep=True)
+    for column in df.columns:
+        print(f"  {column:<12} {strings_usage[column] / 1024:>8.0f}KB {compact_usage[column] / 1024:>8.0f}KB  {compact[column].dtype}")
+    print(f"Memory:  {strings_bytes / mb:.2f} MB -> {compact_bytes / mb:.2f} MB "
+          f"({strings_bytes / compact_bytes:.1f}x smaller)")
+    print(f"Pickled: {len(pickle.dumps(df)) / mb:.2f} MB -> {len(pickle.dumps(compact)) / mb:.2f} MB")
+    print(f"{args.sessions} sessions: {strings_bytes * args.sessions / mb:.0f} MB -> "
+          f"{compact_bytes * args.sessions / mb:.0f} MB")
+    print(f"to_compact: {compact_s * 1000:.1f} ms, to_display: {display_s * 1000:.1f} ms (round trip verified)")
+
+
+if __name__ == "__main__":
+    main()
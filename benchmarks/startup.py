@@ -0,0 +1,128 @@
+"""
+Avvio a freddo e primo rendering dell'app.
+
+Ogni misura gira in un interprete nuovo (come al riavvio del container):
+- profilo degli import (python -X importtime) del percorso di accesso
+  (app, info, login) e di tutte le pagine, con i pacchetti più costosi;
+- avvio a freddo: dall'avvio dell'interprete al primo rendering di app.py
+  (pagina Info) con AppTest, e apertura della pagina di upload (import del
+  modulo della pagina) subito dopo:
+  * eager: tutte le pagine importate prima del primo rendering (com'era app.py);
+  * lazy: pagine importate al primo utilizzo, senza warm-up;
+  * lazy + warm-up: come lazy, con il precaricamento in background
+    (upload aperta dopo la fine del warm-up).
+
+Uso (dalla root del progetto):
+    python -m benchmarks.startup [--repeat 3] [--top 12]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from src.utils.config import ensure_data_dirs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOGIN_PATH = ["src.utils.startup", "src.utils.auth", "src.utils.metrics", "pages.info_page", "pages.login_page"]
+ALL_PAGES = LOGIN_PATH + [f"pages.{name}" for name in (
+    "registration_page", "profile_page", "upload_forecast_page", "view_forecast_page",
+    "demand_page", "user_list_page", "logout_page",
+)]
+
+_CHILD = r"""
+import importlib, json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_s = time.perf_counter() - start
+if {eager}:
+    for module in {pages}:
+        importlib.import_module(module)
+at = AppTest.from_file("src/app.py", default_timeout=120)
+render_start = time.perf_counter()
+at.run()
+first_render_s = time.perf_counter() - render_start
+ready_s = time.perf_counter() - start
+from src.utils.startup import warmup_status
+if {wait_warmup}:
+    while not warmup_status()["done"] and time.perf_counter() - start < 60:
+        time.sleep(0.05)
+open_start = time.perf_counter()
+importlib.import_module("pages.upload_forecast_page")
+upload_open_s = time.perf_counter() - open_start
+print(json.dumps({{"streamlit_s": streamlit_s, "first_render_s": first_render_s, "ready_s": ready_s,
+                  "upload_open_s": upload_open_s, "errors": len(at.exception)}}))
+"""
+
+
+def _env(**extra):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "src")]), APP_LOG_LEVEL="WARNING")
+    env.update(extra)
+    return env
+
+
+def import_profile(modules, top):
+    """
+    (totale in secondi, [(pacchetto, secondi)]) dai tempi di python -X importtime:
+    tempo proprio dei moduli sommato per pacchetto, escluso quanto importa già streamlit.
+    """
+    def by_package(code):
+        stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                cwd=ROOT, env=_env(), capture_output=True, text=True).stderr
+        packages = {}
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            self_us, _, name = line[len("import time:"):].split("|")
+            if not self_us.strip().isdigit():
+                continue  # intestazione
+            package = name.strip().split(".")[0]
+            package = "app (src, pages)" if package in ("src", "pages") else package
+            packages[package] = packages.get(package, 0) + int(self_us) / 1e6
+        return packages
+
+    baseline = by_package("import streamlit")
+    profile = by_package("import streamlit\n" + "\n".join(f"import {module}" for module in modules))
+    packages = {name: seconds - baseline.get(name, 0) for name, seconds in profile.items()}
+    ranked = sorted(((name, seconds) for name, seconds in packages.items() if seconds > 0.0005), key=lambda item: -item[1])
+    return sum(seconds for _, seconds in ranked), ranked[:top]
+
+
+def cold_start(eager, warmup, repeat):
+    runs = []
+    for _ in range(repeat):
+        code = _CHILD.format(eager=eager, pages=ALL_PAGES, wait_warmup=warmup)
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                                env=_env(STARTUP_WARMUP="true" if warmup else "false"))
+        lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+        if not lines:
+            raise RuntimeError(f"Cold start run failed:\n{result.stderr[-2000:]}")
+        runs.append(json.loads(lines[-1]))
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app cold start and first render")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per scenario (median is kept)")
+    parser.add_argument("--top", type=int, default=12, help="Packages listed in the import profile")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    for label, modules in (("login path", LOGIN_PATH), ("all pages", ALL_PAGES)):
+        total, ranked = import_profile(modules, args.top)
+        print(f"Import profile - {label}: {total * 1000:.0f} ms on top of streamlit")
+        for name, seconds in ranked:
+            print(f"  {name:<40} {seconds * 1000:>8.1f} ms")
+        print()
+
+    print(f"{'scenario':<16} {'to first render':>16} {'first render':>13} {'open upload':>12}")
+    for label, eager, warmup in (("eager", True, False), ("lazy", False, False), ("lazy + warm-up", False, True)):
+        result = cold_start(eager, warmup, args.repeat)
+        print(f"{label:<16} {result['ready_s'] * 1000:>14.0f}ms {result['first_render_s'] * 1000:>11.0f}ms "
+              f"{result['upload_open_s'] * 1000:>10.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
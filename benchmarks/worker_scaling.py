@@ -0,0 +1,135 @@
+"""
+Throughput dell'app con più worker (run.py --workers) rispetto a un solo processo.
+
+Ogni "pianificatore" ripete il ciclo di lavoro di una sessione di upload:
+analisi della stampa (parse_edi_bytes), salvataggio (save_forecast: backup,
+forecast, revisione, catalogo, con i lock), export Excel e rilettura del
+forecast. Per ogni numero di pianificatori concorrenti N si confrontano:
+- 1 processo con N thread: un solo processo Streamlit servito a tutti (GIL);
+- N processi con 1 thread: N worker che condividono la directory dei dati.
+
+Tutti i processi lavorano su una directory dei dati temporanea (EDI_DATA_DIR),
+con un cliente per pianificatore, come più utenti su clienti diversi: la
+contesa resta sui database condivisi (catalogo, backup) e sui lock.
+I moduli vengono importati prima della misura, come in un worker già avviato.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.worker_scaling --planners 1 2 4 --duration 20
+    python -m benchmarks.worker_scaling --rows 20000 --data-dir /mnt/shared/bench
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+OPS = ("parse", "save", "export", "read")
+
+
+def _planner(planner, args, go, samples):
+    """Ciclo di lavoro di un pianificatore fino allo scadere della durata."""
+    from src.edi.synthetic import synthetic_print
+    from src.edi.parser import parse_edi_bytes
+    from src.edi.pipeline import save_forecast
+    from src.edi.schema import to_display
+    from src.utils.config import EXPORT_DIR, OUTPUT_DIR
+    from src.utils.export_worker import export_frame
+    from src.utils.forecast_store import read_forecast
+
+    prints = [synthetic_print(args.rows, seed=planner * 100 + i) for i in range(args.files)]
+    go.wait()
+    deadline = time.perf_counter() + args.duration
+    cycle = 0
+    while time.perf_counter() < deadline:
+        content = prints[cycle % args.files]
+        timings = {}
+
+        start = time.perf_counter()
+        df = parse_edi_bytes(content)
+        timings["parse"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = save_forecast(f"SCALE{planner}", f"scale_{planner}_{cycle % args.files}.txt",
+                               content.decode("utf-8"), df)
+        timings["save"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        export_frame(to_display(df), os.path.join(EXPORT_DIR, f"scale_{planner}.xlsx"), "xlsx")
+        timings["export"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        read_forecast(os.path.join(OUTPUT_DIR, result["json_filename"]))
+        timings["read"] = time.perf_counter() - start
+
+        samples.append(timings)
+        cycle += 1
+
+
+def _process(planners, args, ready, go, results):
+    """Un processo (worker) con un thread per pianificatore."""
+    from src.utils.config import ensure_data_dirs
+
+    ensure_data_dirs()
+    samples = []
+    threads = [threading.Thread(target=_planner, args=(planner, args, go, samples)) for planner in planners]
+    for thread in threads:
+        thread.start()
+    ready.release()
+    for thread in threads:
+        thread.join()
+    results.put(samples)
+
+
+def run(planners, processes, args):
+    """Cicli completati da `planners` pianificatori su `processes` processi."""
+    ctx = multiprocessing.get_context("spawn")
+    ready, go, results = ctx.Semaphore(0), ctx.Event(), ctx.Queue()
+    groups = [list(range(planners))[i::processes] for i in range(processes)]
+    workers = [ctx.Process(target=_process, args=(group, args, ready, go, results)) for group in groups]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.acquire()
+    time.sleep(0.5)  # i thread hanno preparato le stampe e attendono il via
+    go.set()
+    samples = [sample for _ in workers for sample in results.get()]
+    for worker in workers:
+        worker.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput with one process vs several workers")
+    parser.add_argument("--planners", type=int, nargs="+", default=[1, 2, 4], help="Concurrent planners")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per scenario")
+    parser.add_argument("--rows", type=int, default=5_000, help="Rows per synthetic print")
+    parser.add_argument("--files", type=int, default=2, help="Distinct prints (original files) per planner")
+    parser.add_argument("--data-dir", help="Data directory (default: a temporary directory, removed at the end)")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="edi_scaling_")
+    os.environ["EDI_DATA_DIR"] = data_dir
+    os.environ.setdefault("APP_LOG_LEVEL", "WARNING")
+    print(f"{os.cpu_count()} CPUs, data directory {data_dir}, {args.rows} rows per print, {args.duration:g}s per scenario")
+    print(f"{'planners':>8} {'mode':<22} {'cycles/s':>9} {'speedup':>8} " + " ".join(f"{op + ' p50':>11}" for op in OPS))
+    try:
+        baseline = None
+        for planners in args.planners:
+            scenarios = [(f"1 process x {planners} threads", 1)] + ([(f"{planners} workers", planners)] if planners > 1 else [])
+            for label, processes in scenarios:
+                samples = run(planners, processes, args)
+                throughput = len(samples) / args.duration
+                baseline = baseline or throughput
+                medians = " ".join(f"{statistics.median(s[op] for s in samples) * 1000:>9.0f}ms" if samples else f"{'-':>11}"
+                                   for op in OPS)
+                print(f"{planners:>8} {label:<22} {throughput:>9.2f} {throughput / baseline:>7.2f}x {medians}")
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,128 @@
 # run.py
 """
 Script di lancio per l'applicazione EDI_FORECAST
-Uso: python run.py
+Uso: python run.py [--workers N] [--port 8501]
+
+Con più worker (--workers o WORKERS nell'ambiente) vengono avviati N processi
+Streamlit sulle porte port, port+1, ..., port+N-1: il parsing e gli export
+Excel di utenti diversi girano così su core diversi. Il reverse proxy deve
+distribuire le sessioni con sessioni sticky (stessa sessione -> stesso
+worker): lo stato di una sessione e i dati dell'upload in corso vivono nel
+processo che l'ha aperta. I worker condividono la directory dei dati
+(EDI_DATA_DIR), coordinati dai lock su file e dai database SQLite.
+
+Un worker che termina viene riavviato, con attesa crescente (1, 2, 4, ... s)
+se termina subito dopo l'avvio; dopo WORKER_MAX_RESTARTS (default 5) uscite ravvicinate
+dello stesso worker il launcher ferma tutto ed esce con errore (porta occupata,
+errore di import...). SIGTERM/CTRL+C fermano tutti i worker.
+Con METRICS_PORT impostata ogni worker espone /metrics su METRICS_PORT + indice.
 """
+import argparse
+import signal
 import subprocess
 import sys
 import os
+import time
+
+# Riavvii dei worker: uscite entro STABLE_SECONDS dall'avvio contano come fallite
+MAX_RESTARTS = int(os.getenv("WORKER_MAX_RESTARTS", "5"))
+STABLE_SECONDS = 60
+MAX_BACKOFF_SECONDS = 60
+
+
+def streamlit_command(port, server_address, headless=False):
+    command = [
+        sys.executable, "-m", "streamlit", "run",
+        "src/app.py",
+        f"--server.port={port}",
+        f"--server.address={server_address}"
+    ]
+    if headless:
+        command.append("--server.headless=true")
+    return command
+
+
+def worker_env(index):
+    """Ambiente del worker `index`: porta delle metriche distinta per ogni processo."""
+    env = dict(os.environ, EDI_WORKER_ID=str(index))
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if metrics_port:
+        env["METRICS_PORT"] = str(metrics_port + index)
+    return env
+
+
+def run_workers(workers, base_port, server_address):
+    """
+    Avvia e sorveglia `workers` processi Streamlit sulle porte consecutive da `base_port`.
+    Ritorna il codice di uscita del launcher (1 se un worker non riesce a restare attivo).
+    """
+    processes = {}
+    started_at = {}
+    failures = {index: 0 for index in range(workers)}
+    restart_at = {}
+    stopping = False
+    exit_code = 0
+
+    def start(index):
+        port = base_port + index
+        processes[index] = subprocess.Popen(streamlit_command(port, server_address, headless=True),
+                                            env=worker_env(index))
+        started_at[index] = time.monotonic()
+        print(f"Worker {index} started on port {port} (pid {processes[index].pid})", flush=True)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        start(index)
+    while not stopping:
+        time.sleep(1)
+        now = time.monotonic()
+        for index, process in list(processes.items()):
+            if stopping or index in restart_at or process.poll() is None:
+                continue
+            failures[index] = failures[index] + 1 if now - started_at[index] < STABLE_SECONDS else 0
+            if failures[index] > MAX_RESTARTS:
+                print(f"Worker {index} exited with code {process.returncode} {failures[index]} times in a row, "
+                      f"stopping", flush=True)
+                stopping, exit_code = True, 1
+                break
+            delay = min(2 ** (failures[index] - 1), MAX_BACKOFF_SECONDS) if failures[index] else 0
+            print(f"Worker {index} exited with code {process.returncode}, restarting in {delay}s", flush=True)
+            restart_at[index] = now + delay
+        for index, when in list(restart_at.items()):
+            if not stopping and now >= when:
+                del restart_at[index]
+                start(index)
+
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        try:
+            process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return exit_code
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the EDI Forecast app")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", "1")),
+                        help="Streamlit processes on consecutive ports (default: WORKERS or 1)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("STREAMLIT_SERVER_PORT", "8501")),
+                        help="Port of the first worker (default: 8501)")
+    args = parser.parse_args()
+
     # Rileva se siamo in un container Docker
     in_docker = os.path.exists('/.dockerenv') or os.getenv('DOCKER_CONTAINER') == 'true'
-    
+
     # Configura l'indirizzo in base all'ambiente
     server_address = "0.0.0.0" if in_docker else "localhost"
-    
-    subprocess.run([
-        sys.executable, "-m", "streamlit", "run", 
-        "src/app.py",
-        "--server.port=8501",
-        f"--server.address={server_address}"
-    ])
\ No newline at end of file
+
+    if args.workers > 1:
+        sys.exit(run_workers(args.workers, args.port, server_address))
+    else:
+        subprocess.run(streamlit_command(args.port, server_address))
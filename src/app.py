@@ -1,22 +1,23 @@
 import streamlit as st
 import base64
+import importlib
 from pathlib import Path
 import os
 
 
 from src.utils.auth import get_user_data
 from src.utils.config import APP_NAME, APP_VERSION
+from src.utils.metrics import timer
+from src.utils.startup import on_startup
+
+
+def lazy_page(module_name):
+    """Funzione della pagina che importa il modulo (pages.<module_name>) solo quando la pagina viene aperta."""
+    def run():
+        importlib.import_module(f"pages.{module_name}").page()
+    run.__name__ = module_name
+    return run
 
-from pages import (
-    info_page,
-    registration_page,
-    login_page,
-    profile_page,
-    upload_forecast_page,
-    view_forecast_page,
-    logout_page,
-    user_list_page
-)
 
 # ──────────────────────────────────────────────
 # App configuration
@@ -30,6 +31,10 @@ st.session_state.setdefault("logged_in", False)
 st.session_state.setdefault("user_email", None)
 st.session_state.setdefault("admin_editing_user", None)
 
+# Avvio del processo (una sola volta): directory dei dati, coda di invio email/notifiche
+# (rimette in coda i messaggi rimasti nell'outbox), metriche e precaricamento delle pagine
+on_startup()
+
 # ──────────────────────────────────────────────
 # Sidebar logo
 # ──────────────────────────────────────────────
@@ -55,14 +60,15 @@ st.markdown(
 # ──────────────────────────────────────────────
 # Define pages
 # ──────────────────────────────────────────────
-info = st.Page(info_page.page, title="Info", icon="ℹ️", url_path="/info")
-registration = st.Page(registration_page.page, title="Register", icon="🧾", url_path="/register")
-login = st.Page(login_page.page, title="Login", icon="🔐", url_path="/login")
-profile = st.Page(profile_page.page, title="Profile", icon="👤", url_path="/profile")
-upload_forecast = st.Page(upload_forecast_page.page, title="Upload Forecast", icon="🎯", url_path="/upload_forecast")
-view_forecast = st.Page(view_forecast_page.page, title="View Forecast", icon="📊", url_path="/view_forecast")
-user_list = st.Page(user_list_page.page, title="User List", icon="👥", url_path="/user_list")
-logout = st.Page(logout_page.page, title="Logout", icon="🚪", url_path="/logout")
+info = st.Page(lazy_page("info_page"), title="Info", icon="ℹ️", url_path="/info")
+registration = st.Page(lazy_page("registration_page"), title="Register", icon="🧾", url_path="/register")
+login = st.Page(lazy_page("login_page"), title="Login", icon="🔐", url_path="/login")
+profile = st.Page(lazy_page("profile_page"), title="Profile", icon="👤", url_path="/profile")
+upload_forecast = st.Page(lazy_page("upload_forecast_page"), title="Upload Forecast", icon="🎯", url_path="/upload_forecast")
+view_forecast = st.Page(lazy_page("view_forecast_page"), title="View Forecast", icon="📊", url_path="/view_forecast")
+demand = st.Page(lazy_page("demand_page"), title="Demand", icon="📈", url_path="/demand")
+user_list = st.Page(lazy_page("user_list_page"), title="User List", icon="👥", url_path="/user_list")
+logout = st.Page(lazy_page("logout_page"), title="Logout", icon="🚪", url_path="/logout")
 
 # ──────────────────────────────────────────────
 # Navigation logic basata sul ruolo
@@ -79,10 +85,10 @@ else:
     account_pages = [profile, logout]
     if user_role == "admin_role":
         # Menu per admin
-        menu_pages = [info, upload_forecast, view_forecast, user_list]
+        menu_pages = [info, upload_forecast, view_forecast, demand, user_list]
     else:
         # Menu per sales_user (default)
-        menu_pages = [info, upload_forecast, view_forecast]
+        menu_pages = [info, upload_forecast, view_forecast, demand]
 
 
 # ──────────────────────────────────────────────
@@ -124,4 +130,6 @@ if st.session_state.get("logged_in") and st.session_state.get("user_email"):
             unsafe_allow_html=True,
         )
 
-nav.run()
\ No newline at end of file
+# Tempo di rendering della pagina (per pagina)
+with timer("page_render_seconds", page=nav.title):
+    nav.run()
\ No newline at end of file
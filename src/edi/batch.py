@@ -0,0 +1,178 @@
+"""
+Analisi in parallelo di più file EDI (upload multiplo o archivio zip).
+
+I file vengono analizzati con parse_edi_bytes in un pool di processi, così
+un lotto di decine di stampe sfrutta tutti i core invece di un solo thread
+dello script Streamlit. Il pool (contesto "spawn", sicuro anche da un
+processo con thread come Streamlit) viene creato al primo utilizzo e
+riutilizzato; i lotti piccoli vengono analizzati direttamente nel processo
+corrente, dove l'avvio dei worker costerebbe più dell'analisi stessa.
+
+Per ogni file si ottiene un esito con righe, errori di validazione e tempi;
+il DataFrame è già nella forma compatta di src.edi.schema (meno memoria nei
+risultati tenuti in sessione e meno dati da trasferire dai worker).
+"""
+import io
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.edi.parser import parse_edi_bytes, EDIParseError
+from src.edi.schema import to_compact
+from src.utils.config import PARSE_WORKERS, PARSE_POOL_MIN_BYTES, ZIP_MAX_MEMBER_MB, ZIP_MAX_TOTAL_MB
+from src.utils.logger import setup_logger
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("edi_batch")
+
+EDI_EXTENSIONS = (".txt", ".csv")
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            _pool.shutdown(wait=True)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _zip_members(archive):
+    """File EDI dell'archivio (cartelle e file nascosti esclusi)."""
+    for info in archive.infolist():
+        member = os.path.basename(info.filename)
+        if (info.is_dir() or not member or member.startswith((".", "__"))
+                or "__MACOSX" in info.filename or not member.lower().endswith(EDI_EXTENSIONS)):
+            continue
+        yield member, info
+
+
+def _check_zip_size(members):
+    """Messaggio d'errore se l'archivio supera ZIP_MAX_MEMBER_MB / ZIP_MAX_TOTAL_MB, altrimenti None."""
+    # file_size è la dimensione dichiarata: zipfile non decomprime oltre (e verifica il CRC)
+    for member, info in members:
+        if info.file_size > ZIP_MAX_MEMBER_MB * (1 << 20):
+            return (f"{member} is {info.file_size / (1 << 20):,.1f} MB uncompressed, "
+                    f"above the {ZIP_MAX_MEMBER_MB:g} MB limit per file.")
+    total = sum(info.file_size for _, info in members)
+    if total > ZIP_MAX_TOTAL_MB * (1 << 20):
+        return (f"The archive is {total / (1 << 20):,.1f} MB uncompressed, "
+                f"above the {ZIP_MAX_TOTAL_MB:g} MB limit.")
+    return None
+
+
+def expand_uploads(files) -> tuple[list[tuple[str, bytes]], list[dict]]:
+    """
+    Espande l'elenco dei file caricati [(nome, bytes)]: gli archivi .zip sono
+    sostituiti dai file .txt/.csv che contengono (cartelle e file nascosti esclusi).
+    Un archivio non valido o che supera i limiti di dimensione non viene letto.
+
+    Returns:
+        tuple: (file espansi [(nome, bytes)], esiti con errore degli archivi scartati, come parse_many)
+    """
+    expanded, rejected = [], []
+    for name, data in files:
+        if not name.lower().endswith(".zip"):
+            expanded.append((name, data))
+            continue
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                members = list(_zip_members(archive))
+                error = _check_zip_size(members)
+                if error is None:
+                    expanded.extend((member, archive.read(info)) for member, info in members)
+        except zipfile.BadZipFile as e:
+            error = f"Error reading zip archive: {e}"
+        if error is not None:
+            logger.warning(f"Zip archive {name} rejected: {error}")
+            rejected.append({**_result(name, data), "error": error})
+    return expanded, rejected
+
+
+def _parse_job(data):
+    """Eseguito nel worker: (DataFrame compatto, secondi di analisi)."""
+    start = time.perf_counter()
+    df = to_compact(parse_edi_bytes(data))
+    return df, time.perf_counter() - start
+
+
+def _result(name, data):
+    return {"name": name, "bytes": len(data), "ok": False, "error": None,
+            "df": None, "rows": 0, "parse_s": 0.0}
+
+
+def _collect(result, run):
+    """(result, (df, secondi) o None, errore o None); BrokenProcessPool viene propagato."""
+    try:
+        return result, run(), None
+    except BrokenProcessPool:
+        raise
+    except Exception as e:
+        return result, None, e
+
+
+def parse_many(files, workers=None) -> list[dict]:
+    """
+    Analizza i file [(nome, bytes)] e restituisce un esito per file, nello stesso ordine:
+    {"name", "bytes", "ok", "error", "df", "rows", "parse_s"}.
+    `workers` indica i processi del pool (default PARSE_WORKERS).
+
+    I file non UTF-8 o non validi (EDIParseError) vengono segnalati nell'esito
+    senza interrompere il lotto.
+    """
+    results = [_result(name, data) for name, data in files]
+    jobs = []
+    for result, (_, data) in zip(results, files):
+        try:
+            data.decode("utf-8")
+        except UnicodeDecodeError:
+            result["error"] = "The file is not UTF-8 encoded text."
+            continue
+        jobs.append((result, data))
+
+    total_bytes = sum(len(data) for _, data in jobs)
+    workers = workers or PARSE_WORKERS
+    use_pool = len(jobs) > 1 and total_bytes >= PARSE_POOL_MIN_BYTES and workers > 1
+
+    outcomes = None
+    if use_pool:
+        try:
+            futures = [(result, _get_pool(workers).submit(_parse_job, data)) for result, data in jobs]
+            outcomes = [_collect(result, future.result) for result, future in futures]
+        except BrokenProcessPool as e:
+            # Un worker è terminato in modo anomalo: si ricrea il pool al prossimo lotto
+            logger.warning(f"Parse pool broken, parsing batch in-process: {e}")
+            _reset_pool()
+            outcomes = None
+    if outcomes is None:
+        outcomes = [_collect(result, lambda data=data: _parse_job(data)) for result, data in jobs]
+
+    for result, outcome, error in outcomes:
+        if error is not None:
+            result["error"] = str(error) if isinstance(error, EDIParseError) else f"Error reading file: {error}"
+            continue
+        df, elapsed = outcome
+        result.update(ok=True, df=df, rows=len(df), parse_s=elapsed)
+    return results
@@ -0,0 +1,71 @@
+"""
+Aggregazione della domanda: QUANTITA totale per articolo (COD. ART) e settimana ISO.
+
+Le colonne QUANTITA ('1040,00') e CONSEGNA ('26.05.2025') vengono convertite
+una sola volta in valori tipizzati (float e data) e aggregate con una groupby
+vettoriale. Il risultato per singolo forecast è il "rollup" salvato nel
+catalogo dei forecast (forecast_index) ad ogni salvataggio o eliminazione,
+così la domanda complessiva di un cliente si ottiene con una sola query
+aggregata, senza rileggere i file.
+"""
+from datetime import date
+
+import pandas as pd
+
+from src.edi.diff import quantity_to_float, QUANTITY_COLUMN
+from src.edi.schema import DATE_COLUMN, DATE_FORMAT
+
+ARTICLE_COLUMN = "COD. ART"
+
+ROLLUP_COLUMNS = ["article", "week", "quantity", "rows"]
+
+
+def week_key(values: pd.Series) -> pd.Series:
+    """Date -> settimana ISO 'YYYY-Www' (ordinabile come stringa)."""
+    iso = values.dt.isocalendar()
+    return iso["year"].astype(str) + "-W" + iso["week"].astype(str).str.zfill(2)
+
+
+def week_start(week: str) -> date:
+    """'2025-W22' -> lunedì della settimana."""
+    year, number = week.split("-W")
+    return date.fromisocalendar(int(year), int(number), 1)
+
+
+def weekly_demand(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rollup di un forecast: una riga per (articolo, settimana ISO di consegna)
+    con QUANTITA totale e numero di righe. Le righe senza articolo, quantità
+    o data di consegna valide sono escluse.
+    """
+    if df is None or df.empty or not {ARTICLE_COLUMN, DATE_COLUMN, QUANTITY_COLUMN} <= set(df.columns):
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+    frame = pd.DataFrame({
+        "article": df[ARTICLE_COLUMN].astype("string").str.strip(),
+        "delivery": pd.to_datetime(df[DATE_COLUMN].astype("string").str.strip(), format=DATE_FORMAT, errors="coerce"),
+        "quantity": quantity_to_float(df[QUANTITY_COLUMN]),
+    })
+    frame = frame[frame["article"].fillna("").ne("") & frame["delivery"].notna() & frame["quantity"].notna()]
+    if frame.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+    frame["week"] = week_key(frame["delivery"])
+    rollup = frame.groupby(["article", "week"], sort=True).agg(
+        quantity=("quantity", "sum"), rows=("quantity", "size")
+    ).reset_index()
+    rollup["article"] = rollup["article"].astype(str)
+    rollup["quantity"] = rollup["quantity"].round(2)
+    return rollup[ROLLUP_COLUMNS]
+
+
+def demand_pivot(demand: pd.DataFrame) -> pd.DataFrame:
+    """Tabella articoli x settimane (QUANTITA), con totale per articolo."""
+    if demand.empty:
+        return pd.DataFrame()
+    pivot = demand.pivot_table(index="article", columns="week", values="quantity", aggfunc="sum", fill_value=0)
+    pivot = pivot.reindex(columns=sorted(pivot.columns))
+    pivot["Total"] = pivot.sum(axis=1)
+    pivot.index.name = ARTICLE_COLUMN
+    pivot.columns.name = None
+    return pivot.round(2)
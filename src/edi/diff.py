@@ -0,0 +1,186 @@
+"""
+Confronto tra due versioni dello stesso forecast EDI (upload successivi dello stesso file).
+
+Le righe sono identificate dalla chiave (COD. ART, CONSEGNA, ORD.HYD); le chiavi
+ripetute nello stesso file sono distinte dal numero di occorrenza (cumcount),
+così ogni riga ha un'identità univoca. Il confronto è un'unica merge pandas
+vettoriale e restituisce righe aggiunte, rimosse e modificate (con la
+variazione di QUANTITA).
+
+Il risultato può essere ridotto a un delta serializzabile (to_delta) e
+riapplicato alla versione precedente (apply_delta) ottenendo esattamente la
+nuova versione, ordine delle righe compreso: è il formato usato dallo storico
+delle revisioni.
+"""
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["COD. ART", "CONSEGNA", "ORD.HYD"]
+QUANTITY_COLUMN = "QUANTITA"
+
+_OCC = "_occ"
+_POS = "_pos"
+
+
+def quantity_to_float(values: pd.Series) -> pd.Series:
+    """'1040,50' -> 1040.5; valori non numerici -> NaN."""
+    text = values.astype("string").str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(text, errors="coerce")
+
+
+def _prepare(df, columns):
+    """Valori stringa, colonne allineate, occorrenza della chiave e posizione della riga."""
+    frame = df.reset_index(drop=True).reindex(columns=columns).astype(object)
+    frame = frame.where(frame.notna(), "").astype(str)
+    frame[_OCC] = frame.groupby(KEY_COLUMNS, sort=False).cumcount()
+    frame[_POS] = np.arange(len(frame))
+    return frame
+
+
+def diff_forecasts(old_df: pd.DataFrame, new_df: pd.DataFrame) -> dict:
+    """
+    Confronta due versioni di un forecast.
+
+    Returns:
+        dict: {
+            "added":     righe nuove (colonne della nuova versione),
+            "removed":   righe non più presenti (colonne della versione precedente),
+            "changed":   righe modificate: chiave, QUANTITA_OLD, QUANTITA_NEW, DELTA e
+                         gli altri valori nuovi,
+            "unchanged": numero di righe identiche,
+            "columns":   colonne della nuova versione,
+            "_merged":   merge completa (uso interno per to_delta)
+        }
+    """
+    columns = list(new_df.columns)
+    for column in list(old_df.columns):
+        if column not in columns:
+            columns.append(column)
+    missing_keys = [k for k in KEY_COLUMNS if k not in columns]
+    if missing_keys:
+        raise ValueError(f"Missing key columns: {missing_keys}")
+    value_columns = [c for c in columns if c not in KEY_COLUMNS]
+
+    old = _prepare(old_df, columns)
+    new = _prepare(new_df, columns)
+    merged = old.merge(new, on=KEY_COLUMNS + [_OCC], how="outer", suffixes=("_old", "_new"), indicator=True)
+
+    both = merged["_merge"] == "both"
+    differs = np.zeros(len(merged), dtype=bool)
+    for column in value_columns:
+        differs |= (merged[f"{column}_old"] != merged[f"{column}_new"]).to_numpy()
+    changed_mask = both & differs
+    merged["_changed"] = changed_mask
+
+    def side(mask, suffix):
+        part = merged.loc[mask].sort_values(f"{_POS}{suffix}")
+        out = part[KEY_COLUMNS].copy()
+        for column in value_columns:
+            out[column] = part[f"{column}{suffix}"]
+        return out[[c for c in columns if c in out.columns]].reset_index(drop=True)
+
+    changed = merged.loc[changed_mask].sort_values(f"{_POS}_new")
+    changes = changed[KEY_COLUMNS].copy()
+    if QUANTITY_COLUMN in value_columns:
+        changes[f"{QUANTITY_COLUMN}_OLD"] = changed[f"{QUANTITY_COLUMN}_old"]
+        changes[f"{QUANTITY_COLUMN}_NEW"] = changed[f"{QUANTITY_COLUMN}_new"]
+        changes["DELTA"] = (quantity_to_float(changed[f"{QUANTITY_COLUMN}_new"])
+                            - quantity_to_float(changed[f"{QUANTITY_COLUMN}_old"])).round(2)
+    for column in value_columns:
+        if column != QUANTITY_COLUMN:
+            changes[column] = changed[f"{column}_new"]
+
+    return {
+        "added": side(merged["_merge"] == "right_only", "_new"),
+        "removed": side(merged["_merge"] == "left_only", "_old"),
+        "changed": changes.reset_index(drop=True),
+        "unchanged": int((both & ~differs).sum()),
+        "columns": list(new_df.columns),
+        "_merged": merged,
+    }
+
+
+def has_changes(diff) -> bool:
+    return bool(len(diff["added"]) or len(diff["removed"]) or len(diff["changed"]))
+
+
+def summarize(diff) -> dict:
+    """Conteggi del confronto e variazione netta di QUANTITA."""
+    net = 0.0
+    if len(diff["added"]) and QUANTITY_COLUMN in diff["added"]:
+        net += quantity_to_float(diff["added"][QUANTITY_COLUMN]).sum()
+    if len(diff["removed"]) and QUANTITY_COLUMN in diff["removed"]:
+        net -= quantity_to_float(diff["removed"][QUANTITY_COLUMN]).sum()
+    if len(diff["changed"]) and "DELTA" in diff["changed"]:
+        net += diff["changed"]["DELTA"].sum()
+    return {
+        "added": len(diff["added"]),
+        "removed": len(diff["removed"]),
+        "changed": len(diff["changed"]),
+        "unchanged": diff["unchanged"],
+        "quantity_delta": round(float(net), 2),
+    }
+
+
+# -----------------------------
+# DELTA SERIALIZZABILE
+# -----------------------------
+def to_delta(diff) -> dict:
+    """
+    Riduce il confronto alle sole informazioni necessarie per ricostruire la
+    nuova versione dalla precedente (valori JSON puri):
+    righe rimosse (solo chiave), righe aggiunte e modificate (valori nuovi) e,
+    se necessario, il nuovo ordine delle righe.
+    """
+    merged = diff["_merged"]
+    columns = diff["columns"]
+    value_columns = [c for c in columns if c not in KEY_COLUMNS]
+    kind = merged["_merge"]
+
+    def rows(mask):
+        part = merged.loc[mask].sort_values(f"{_POS}_new")
+        out = part[KEY_COLUMNS + [_OCC]].copy()
+        for column in value_columns:
+            out[column] = part[f"{column}_new"]
+        return out[columns + [_OCC]].to_dict(orient="records")
+
+    removed = merged.loc[kind == "left_only", KEY_COLUMNS + [_OCC]].to_dict(orient="records")
+
+    # Ordine "naturale" di apply_delta: righe mantenute nell'ordine precedente, poi le aggiunte
+    kept = merged.loc[kind == "both"].sort_values(f"{_POS}_old")
+    added = merged.loc[kind == "right_only"].sort_values(f"{_POS}_new")
+    natural = np.concatenate([kept[f"{_POS}_new"].to_numpy(), added[f"{_POS}_new"].to_numpy()]).astype(int)
+    order = None if np.array_equal(natural, np.arange(len(natural))) else np.argsort(natural).tolist()
+
+    return {
+        "columns": columns,
+        "removed": removed,
+        "added": rows(kind == "right_only"),
+        "changed": rows(merged["_changed"]),
+        "order": order,
+    }
+
+
+def apply_delta(base_df: pd.DataFrame, delta: dict) -> pd.DataFrame:
+    """Applica un delta (to_delta) alla versione precedente e restituisce la nuova versione."""
+    columns = delta["columns"]
+    base = _prepare(base_df, columns).drop(columns=[_POS])
+    index_columns = KEY_COLUMNS + [_OCC]
+    base = base.set_index(index_columns)
+
+    if delta["removed"]:
+        removed = pd.DataFrame(delta["removed"]).astype({_OCC: int}).set_index(index_columns).index
+        base = base.drop(index=removed)
+
+    if delta["changed"]:
+        changed = pd.DataFrame(delta["changed"], columns=columns + [_OCC]).astype({_OCC: int}).set_index(index_columns)
+        base.loc[changed.index, changed.columns] = changed
+
+    result = base.reset_index()
+    if delta["added"]:
+        added = pd.DataFrame(delta["added"], columns=columns + [_OCC]).astype({_OCC: int})
+        result = pd.concat([result, added], ignore_index=True)
+
+    if delta.get("order") is not None:
+        result = result.iloc[delta["order"]]
+    return result[columns].reset_index(drop=True)
@@ -0,0 +1,199 @@
+"""
+Parser streaming per le stampe EDI "STAMPA PASSAGGIO ORDINI" delimitate da "!".
+
+Il file viene letto a blocchi di byte e spezzato in righe senza mai
+decodificarlo per intero; ogni lotto di righe viene poi trasformato in
+colonne pyarrow con operazioni vettoriali (split, trim, take), compresa la
+normalizzazione delle date CONSEGNA (formati a 8/7/6/5 cifre -> gg.mm.aaaa).
+
+Le regole sono le stesse del parser storico della pagina di upload:
+- le prime HEADER_LINES righe sono intestazione e vengono ignorate;
+- righe vuote o che iniziano con "-" / "+" sono separatori;
+- la prima e l'ultima colonna vuote (bordi "!") vengono scartate;
+- sono valide solo le righe con almeno 8 colonne, di cui si tengono le prime 8.
+"""
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+HEADERS = ["ORD.HYD", "COD.CLIENTE", "COD. ART", "DESCRIZIONE",
+           "OCLI GARE", "QUANTITA", "CONSEGNA", "ORD.VEN"]
+
+HEADER_LINES = 6
+MIN_LINES = HEADER_LINES + 1
+DELIMITER = "!"
+
+DEFAULT_CHUNK_SIZE = 1 << 20   # 1 MiB per lettura
+DEFAULT_BATCH_ROWS = 50_000    # righe per lotto vettoriale
+
+
+class EDIParseError(ValueError):
+    """File EDI non valido (troppo corto, senza righe dati o non UTF-8)."""
+
+
+# -----------------------------
+# LETTURA A BLOCCHI
+# -----------------------------
+def iter_file_chunks(fileobj, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Generatore di blocchi di byte da un file aperto in modalità binaria."""
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _iter_line_batches(chunks, batch_rows):
+    """
+    Spezza un flusso di blocchi di byte in lotti di righe (bytes, senza "\\n").
+    Come str.split("\\n"), l'ultima riga viene sempre restituita anche se vuota.
+    """
+    pending = b""
+    batch = []
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        batch.extend(lines)
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    batch.append(pending)
+    yield batch
+
+
+# -----------------------------
+# TRASFORMAZIONI VETTORIALI
+# -----------------------------
+def _join(*parts):
+    return pc.binary_join_element_wise(*parts, "")
+
+
+def normalize_consegna(values):
+    """
+    Normalizza le date CONSEGNA in formato gg.mm.aaaa, in modo vettoriale.
+
+    Dopo aver tenuto solo le cifre:
+        8 cifre  26052025 -> 26.05.2025
+        7 cifre   9122024 -> 09.12.2024
+        6 cifre    260525 -> 26.05.2025
+        5 cifre     91224 -> 09.12.2024
+    altrimenti viene restituita la sola sequenza di cifre.
+
+    Args:
+        values: pyarrow.Array/ChunkedArray di stringhe oppure pandas.Series
+
+    Returns:
+        Lo stesso tipo ricevuto in ingresso
+    """
+    if isinstance(values, pd.Series):
+        arr = pa.array(values.astype(str), type=pa.string())
+        return pd.Series(normalize_consegna(arr).to_pandas(), index=values.index, name=values.name)
+
+    digits = pc.replace_substring_regex(values, r"[^0-9]", "")
+    length = pc.utf8_length(digits)
+
+    def part(start, stop):
+        return pc.utf8_slice_codeunits(digits, start, stop)
+
+    as_8 = _join(part(0, 2), ".", part(2, 4), ".", part(4, 8))
+    as_7 = _join("0", part(0, 1), ".", part(1, 3), ".", part(3, 7))
+    as_6 = _join(part(0, 2), ".", part(2, 4), ".20", part(4, 6))
+    as_5 = _join("0", part(0, 1), ".", part(1, 3), ".20", part(3, 5))
+
+    conditions = pc.make_struct(
+        pc.equal(length, 8), pc.equal(length, 7), pc.equal(length, 6), pc.equal(length, 5),
+        field_names=["d8", "d7", "d6", "d5"],
+    )
+    return pc.case_when(conditions, as_8, as_7, as_6, as_5, digits)
+
+
+def _parse_lines(lines):
+    """Trasforma un lotto di righe (bytes) in una pyarrow.Table con le colonne HEADERS."""
+    try:
+        arr = pa.array(lines, type=pa.binary()).cast(pa.string())
+    except pa.ArrowInvalid as e:
+        raise EDIParseError(f"The file is not valid UTF-8 text: {e}") from e
+
+    # Scarta righe vuote e separatori "-" / "+"
+    stripped = pc.utf8_trim_whitespace(arr)
+    first_char = pc.utf8_slice_codeunits(stripped, 0, 1)
+    is_data = pc.and_(
+        pc.not_equal(stripped, ""),
+        pc.invert(pc.is_in(first_char, value_set=pa.array(["-", "+"]))),
+    )
+    arr = arr.filter(is_data)
+    if len(arr) == 0:
+        return None
+
+    parts = pc.split_pattern(arr, DELIMITER)
+    cells = pc.utf8_trim_whitespace(parts.flatten())
+    blank = pc.equal(cells, "").to_numpy(zero_copy_only=False)
+
+    offsets = parts.offsets.to_numpy()
+    offsets = offsets - offsets[0]
+    starts, ends = offsets[:-1], offsets[1:]
+
+    # Bordi "!": scarta la prima cella se vuota, poi l'ultima se vuota
+    begin = starts + blank[starts]
+    last = ends - 1
+    end = ends - (blank[last] & (last >= begin))
+
+    valid = (end - begin) >= len(HEADERS)
+    if not valid.any():
+        return None
+    begin = begin[valid]
+
+    columns = {
+        name: pc.take(cells, pa.array(begin + i, type=pa.int64()))
+        for i, name in enumerate(HEADERS)
+    }
+    columns["CONSEGNA"] = normalize_consegna(columns["CONSEGNA"])
+    return pa.table(columns)
+
+
+# -----------------------------
+# API PUBBLICA
+# -----------------------------
+def iter_tables(chunks, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Generatore di pyarrow.Table (colonne HEADERS, tutte stringhe) da un flusso di byte.
+
+    Solleva EDIParseError se il file ha meno di MIN_LINES righe o nessuna riga dati.
+    """
+    total_lines = 0
+    total_rows = 0
+    for lines in _iter_line_batches(chunks, batch_rows):
+        skip = max(0, HEADER_LINES - total_lines)
+        total_lines += len(lines)
+        table = _parse_lines(lines[skip:]) if skip < len(lines) else None
+        if table is not None and table.num_rows:
+            total_rows += table.num_rows
+            yield table
+
+    if total_lines < MIN_LINES:
+        raise EDIParseError("The file does not contain enough data.")
+    if total_rows == 0:
+        raise EDIParseError("No data rows found in the file.")
+
+
+def iter_batches(chunks, batch_rows=DEFAULT_BATCH_ROWS):
+    """Come iter_tables, ma restituisce lotti pandas.DataFrame."""
+    for table in iter_tables(chunks, batch_rows):
+        yield table.to_pandas()
+
+
+def parse_edi_bytes(data, chunk_size=DEFAULT_CHUNK_SIZE, batch_rows=DEFAULT_BATCH_ROWS) -> pd.DataFrame:
+    """Analizza un intero file EDI già in memoria e restituisce un DataFrame con le colonne HEADERS."""
+    view = memoryview(data)
+    chunks = (bytes(view[i:i + chunk_size]) for i in range(0, len(view), chunk_size))
+    tables = list(iter_tables(chunks, batch_rows))
+    return pa.concat_tables(tables).to_pandas()
+
+
+def parse_edi_file(path, chunk_size=DEFAULT_CHUNK_SIZE, batch_rows=DEFAULT_BATCH_ROWS) -> pd.DataFrame:
+    """Analizza un file EDI da disco leggendolo a blocchi."""
+    with open(path, "rb") as f:
+        tables = list(iter_tables(iter_file_chunks(f, chunk_size), batch_rows))
+    return pa.concat_tables(tables).to_pandas()
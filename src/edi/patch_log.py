@@ -0,0 +1,184 @@
+"""
+Modifiche del data editor come registro di patch sul forecast caricato.
+
+Il data editor della pagina di upload mostra una pagina (finestra) di righe
+alla volta. Le modifiche non sostituiscono il DataFrame caricato, che resta
+invariato: vengono registrate per etichetta di riga (celle modificate, righe
+aggiunte, righe eliminate) e il DataFrame completo viene ricostruito solo al
+salvataggio (materialize). Ogni modifica costa quanto la pagina mostrata,
+non quanto l'intero forecast.
+
+Lo stato del data editor (edited_rows / added_rows / deleted_rows) è
+cumulativo per tutta la vita del widget e relativo ai dati ricevuti: le
+modifiche del widget corrente vengono quindi "preparate" (stage) ad ogni
+rerun e consolidate nel registro solo quando si passa a un altro widget
+(cambio pagina). Fino ad allora il widget riceve sempre la stessa finestra.
+
+Le etichette delle righe sono quelle dell'indice del DataFrame di base; le
+righe aggiunte ricevono etichette successive all'ultima della base e
+compaiono in coda.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _assign(frame, labels, column, values):
+    """frame.loc[labels, column] = values, estendendo le categorie se serve."""
+    if isinstance(frame[column].dtype, pd.CategoricalDtype):
+        new = pd.Index(values).dropna().difference(frame[column].cat.categories)
+        if len(new):
+            frame[column] = frame[column].cat.add_categories(new)
+    frame.loc[labels, column] = values
+
+
+class PatchLog:
+    """Registro delle modifiche di un DataFrame di base (vedi docstring del modulo)."""
+
+    def __init__(self, base: pd.DataFrame):
+        self.dtypes = base.dtypes.to_dict()
+        self.edited = {}      # etichetta (riga della base) -> {colonna: valore}
+        self.added = {}       # etichetta (riga aggiunta) -> {colonna: valore}, in ordine di inserimento
+        self.deleted = set()  # etichette delle righe della base eliminate
+        self.version = 0      # incrementato ad ogni modifica
+        self._base_stop = int(base.index.max()) + 1 if len(base) else 0
+        self._next_label = self._base_stop
+        self._staged = None
+        self._live = None
+
+    # -----------------------------
+    # FINESTRA
+    # -----------------------------
+    def live_labels(self, base) -> np.ndarray:
+        """Etichette delle righe correnti (base senza le eliminate, poi le aggiunte)."""
+        if self._live is None:
+            labels = base.index[~base.index.isin(self.deleted)] if self.deleted else base.index
+            self._live = np.concatenate([labels.to_numpy(), np.fromiter(self.added, dtype=np.int64)])
+        return self._live
+
+    def window(self, base, start, stop, key) -> pd.DataFrame:
+        """
+        Righe [start, stop) con le modifiche consolidate, per il widget `key`.
+        Le modifiche preparate da un altro widget vengono consolidate prima.
+        """
+        if self._staged and self._staged["key"] != key:
+            self.commit()
+        labels = self.live_labels(base)[start:stop]
+        base_labels = labels[labels < self._base_stop]
+        frame = base.loc[base_labels].copy()
+        self._apply_edits(frame, {label: self.edited[label] for label in base_labels if label in self.edited})
+        if len(labels) > len(base_labels):
+            frame = self._append_added(frame, {label: self.added[label] for label in labels[len(base_labels):]})
+        return frame
+
+    def _apply_edits(self, frame, edited):
+        by_column = {}
+        for label, changes in edited.items():
+            for column, value in changes.items():
+                by_column.setdefault(column, ([], []))
+                by_column[column][0].append(label)
+                by_column[column][1].append(value)
+        for column, (labels, values) in by_column.items():
+            _assign(frame, labels, column, values)
+
+    def _append_added(self, frame, added):
+        """Accoda a `frame` le righe aggiunte `added` (etichetta -> valori)."""
+        added = self._restore_dtypes(pd.DataFrame(list(added.values()), index=list(added), columns=frame.columns))
+        return self._restore_dtypes(pd.concat([frame, added])) if len(frame) else added
+
+    def _restore_dtypes(self, frame):
+        """Riporta le colonne ai tipi della base (le righe aggiunte arrivano come object)."""
+        for column, dtype in self.dtypes.items():
+            if column not in frame or frame[column].dtype == dtype:
+                continue
+            if isinstance(dtype, pd.CategoricalDtype):
+                new = pd.Index(frame[column]).dropna().difference(dtype.categories)
+                frame[column] = pd.Categorical(frame[column], categories=dtype.categories.append(new))
+            else:
+                try:
+                    frame[column] = frame[column].astype(dtype)
+                except (TypeError, ValueError):
+                    pass
+        return frame
+
+    # -----------------------------
+    # REGISTRAZIONE
+    # -----------------------------
+    def stage(self, key, window, edited, state):
+        """
+        Prepara le modifiche del widget `key` (stato del data editor `state`,
+        DataFrame restituito `edited`) rispetto alla finestra `window` che ha ricevuto.
+        """
+        if self._staged and self._staged["key"] != key:
+            self.commit()
+        state = {
+            "edited_rows": state.get("edited_rows") or {},
+            "added_rows": state.get("added_rows") or [],
+            "deleted_rows": state.get("deleted_rows") or [],
+        }
+        if self._staged and self._staged["state"] == state:
+            return
+        deleted = [window.index[int(position)] for position in state["deleted_rows"]]
+        changes = {}
+        for position, columns in state["edited_rows"].items():
+            label = window.index[int(position)]
+            if label not in deleted:
+                changes[label] = {column: edited.at[label, column] for column in columns if column in edited}
+        count = len(state["added_rows"])
+        added = edited.iloc[len(edited) - count:].to_dict("records") if count else []
+        self._staged = {"key": key, "state": state, "edited": changes, "added": added, "deleted": deleted}
+        self.version += 1
+
+    def _merged(self):
+        """(edited, added, deleted, next_label) del registro con le modifiche preparate, senza consolidarle."""
+        edited = {label: dict(changes) for label, changes in self.edited.items()}
+        added = {label: dict(row) for label, row in self.added.items()}
+        deleted = set(self.deleted)
+        next_label = self._next_label
+        staged = self._staged
+        if staged:
+            for label, changes in staged["edited"].items():
+                (added[label] if label in added else edited.setdefault(label, {})).update(changes)
+            for label in staged["deleted"]:
+                if label in added:
+                    del added[label]
+                else:
+                    deleted.add(label)
+                    edited.pop(label, None)
+            for row in staged["added"]:
+                added[next_label] = row
+                next_label += 1
+        return edited, added, deleted, next_label
+
+    def commit(self):
+        """Consolida nel registro le modifiche preparate (solo quando il loro widget non è più mostrato)."""
+        if self._staged:
+            self.edited, self.added, self.deleted, self._next_label = self._merged()
+            self._staged = None
+            self._live = None
+
+    def summary(self) -> dict:
+        """Celle modificate, righe aggiunte ed eliminate (modifiche preparate comprese)."""
+        edited, added, deleted, _ = self._merged()
+        return {
+            "edited_cells": sum(len(changes) for changes in edited.values()),
+            "added_rows": len(added),
+            "deleted_rows": len(deleted),
+        }
+
+    def has_changes(self) -> bool:
+        return any(self.summary().values())
+
+    # -----------------------------
+    # MATERIALIZZAZIONE
+    # -----------------------------
+    def materialize(self, base) -> pd.DataFrame:
+        """
+        DataFrame completo con tutte le modifiche, comprese quelle preparate
+        (da usare al salvataggio). Il registro non viene modificato.
+        """
+        edited, added, deleted, _ = self._merged()
+        frame = base.drop(index=list(deleted)) if deleted else base.copy()
+        self._apply_edits(frame, edited)
+        if added:
+            frame = self._append_added(frame, added)
+        return frame
@@ -0,0 +1,387 @@
+"""
+Pipeline di salvataggio di un forecast EDI, condivisa da upload singolo e multiplo.
+
+Per ogni file caricato, come un'unica operazione (tutto o niente) sotto lock
+del cliente e del file originale:
+1. backup del contenuto originale nell'archivio dei backup (compresso e
+   deduplicato; il backup Excel si rigenera su richiesta da questo);
+2. forecast (JSON o Parquet, secondo FORECAST_STORAGE_FORMAT) in OUTPUT_DIR,
+   scritto in modo atomico sovrascrivendo quello già salvato per lo stesso
+   file originale;
+3. nuova revisione nello storico (delta rispetto al forecast sovrascritto);
+4. aggiornamento del catalogo dei forecast e del rollup della domanda.
+
+Prima del primo passo il salvataggio scrive un giornale in JOURNAL_DIR
+(<file originale>.json) con lo stato da ripristinare: ultima voce di backup,
+numero di revisioni, forecast da scrivere e se esisteva già. Se un passo
+fallisce il giornale guida l'annullamento; se il processo viene terminato a
+metà, il giornale resta e il salvataggio successivo dello stesso file (o
+l'avvio dell'app, recover_interrupted_saves) lo annulla sotto lo stesso
+lock. Dopo l'ultimo passo il giornale passa a "committed": la pulizia finale
+(copia di ripristino, forecast nel formato precedente) viene completata
+anche se il processo si ferma prima di finirla.
+"""
+import json
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from src.edi.schema import to_display
+from src.utils.config import JOURNAL_DIR, OUTPUT_DIR
+from src.utils.logger import setup_logger
+from src.utils.metrics import observe
+from src.utils.file_io import atomic_write, file_lock
+from src.utils.export_worker import purge_exports
+from src.utils.forecast_store import forecast_filename, write_forecast, read_forecast, FORECAST_EXTENSIONS
+from src.utils.revision_store import record_revision, list_revisions, discard_revisions
+from src.utils.backup_store import store_backup, last_backup_id, remove_backups_after
+from src.utils.forecast_index import (
+    index_forecast, remove_forecast, find_by_original_filename, original_key
+)
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("pipeline")
+
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+def find_existing_forecast(original_filename):
+    """Path del forecast già salvato per lo stesso file originale, altrimenti None."""
+    if not original_filename:
+        return None
+    try:
+        entry = find_by_original_filename(original_filename)
+        if entry:
+            return os.path.join(OUTPUT_DIR, entry["filename"])
+    except Exception as e:
+        logger.error(f"Error searching for existing forecast: {e}")
+    return None
+
+
+def _timestamp_taken(customer, timestamp):
+    stem = os.path.splitext(forecast_filename(customer, timestamp))[0]
+    return any(os.path.exists(os.path.join(OUTPUT_DIR, stem + ext)) for ext in FORECAST_EXTENSIONS)
+
+
+def unique_timestamp(customer, timestamp=None, reserved=()):
+    """
+    Timestamp di salvataggio (YYYYmmdd_HHMMSS) non ancora usato per il cliente.
+    Più file dello stesso cliente salvati nello stesso secondo (upload multiplo)
+    ricevono secondi successivi, così i forecast non si sovrascrivono.
+    """
+    moment = datetime.strptime(timestamp, TIMESTAMP_FORMAT) if timestamp else datetime.now()
+    candidate = moment.strftime(TIMESTAMP_FORMAT)
+    while candidate in reserved or _timestamp_taken(customer, candidate):
+        moment += timedelta(seconds=1)
+        candidate = moment.strftime(TIMESTAMP_FORMAT)
+    return candidate
+
+
+def _lock_names(customer, original_filename):
+    """Lock di un salvataggio: il cliente (scelta del nome del forecast) e il file originale (sovrascrittura)."""
+    return f"customer_{customer}", f"forecast_{original_key(original_filename)}"
+
+
+def _keep_previous(path):
+    """Copia del forecast che sta per essere sovrascritto, per ripristinarlo se il salvataggio fallisce."""
+    rollback_path = f"{path}.rollback"
+    try:
+        os.link(path, rollback_path)  # nessuna copia: la sovrascrittura atomica crea un nuovo file
+    except OSError:
+        shutil.copy2(path, rollback_path)
+    return rollback_path
+
+
+# -----------------------------
+# GIORNALE DEI SALVATAGGI
+# -----------------------------
+def _journal_path(original_filename):
+    return os.path.join(JOURNAL_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", original_key(original_filename)) + ".json")
+
+
+def _write_journal(journal):
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    with atomic_write(_journal_path(journal["original_filename"])) as f:
+        json.dump(journal, f, ensure_ascii=False)
+
+
+def _reindex(path):
+    """Allinea il catalogo al forecast su disco (lo rimuove se il file non c'è)."""
+    if not os.path.exists(path):
+        remove_forecast(path)
+        return
+    indexed, message = index_forecast(path)
+    if not indexed:
+        raise RuntimeError(f"Catalog update failed: {message}")
+
+
+def _roll_back(journal):
+    """Riporta backup, storico, forecast e catalogo allo stato registrato nel giornale."""
+    original_filename = journal["original_filename"]
+    forecast_path = journal["forecast_path"]
+    rollback_path = f"{forecast_path}.rollback"
+    remove_backups_after(original_filename, journal["last_backup_id"])
+    discard_revisions(original_filename, journal["revisions"])
+    if journal["overwrite"]:
+        # Senza copia di ripristino il forecast non è ancora stato sovrascritto
+        if os.path.exists(rollback_path):
+            if os.path.exists(forecast_path) and os.path.samefile(rollback_path, forecast_path):
+                os.remove(rollback_path)  # hard link non ancora sovrascritto: rename non farebbe nulla
+            else:
+                os.replace(rollback_path, forecast_path)
+    elif os.path.exists(forecast_path):
+        os.remove(forecast_path)
+    for path in {forecast_path, journal["existing"]} - {None}:
+        _reindex(path)
+
+
+def _finish_commit(journal):
+    """Pulizia dopo l'ultimo passo: copia di ripristino e forecast nel formato precedente."""
+    forecast_path, existing = journal["forecast_path"], journal["existing"]
+    rollback_path = f"{forecast_path}.rollback"
+    if os.path.exists(rollback_path):
+        os.remove(rollback_path)
+    if existing and existing != forecast_path and os.path.exists(existing):
+        remove_forecast(existing)
+        os.remove(existing)
+
+
+def _recover(original_filename) -> bool:
+    """
+    Da chiamare con il lock del file originale: completa o annulla il
+    salvataggio interrotto registrato nel giornale. Ritorna True se c'era.
+    """
+    path = _journal_path(original_filename)
+    if not os.path.exists(path):
+        return False
+    with open(path, "r", encoding="utf-8") as f:
+        journal = json.load(f)
+    if journal["state"] == "committed":
+        _finish_commit(journal)
+        action = "completed"
+    else:
+        _roll_back(journal)
+        action = "rolled back"
+    os.remove(path)
+    logger.warning(f"Interrupted save of {original_filename} ({journal['timestamp']}) {action}")
+    return True
+
+
+def recover_interrupted_saves() -> int:
+    """Recupera i salvataggi interrotti di tutti i file (all'avvio), ognuno sotto il suo lock. Ritorna quanti."""
+    recovered = 0
+    for name in sorted(os.listdir(JOURNAL_DIR)) if os.path.isdir(JOURNAL_DIR) else []:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(JOURNAL_DIR, name), "r", encoding="utf-8") as f:
+                journal = json.load(f)
+            with file_lock(*_lock_names(journal["customer"], journal["original_filename"])):
+                recovered += _recover(journal["original_filename"])
+        except Exception as e:
+            logger.error(f"Error recovering interrupted save {name}: {e}")
+    return recovered
+
+
+@contextmanager
+def forecast_lock(customer, original_filename):
+    """
+    Lock di salvataggio di un forecast, per chi lo scrive o lo elimina fuori
+    dalla pipeline: prima di entrare recupera il salvataggio interrotto dello
+    stesso file, così il giornale non tocca più il forecast dopo.
+    """
+    # I forecast senza file originale (precedenti al catalogo) hanno solo il lock del cliente
+    names = _lock_names(customer, original_filename) if original_filename else (f"customer_{customer}",)
+    with file_lock(*names):
+        if original_filename:
+            _recover(original_filename)
+        yield
+
+
+def save_forecast(customer, original_filename, content, df, timestamp=None, progress=None) -> dict:
+    """
+    Salva backup, forecast e revisione di un file caricato come un'unica
+    operazione: se un passo fallisce, quelli già eseguiti vengono annullati
+    (voce del backup, forecast scritto o sovrascritto, revisioni) e l'errore
+    viene rilanciato; un salvataggio interrotto in precedenza viene annullato
+    prima di iniziare (vedi il giornale). Salvataggi concorrenti dello stesso
+    cliente o dello stesso file originale (anche da altri processi) attendono il lock.
+
+    Args:
+        customer: Cliente selezionato
+        original_filename: Nome del file caricato
+        content: Contenuto originale del file (str)
+        df: DataFrame da salvare (colonne HEADERS, senza la colonna Index), stringa o compatto
+        timestamp: Timestamp di salvataggio (default: ora)
+        progress: Callback opzionale progress(percent, message) per la UI
+
+    Returns:
+        dict: riepilogo con i nomi dei file creati, l'azione eseguita e i tempi per fase
+    """
+    def report(percent, message):
+        if progress:
+            progress(percent, message)
+
+    timestamp = timestamp or datetime.now().strftime(TIMESTAMP_FORMAT)
+    timings = {}
+    # Forecast, catalogo e storico lavorano sui valori stringa del formato su disco
+    df = to_display(df)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    report(10, "🔒 Waiting for other saves of this customer/file...")
+    with forecast_lock(customer, original_filename):
+        existing = find_existing_forecast(original_filename)
+        if not existing:
+            # Un salvataggio concorrente dello stesso cliente può aver usato lo stesso secondo
+            timestamp = unique_timestamp(customer, timestamp)
+        new_filename = forecast_filename(customer, timestamp)
+        if existing:
+            # Stesso nome, eventualmente con l'estensione del formato corrente
+            forecast_path = os.path.splitext(existing)[0] + os.path.splitext(new_filename)[1]
+        else:
+            forecast_path = os.path.join(OUTPUT_DIR, new_filename)
+        rollback_path = f"{forecast_path}.rollback"
+        if os.path.exists(rollback_path):
+            os.remove(rollback_path)  # lasciata da un salvataggio interrotto prima del giornale
+
+        journal = {
+            "state": "pending",
+            "customer": customer,
+            "original_filename": original_filename,
+            "timestamp": timestamp,
+            "existing": existing,
+            "forecast_path": forecast_path,
+            "overwrite": os.path.exists(forecast_path),
+            "last_backup_id": last_backup_id(original_filename),
+            "revisions": len(list_revisions(original_filename)),
+        }
+        _write_journal(journal)
+        try:
+            # Step 1: backup del file originale (un contenuto già archiviato non viene riscritto)
+            report(30, "📄 Saving backup...")
+            start = time.perf_counter()
+            backup = store_backup(customer, original_filename, content, timestamp)
+            timings["backup_s"] = time.perf_counter() - start
+            logger.info(f"Backup saved: #{backup['id']} {backup['object']}"
+                        f"{' (identical content already stored)' if backup['deduplicated'] else ''}")
+
+            # Step 2: Forecast (JSON o Parquet, secondo FORECAST_STORAGE_FORMAT), scritto in modo atomico
+            report(60, "🗃️ Saving forecast...")
+            start = time.perf_counter()
+            previous = None
+            if existing:
+                try:
+                    previous = read_forecast(existing)
+                except Exception as e:
+                    logger.warning(f"Error reading forecast {os.path.basename(existing)} for revision history: {e}")
+                action_msg = "overwritten"
+                logger.info(f"Overwriting existing forecast: {os.path.basename(existing)}")
+            else:
+                action_msg = "created"
+                logger.info(f"Creating new forecast: {new_filename}")
+
+            forecast_meta = {
+                "customer": customer,
+                "timestamp": timestamp,
+                "original_filename": original_filename,
+                "content_sha256": backup["content_sha256"],
+            }
+            if journal["overwrite"]:
+                _keep_previous(forecast_path)
+            write_forecast(forecast_path, forecast_meta, df)
+            timings["forecast_s"] = time.perf_counter() - start
+
+            # Step 3: storico delle revisioni
+            report(80, "🕓 Recording revision...")
+            start = time.perf_counter()
+            revision = record_revision(forecast_meta, df, previous)
+            timings["revision_s"] = time.perf_counter() - start
+
+            # Step 4: catalogo (ricerca del forecast esistente ai salvataggi successivi)
+            report(90, "📇 Updating catalog...")
+            start = time.perf_counter()
+            indexed, message = index_forecast(forecast_path, {**forecast_meta, "row_count": len(df)}, df)
+            if not indexed:
+                raise RuntimeError(f"Catalog update failed: {message}")
+            timings["index_s"] = time.perf_counter() - start
+        except Exception as e:
+            logger.error(f"Save of {original_filename} failed, rolling back: {e}")
+            try:
+                _roll_back(journal)
+                os.remove(_journal_path(original_filename))
+            except Exception as rollback_error:
+                # Il giornale resta: il prossimo salvataggio del file riprova l'annullamento
+                logger.error(f"Rollback failed for {original_filename}: {rollback_error}")
+            raise
+
+        # Commit: si eliminano la copia di ripristino e il forecast nel formato precedente
+        journal["state"] = "committed"
+        _write_journal(journal)
+        _finish_commit(journal)
+        os.remove(_journal_path(original_filename))
+
+    for stage, seconds in timings.items():
+        observe("save_stage_seconds", seconds, stage=stage.removesuffix("_s"))
+    report(100, "✅ Forecast saved")
+
+    return {
+        "customer": customer,
+        "original_filename": original_filename,
+        "records_count": len(df),
+        "backup": backup,
+        "json_filename": os.path.basename(forecast_path),
+        "action_msg": action_msg,
+        "revision": revision,
+        "timings": timings,
+    }
+
+
+def save_batch(customer, items, progress=None) -> list[dict]:
+    """
+    Salva in un'unica operazione più file dello stesso cliente.
+
+    Args:
+        customer: Cliente selezionato
+        items: Lista di (original_filename, content, df)
+        progress: Callback opzionale progress(percent, message) sull'intero lotto
+
+    Returns:
+        list: un riepilogo per file (vedi save_forecast) con "ok"/"error" e "save_s"
+    """
+    summaries = []
+    reserved = set()
+    for i, (original_filename, content, df) in enumerate(items):
+        if progress:
+            progress(int(i * 100 / len(items)), f"💾 Saving {original_filename} ({i + 1}/{len(items)})...")
+        start = time.perf_counter()
+        try:
+            timestamp = unique_timestamp(customer, reserved=reserved)
+            reserved.add(timestamp)
+            summary = save_forecast(customer, original_filename, content, df, timestamp=timestamp)
+            summary.update(ok=True, error=None)
+        except Exception as e:
+            logger.error(f"Error saving {original_filename} in batch: {e}")
+            summary = {"customer": customer, "original_filename": original_filename,
+                       "records_count": len(df), "ok": False, "error": str(e)}
+        summary["save_s"] = time.perf_counter() - start
+        summaries.append(summary)
+    if progress:
+        progress(100, f"✅ {sum(s['ok'] for s in summaries)}/{len(items)} files saved")
+    return summaries
+
+
+def delete_forecast(customer, original_filename, path):
+    """
+    Elimina un forecast (file, voce del catalogo ed export in cache) sotto gli
+    stessi lock del salvataggio: non si sovrappone a un salvataggio in corso
+    dello stesso file, e un salvataggio interrotto viene recuperato prima, così
+    il giornale non ripristina il forecast eliminato. Backup e storico restano.
+    """
+    with forecast_lock(customer, original_filename):
+        if os.path.exists(path):
+            os.remove(path)
+        remove_forecast(path)
+        purge_exports(path)
@@ -0,0 +1,125 @@
+"""
+Schema tipizzato e compatto dei forecast analizzati.
+
+Il parser restituisce tutte le colonne come stringhe Python (dtype object):
+è il formato "di visualizzazione" scritto su disco da forecast_store e usato
+dal confronto tra versioni e dallo storico delle revisioni. Per i DataFrame
+che restano in memoria a lungo (session_state della pagina di upload, esiti
+dell'upload multiplo) si usa invece una rappresentazione compatta:
+
+- COD.CLIENTE, OCLI GARE, ORD.VEN: categoriche (di norma un solo valore per
+  file; nel data editor diventano una selectbox sui valori presenti);
+- ORD.HYD, COD. ART, DESCRIZIONE: stringhe pyarrow;
+- QUANTITA: float64 ('1040,00' -> 1040.0);
+- CONSEGNA: datetime64 ('26.05.2025').
+
+QUANTITA e CONSEGNA vengono tipizzate solo se la conversione è reversibile
+(to_display restituisce esattamente le stringhe originali), altrimenti
+restano stringhe pyarrow, come per il formato Parquet di forecast_store.
+"""
+import numpy as np
+import pandas as pd
+
+QUANTITY_COLUMN = "QUANTITA"
+DATE_COLUMN = "CONSEGNA"
+DATE_FORMAT = "%d.%m.%Y"
+
+CATEGORY_COLUMNS = ["COD.CLIENTE", "OCLI GARE", "ORD.VEN"]
+STRING_COLUMNS = ["ORD.HYD", "COD. ART", "DESCRIZIONE"]
+
+_STRING_DTYPE = pd.StringDtype("pyarrow")
+
+
+# -----------------------------
+# CONVERSIONI
+# -----------------------------
+def _text(values: pd.Series) -> pd.Series:
+    """Valori come stringhe Python, "" per i mancanti."""
+    text = values.astype(object)
+    return text.where(text.notna(), "").astype(str)
+
+
+def _by_unique(values: pd.Series, convert) -> pd.Series:
+    """
+    Applica `convert` ai soli valori distinti: date e quantità di un forecast
+    si ripetono molto, così la conversione costa per valore distinto e non per riga.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    converted = convert(pd.Series(uniques))
+    return pd.Series(converted.to_numpy().take(codes), index=values.index, dtype=converted.dtype)
+
+
+def _quantity_to_display(values: pd.Series) -> pd.Series:
+    array = values.to_numpy(dtype=float, na_value=np.nan)
+    text = np.char.replace(np.char.mod("%.2f", array), ".", ",").astype(object)
+    text[np.isnan(array)] = ""
+    return pd.Series(text, index=values.index, dtype=object)
+
+
+def _quantity_to_typed(values: pd.Series):
+    """'1040,00' -> 1040.0; None se la conversione non è reversibile."""
+    text = _text(values)
+    typed = _by_unique(text, lambda unique: pd.to_numeric(
+        unique.str.strip().str.replace(",", ".", regex=False), errors="coerce").astype("float64"))
+    return typed if _by_unique(typed, _quantity_to_display).equals(text) else None
+
+
+def _date_to_display(values: pd.Series) -> pd.Series:
+    return _by_unique(values, lambda unique: _text(unique.dt.strftime(DATE_FORMAT)))
+
+
+def _date_to_typed(values: pd.Series):
+    """'26.05.2025' -> Timestamp; None se la conversione non è reversibile."""
+    text = _text(values)
+    typed = _by_unique(text, lambda unique: pd.to_datetime(unique.str.strip(), format=DATE_FORMAT, errors="coerce"))
+    return typed if _date_to_display(typed).equals(text) else None
+
+
+_TYPED_COLUMNS = {
+    QUANTITY_COLUMN: (_quantity_to_typed, _quantity_to_display),
+    DATE_COLUMN: (_date_to_typed, _date_to_display),
+}
+
+
+def to_compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    DataFrame con i tipi compatti dello schema. Le colonne non previste
+    (es. "Index" della pagina di upload) restano invariate.
+    """
+    compact = df.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in compact:
+            compact[column] = _text(compact[column]).astype("category")
+    for column in STRING_COLUMNS:
+        if column in compact:
+            compact[column] = compact[column].astype(_STRING_DTYPE)
+    for column, (to_typed, _) in _TYPED_COLUMNS.items():
+        if column not in compact:
+            continue
+        typed = to_typed(compact[column])
+        compact[column] = typed if typed is not None else compact[column].astype(_STRING_DTYPE)
+    return compact
+
+
+def to_display(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    DataFrame con i valori stringa del formato su disco ('1040,00', '26.05.2025',
+    "" per i valori mancanti). Accetta sia DataFrame compatti sia già stringa.
+    """
+    display = df.copy()
+    for column in CATEGORY_COLUMNS + STRING_COLUMNS + list(_TYPED_COLUMNS):
+        if column not in display:
+            continue
+        values = display[column]
+        if column == QUANTITY_COLUMN and pd.api.types.is_float_dtype(values):
+            display[column] = _by_unique(values, _quantity_to_display)
+        elif column == DATE_COLUMN and pd.api.types.is_datetime64_any_dtype(values):
+            display[column] = _date_to_display(values)
+        elif values.dtype != object or values.isna().any():
+            display[column] = _text(values)
+    return display
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """Memoria occupata dal DataFrame in byte (stringhe comprese)."""
+    return int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,209 @@
+"""
+Stampe EDI "STAMPA PASSAGGIO ORDINI" sintetiche per benchmark e test di carico.
+
+Le stampe hanno il layout delle stampe reali atteso da src/edi/parser.py:
+6 righe di intestazione, colonne delimitate da "!", righe DEF (ordine e riga)
+e PRE, righe raggruppate per articolo con più date di consegna, QUANTITA con
+la virgola decimale e date CONSEGNA a 8/7 cifre (a 6/5 cifre con l'anno
+abbreviato, secondo short_date_rate). Sono configurabili:
+- righe dati e numero di articoli distinti;
+- righe di disturbo (noise_rate): righe vuote, separatori e cambi pagina;
+- righe malformate (malformed_rate): righe dati troncate, con meno di 8 colonne.
+Il parser scarta disturbo e righe malformate: una stampa con `rows` righe
+dati dà sempre un DataFrame di `rows` righe. A parità di seed la stampa è
+identica.
+
+populate_forecasts() scrive in OUTPUT_DIR migliaia di forecast sintetici
+(come salvati dall'app, senza backup e storico) per misurare viewer e
+catalogo su volumi di produzione.
+
+Uso (dalla root del progetto):
+    python -m src.edi.synthetic print --rows 100000 --articles 2000 --noise 0.01 --output big.txt
+    python -m src.edi.synthetic populate --count 5000 --rows 300 --index
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from src.edi.parser import parse_edi_bytes
+from src.edi.pipeline import TIMESTAMP_FORMAT
+from src.utils.config import FORECAST_STORAGE_FORMAT, OUTPUT_DIR, ensure_data_dirs
+from src.utils.forecast_index import compute_content_hash, sync_index
+from src.utils.forecast_store import forecast_filename, write_forecast
+from src.utils.logger import setup_logger
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("synthetic")
+
+CUSTOMERS = ("Navistar", "Volvo", "Man", "Scania", "Iveco", "Renault", "DAF", "Mercedes-Benz")
+
+_EOL = "\r\n"
+_RULE = "+----------------+--------+-----------+-------------------------+---------+--------+------------+-----------------------------------"
+_COLUMNS = "!    ORD.HYD     !        !COD. ART   ! DESCRIZIONE   !OCLI GARE! QUANTITA!CONSEGNA!ORD.VEN     !"
+_BLANK_ROW = "!                !        !           !                         !         !        !            !"
+
+
+def _title(page, printed_at):
+    return (f"\x0c                              -STAMPA PASSAGGIO ORDINI RVI 1358 1357 1235 1508 2989   IPH "
+            f"PAG. {page:05d}        {printed_at:%d%m%Y} ORA. {printed_at:%H.%M.%S}")
+
+
+def _consegna(day, short_year):
+    """Data CONSEGNA come nelle stampe: giorno senza zero iniziale (7/5 cifre), anno a 4 o 2 cifre."""
+    year = f"{day.year % 100:02d}" if short_year else str(day.year)
+    return f"{day.day}{day.month:02d}{year}"
+
+
+def _quantity(rnd):
+    units = rnd.randint(1, 200) * rnd.choice((1, 1, 2, 5, 10))
+    cents = rnd.choice((25, 50, 75)) if rnd.random() < 0.05 else 0
+    return f"{units},{cents:02d}"
+
+
+def iter_print_lines(rows, articles=200, seed=42, def_rate=0.6, short_date_rate=0.1, noise_rate=0.0,
+                     malformed_rate=0.0, start=date(2025, 1, 6), weeks=52, customer_code="07083158"):
+    """
+    Generatore delle righe (str, con "\\r\\n") di una stampa sintetica.
+
+    Args:
+        rows: Righe dati
+        articles: Articoli distinti (COD. ART), al massimo `rows`
+        seed: Seme del generatore casuale
+        def_rate: Quota di righe DEF (le altre sono PRE)
+        short_date_rate: Quota di date CONSEGNA con l'anno a 2 cifre (6/5 cifre)
+        noise_rate: Righe di disturbo per riga dati
+        malformed_rate: Righe troncate per riga dati
+        start: Prima data di consegna possibile
+        weeks: Settimane coperte dalle date di consegna
+        customer_code: COD.CLIENTE delle righe
+    """
+    rnd = random.Random(seed)
+    articles = max(1, min(articles, rows))
+    printed_at = datetime.combine(start, datetime.min.time()) - timedelta(days=rnd.randint(1, 30), seconds=rnd.randint(0, 86399))
+    order = rnd.randint(1, 999)
+    page = 1
+
+    yield _title(page, printed_at) + _EOL
+    yield "-" * 132 + _EOL
+    yield _RULE + _EOL
+    yield _COLUMNS + _EOL
+    yield _RULE + _EOL
+    yield _BLANK_ROW + _EOL
+
+    per_article, extra = divmod(rows, articles)
+    line_number = 1
+    for article in range(articles):
+        code = f"{108600 + article}N91"
+        description = f"606XN{article % 1_000_000:06d}000"
+        ocli = rnd.choice(("SI055A-", "HWRB  -", "SI071B-", "GR300 -"))
+        for _ in range(per_article + (article < extra)):
+            if rnd.random() < def_rate:
+                ord_hyd = f"DEF h{order:>6}{line_number:>5}"
+                line_number += 4
+            else:
+                ord_hyd = "PRE"
+            consegna = _consegna(start + timedelta(days=rnd.randrange(weeks * 7)), rnd.random() < short_date_rate)
+            line = (f"!{ord_hyd:<16}!{customer_code}!{code:<11}!{description:<15}!{ocli:<9}!"
+                    f"{_quantity(rnd):>8} !{consegna:>8}!SI055A      !")
+            yield line + _EOL
+
+            if malformed_rate and rnd.random() < malformed_rate:
+                # Riga spezzata dalla stampante: meno di 8 colonne, scartata dal parser
+                yield "!".join(line.split("!")[:rnd.randint(2, 7)]) + _EOL
+            if noise_rate and rnd.random() < noise_rate:
+                kind = rnd.random()
+                if kind < 0.4:
+                    yield _EOL
+                elif kind < 0.8:
+                    yield rnd.choice((_RULE, "-" * 132)) + _EOL
+                else:
+                    page += 1
+                    yield _title(page, printed_at) + _EOL
+                    yield "-" * 132 + _EOL
+
+
+def synthetic_print(rows, **options) -> bytes:
+    """Stampa sintetica completa in UTF-8 (argomenti come iter_print_lines)."""
+    return "".join(iter_print_lines(rows, **options)).encode("utf-8")
+
+
+def write_print(path, rows, **options) -> int:
+    """Scrive una stampa sintetica su disco riga per riga (anche milioni di righe). Ritorna i byte scritti."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for line in iter_print_lines(rows, **options):
+            f.write(line)
+    return os.path.getsize(path)
+
+
+# -----------------------------
+# FORECAST SINTETICI
+# -----------------------------
+def populate_forecasts(count, rows=200, articles=50, seed=0, customers=CUSTOMERS, fmt=None,
+                       start=datetime(2025, 1, 1), index=False) -> list[str]:
+    """
+    Scrive `count` forecast sintetici in OUTPUT_DIR, con i metadati dei
+    forecast salvati dall'app (senza backup e storico). Ogni forecast ha tra
+    rows/2 e 3*rows/2 righe; i timestamp partono da `start`, un minuto l'uno
+    dall'altro, così a parità di argomenti i file vengono sovrascritti.
+    Con `index` il catalogo viene allineato subito.
+
+    Returns:
+        list[str]: nomi dei file scritti
+    """
+    rnd = random.Random(seed)
+    filenames = []
+    started = time.perf_counter()
+    for number in range(count):
+        customer = customers[number % len(customers)]
+        timestamp = (start + timedelta(minutes=number)).strftime(TIMESTAMP_FORMAT)
+        content = synthetic_print(rnd.randint(max(1, rows // 2), max(1, rows * 3 // 2)), articles=articles,
+                                  seed=seed * 1_000_003 + number, start=start.date() + timedelta(days=number % 28))
+        filename = forecast_filename(customer, timestamp, fmt)
+        write_forecast(os.path.join(OUTPUT_DIR, filename), {
+            "customer": customer,
+            "timestamp": timestamp,
+            "original_filename": f"SYN{seed}_{number}CBDELFORNA.txt",
+            "content_sha256": compute_content_hash(content),
+        }, parse_edi_bytes(content))
+        filenames.append(filename)
+    logger.info(f"{count} synthetic forecasts written in {time.perf_counter() - started:.1f}s")
+
+    if index:
+        sync_index()
+    return filenames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic EDI prints and forecasts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    cmd_print = subparsers.add_parser("print", help="Write a synthetic STAMPA PASSAGGIO ORDINI print")
+    cmd_print.add_argument("--rows", type=int, default=1_000, help="Data rows")
+    cmd_print.add_argument("--articles", type=int, default=200, help="Distinct articles (COD. ART)")
+    cmd_print.add_argument("--seed", type=int, default=42)
+    cmd_print.add_argument("--def-rate", type=float, default=0.6, help="Share of DEF rows (the others are PRE)")
+    cmd_print.add_argument("--short-dates", type=float, default=0.1, help="Share of 6/5-digit CONSEGNA dates")
+    cmd_print.add_argument("--noise", type=float, default=0.0, help="Blank, separator and page-break lines per data row")
+    cmd_print.add_argument("--malformed", type=float, default=0.0, help="Truncated lines per data row")
+    cmd_print.add_argument("--output", help="Destination path (default: synthetic_<rows>CBDELFORNA.txt)")
+    cmd_populate = subparsers.add_parser("populate", help="Write synthetic forecasts to OUTPUT_DIR")
+    cmd_populate.add_argument("--count", type=int, default=1_000)
+    cmd_populate.add_argument("--rows", type=int, default=200, help="Average rows per forecast")
+    cmd_populate.add_argument("--articles", type=int, default=50, help="Distinct articles per forecast")
+    cmd_populate.add_argument("--seed", type=int, default=0)
+    cmd_populate.add_argument("--format", choices=["json", "parquet"], default=FORECAST_STORAGE_FORMAT)
+    cmd_populate.add_argument("--index", action="store_true", help="Update the forecast catalog afterwards")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    if args.command == "print":
+        output = args.output or f"synthetic_{args.rows}CBDELFORNA.txt"
+        size = write_print(output, args.rows, articles=args.articles, seed=args.seed, def_rate=args.def_rate,
+                           short_date_rate=args.short_dates, noise_rate=args.noise, malformed_rate=args.malformed)
+        print(f"Written {output}: {args.rows} data rows, {size / 1024:.1f} KB")
+
+    elif args.command == "populate":
+        filenames = populate_forecasts(args.count, rows=args.rows, articles=args.articles, seed=args.seed,
+                                       fmt=args.format, index=args.index)
+        print(f"Written {len(filenames)} forecasts to {OUTPUT_DIR}")
@@ -0,0 +1,283 @@
+"""
+Importazione dei forecast EDI da riga di comando, senza passare da Streamlit.
+
+Esegue la stessa pipeline del pulsante SAVE della pagina di upload
+(analisi -> backup -> forecast -> catalogo -> storico) su tutti i
+file .txt/.csv di una cartella, analizzandoli in parallelo in un pool di
+processi. Il cliente è indicato con --customer oppure ricavato dal nome della
+sottocartella (una sottocartella per cliente, es. drop/Navistar/*.txt).
+
+I file elaborati vengono spostati in <cartella>/processed, quelli non validi
+in <cartella>/failed; con --watch la cartella resta sotto osservazione e i
+nuovi file vengono importati appena completata la copia.
+
+Uso:
+    python -m src.ingest DROP_DIR [--customer NAVISTAR] [--workers 4] [--watch]
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from collections import defaultdict
+
+from src.edi.batch import EDI_EXTENSIONS, parse_many
+from src.edi.pipeline import save_batch
+from src.utils.config import PARSE_WORKERS, APP_NAME, ensure_data_dirs
+from src.utils.logger import setup_logger
+from src.utils.notification_utils import apprise_queue_notification
+from src.utils.dispatch_queue import get_dispatch_queue
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("ingest")
+
+PROCESSED_DIR = "processed"
+FAILED_DIR = "failed"
+
+
+# -----------------------------
+# RACCOLTA FILE
+# -----------------------------
+def _customer_for(path, source_dir, customer=None):
+    """Cliente del file: quello indicato, oppure la sottocartella di primo livello."""
+    if customer:
+        return customer
+    relative = os.path.relpath(path, source_dir).split(os.sep)
+    return relative[0] if len(relative) > 1 else None
+
+
+def collect_files(source_dir, customer=None) -> list[tuple[str, str]]:
+    """
+    Elenca i file EDI da importare come (path, cliente), escluse le cartelle
+    processed/failed. Senza --customer si considerano solo le sottocartelle.
+    """
+    files = []
+    for root, dirs, names in os.walk(source_dir):
+        if root == source_dir:
+            dirs[:] = [d for d in dirs if d not in (PROCESSED_DIR, FAILED_DIR)]
+        for name in sorted(names):
+            if name.startswith(".") or not name.lower().endswith(EDI_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            file_customer = _customer_for(path, source_dir, customer)
+            if not file_customer:
+                logger.warning(f"Skipping {name}: no customer (use --customer or a per-customer subfolder)")
+                continue
+            files.append((path, file_customer))
+    return files
+
+
+def _archive(path, source_dir, target):
+    """Sposta il file in <source_dir>/<target>/ mantenendo la sottocartella del cliente."""
+    relative = os.path.relpath(path, source_dir)
+    dest = os.path.join(source_dir, target, relative)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if os.path.exists(dest):
+        root, extension = os.path.splitext(dest)
+        dest = f"{root}_{time.strftime('%Y%m%d_%H%M%S')}{extension}"
+    shutil.move(path, dest)
+
+
+# -----------------------------
+# IMPORTAZIONE
+# -----------------------------
+def _new_stats():
+    return {"files": 0, "saved": 0, "failed": 0, "rows": 0, "bytes": 0,
+            "parse_wall_s": 0.0, "parse_cpu_s": 0.0, "save_s": 0.0, "wall_s": 0.0}
+
+
+def ingest_files(files, source_dir, workers=PARSE_WORKERS, batch_size=50, dry_run=False, stats=None) -> dict:
+    """
+    Importa i file [(path, cliente)] a lotti di `batch_size`: analisi nel pool
+    di processi, salvataggio con la pipeline condivisa, archiviazione del file.
+
+    Returns:
+        dict: statistiche cumulative (file, righe, tempi per fase)
+    """
+    stats = stats if stats is not None else _new_stats()
+    start = time.perf_counter()
+
+    for offset in range(0, len(files), batch_size):
+        chunk = files[offset:offset + batch_size]
+        contents = []
+        for path, _ in chunk:
+            with open(path, "rb") as f:
+                contents.append(f.read())
+
+        parse_start = time.perf_counter()
+        results = parse_many([(os.path.basename(path), data) for (path, _), data in zip(chunk, contents)], workers=workers)
+        stats["parse_wall_s"] += time.perf_counter() - parse_start
+
+        by_customer = defaultdict(list)
+        for (path, customer), data, result in zip(chunk, contents, results):
+            stats["files"] += 1
+            stats["bytes"] += len(data)
+            stats["parse_cpu_s"] += result["parse_s"]
+            if not result["ok"]:
+                stats["failed"] += 1
+                logger.warning(f"Invalid EDI file {path}: {result['error']}")
+                if not dry_run:
+                    _archive(path, source_dir, FAILED_DIR)
+                continue
+            by_customer[customer].append((path, data, result))
+
+        for customer, items in by_customer.items():
+            if dry_run:
+                stats["saved"] += len(items)
+                stats["rows"] += sum(result["rows"] for _, _, result in items)
+                continue
+            save_start = time.perf_counter()
+            summaries = save_batch(customer, [
+                (result["name"], data.decode("utf-8"), result["df"]) for _, data, result in items
+            ])
+            stats["save_s"] += time.perf_counter() - save_start
+            for (path, _, result), summary in zip(items, summaries):
+                if summary["ok"]:
+                    stats["saved"] += 1
+                    stats["rows"] += result["rows"]
+                    _archive(path, source_dir, PROCESSED_DIR)
+                else:
+                    stats["failed"] += 1
+                    _archive(path, source_dir, FAILED_DIR)
+
+        logger.info(f"Ingested {offset + len(chunk)}/{len(files)} files")
+
+    stats["wall_s"] += time.perf_counter() - start
+    return stats
+
+
+def format_summary(stats) -> str:
+    wall = stats["wall_s"] or float("nan")
+    return (
+        f"Files: {stats['files']} ({stats['saved']} saved, {stats['failed']} failed) - "
+        f"rows: {stats['rows']} - {stats['bytes'] / 1024 / 1024:.1f} MB\n"
+        f"Time: {stats['wall_s']:.2f}s wall (parse {stats['parse_wall_s']:.2f}s wall / "
+        f"{stats['parse_cpu_s']:.2f}s in workers, save {stats['save_s']:.2f}s)\n"
+        f"Throughput: {stats['files'] / wall:.1f} files/s, {stats['rows'] / wall:,.0f} rows/s"
+    )
+
+
+def _notify(stats, source_dir) -> bool:
+    """Accoda la notifica di fine importazione. Ritorna True se è stata accodata."""
+    if not stats["saved"]:
+        return False
+    retcode, retmsg = apprise_queue_notification(
+        title=f"✅ {APP_NAME}: Files Imported",
+        message=f"{stats['saved']} files imported from `{source_dir}` ({stats['failed']} failed).",
+        priority=3,
+    )
+    if not retcode:
+        logger.error(f"Failed to send notification for ingest: {retmsg}")
+    return bool(retcode)
+
+
+# -----------------------------
+# CARTELLA OSSERVATA
+# -----------------------------
+def watch(source_dir, customer, workers, batch_size, settle_seconds):
+    """
+    Osserva la cartella con watchdog. Un file viene importato quando la sua
+    dimensione non cambia per `settle_seconds` (copia completata).
+    Ritorna True se è stata accodata almeno una notifica.
+    """
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    candidates = {}  # path -> (size, momento dell'ultima variazione)
+    notified = False
+
+    class DropHandler(FileSystemEventHandler):
+        def on_created(self, event):
+            self._touch(event.src_path, event.is_directory)
+
+        def on_modified(self, event):
+            self._touch(event.src_path, event.is_directory)
+
+        def on_moved(self, event):
+            self._touch(event.dest_path, event.is_directory)
+
+        def _touch(self, path, is_directory):
+            relative = os.path.relpath(path, source_dir).split(os.sep)
+            if is_directory or relative[0] in (PROCESSED_DIR, FAILED_DIR):
+                return
+            if path.lower().endswith(EDI_EXTENSIONS):
+                candidates[path] = (None, time.monotonic())
+
+    # I file già presenti vengono importati subito
+    for path, _ in collect_files(source_dir, customer):
+        candidates[path] = (None, 0)
+
+    observer = Observer()
+    observer.schedule(DropHandler(), source_dir, recursive=True)
+    observer.start()
+    logger.info(f"Watching {source_dir} for EDI files (Ctrl+C to stop)")
+    try:
+        while True:
+            ready = []
+            now = time.monotonic()
+            for path, (size, changed_at) in list(candidates.items()):
+                try:
+                    current = os.path.getsize(path)
+                except OSError:
+                    candidates.pop(path, None)
+                    continue
+                if current != size:
+                    candidates[path] = (current, now)
+                elif now - changed_at >= settle_seconds:
+                    candidates.pop(path)
+                    file_customer = _customer_for(path, source_dir, customer)
+                    if file_customer:
+                        ready.append((path, file_customer))
+                    else:
+                        logger.warning(f"Skipping {path}: no customer (use --customer or a per-customer subfolder)")
+            if ready:
+                stats = ingest_files(ready, source_dir, workers, batch_size)
+                print(format_summary(stats), flush=True)
+                notified = _notify(stats, source_dir) or notified
+            time.sleep(min(1.0, settle_seconds))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+    return notified
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest EDI forecast prints without the web UI")
+    parser.add_argument("source", help="Directory with EDI prints (.txt/.csv); one subfolder per customer unless --customer is given")
+    parser.add_argument("--customer", help="Customer for all files in the directory")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help=f"Parser processes (default {PARSE_WORKERS})")
+    parser.add_argument("--batch-size", type=int, default=50, help="Files parsed and saved per batch (default 50)")
+    parser.add_argument("--watch", action="store_true", help="Keep watching the directory for new files")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds a new file must stay unchanged before import (watch mode)")
+    parser.add_argument("--dry-run", action="store_true", help="Only parse and validate, do not save or move files")
+    args = parser.parse_args(argv)
+    if args.watch and args.dry_run:
+        parser.error("--dry-run cannot be combined with --watch")
+    ensure_data_dirs()
+
+    source_dir = os.path.abspath(args.source)
+    if not os.path.isdir(source_dir):
+        parser.error(f"Not a directory: {args.source}")
+
+    if args.watch:
+        notified = watch(source_dir, args.customer, args.workers, args.batch_size, args.settle)
+    else:
+        files = collect_files(source_dir, args.customer)
+        if not files:
+            print(f"No EDI files found in {source_dir}")
+            return 0
+        stats = ingest_files(files, source_dir, args.workers, args.batch_size, dry_run=args.dry_run)
+        print(format_summary(stats))
+        notified = not args.dry_run and _notify(stats, source_dir)
+
+    # Le notifiche sono inviate in background: si attende lo svuotamento della coda, solo
+    # se ne è stata accodata una (la coda avviata recupera anche l'outbox condiviso con l'app)
+    if notified:
+        get_dispatch_queue().flush(timeout=30)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import streamlit as st
+from datetime import timedelta
+
+from src.utils.sidebar_style import apply_sidebar_style
+from src.utils.logger import setup_logger
+from src.utils.forecast_index import (
+    sync_index, count_forecasts, list_customers, query_demand, list_demand_articles, list_demand_weeks
+)
+from src.edi.demand import demand_pivot, week_start
+
+# Inizializza il logger per questa pagina
+logger = setup_logger("demand_page")
+
+
+def page():
+    apply_sidebar_style()
+
+    st.session_state.on_upload_page = False
+
+    if "user_email" not in st.session_state:
+        logger.warning("Demand page accessed without authentication")
+        st.warning("🔒 You must be logged in to access this page.")
+        return
+
+    user_email = st.session_state.get("user_email")
+
+    st.title("📈 :orange[Demand by Article and Week]")
+    st.divider()
+    st.markdown(":yellow[Total quantity per article and ISO delivery week across all current forecasts.]")
+    st.markdown("")
+
+    # Allinea il catalogo (e i rollup) ai forecast presenti su disco
+    sync_index()
+    if not count_forecasts():
+        st.info("🔭 No forecast records found. Upload and save forecasts first.")
+        return
+
+    # -------------------------------
+    # 🔎 Filtri
+    # -------------------------------
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        customer_filter = st.selectbox("Customer", options=["All"] + list_customers(), key="demand_customer")
+    selected_customer = None if customer_filter == "All" else customer_filter
+
+    with col2:
+        articles = st.multiselect(
+            "Articles (COD. ART)",
+            options=list_demand_articles(selected_customer),
+            placeholder="All articles",
+            key="demand_articles",
+        )
+
+    weeks = list_demand_weeks(selected_customer)
+    if not weeks:
+        st.warning("⚠️ No rows with a valid article, quantity and delivery date for the selected customer.")
+        return
+    if len(weeks) > 1:
+        week_from, week_to = st.select_slider(
+            "Delivery weeks",
+            options=weeks,
+            value=(weeks[0], weeks[-1]),
+            key="demand_weeks",
+        )
+    else:
+        week_from = week_to = weeks[0]
+    st.caption(f"Deliveries from {week_start(week_from):%d/%m/%Y} to "
+               f"{week_start(week_to) + timedelta(days=6):%d/%m/%Y}")
+
+    demand = query_demand(selected_customer, articles or None, week_from, week_to)
+    logger.debug(f"User {user_email} queried demand: customer={customer_filter}, "
+                 f"{len(articles)} articles, {week_from}..{week_to} -> {len(demand)} rows")
+    if demand.empty:
+        st.warning("⚠️ No demand matches the selected filters.")
+        return
+
+    # -------------------------------
+    # 📊 Riepilogo
+    # -------------------------------
+    col_a, col_b, col_c, col_d = st.columns(4)
+    col_a.metric("Articles", demand["article"].nunique())
+    col_b.metric("Weeks", demand["week"].nunique())
+    col_c.metric("Total quantity", f"{demand['quantity'].sum():,.2f}")
+    col_d.metric("Forecast rows", int(demand["rows"].sum()))
+
+    pivot = demand_pivot(demand)
+    tab_pivot, tab_chart, tab_detail = st.tabs(["📋 Article × week", "📊 Weekly total", "📄 Detail"])
+
+    with tab_pivot:
+        st.dataframe(pivot, width='stretch', height=500)
+        st.download_button(
+            label="📥 Download CSV",
+            data=pivot.to_csv(sep=";", decimal=",").encode("utf-8-sig"),
+            file_name=f"demand_{customer_filter}_{week_from}_{week_to}.csv",
+            mime="text/csv",
+        )
+
+    with tab_chart:
+        weekly = demand.groupby("week")["quantity"].sum()
+        st.bar_chart(weekly, x_label="ISO week", y_label="Quantity")
+
+    with tab_detail:
+        st.dataframe(
+            demand.rename(columns={"article": "COD. ART", "week": "Week", "quantity": "Quantity",
+                                   "rows": "Rows", "forecasts": "Forecasts"}),
+            width='stretch',
+            hide_index=True,
+        )
@@ -1,6 +1,7 @@
 import streamlit as st
 from utils.sidebar_style import apply_sidebar_style
 import sys
+from importlib import metadata
 from src.utils.config import APP_NAME, APP_VERSION
 
 def page():
@@ -39,16 +40,15 @@ def page():
             st.metric(label="🐍 Python", value=f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}")
         
         with col_v2:
+            # Versioni dai metadati dei pacchetti: importare pandas/openpyxl rallenterebbe la pagina iniziale
             try:
-                import pandas as pd
-                pandas_version = pd.__version__
-            except:
+                pandas_version = metadata.version("pandas")
+            except metadata.PackageNotFoundError:
                 pandas_version = "N/A"
             
             try:
-                import openpyxl
-                openpyxl_version = openpyxl.__version__
-            except:
+                openpyxl_version = metadata.version("openpyxl")
+            except metadata.PackageNotFoundError:
                 openpyxl_version = "N/A"
             
             st.metric(label="🐼 Pandas", value=pandas_version)
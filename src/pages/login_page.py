@@ -3,8 +3,8 @@ import time
 from src.utils.sidebar_style import apply_sidebar_style
 from src.utils.auth import send_login_code, verify_token, get_user_by_email
 from src.utils.logger import setup_logger
-from src.utils.notification_utils import apprise_send_notification
-from utils.config import APP_NAME
+from src.utils.notification_utils import apprise_queue_notification
+from src.utils.config import APP_NAME
 
 
 # Inizializza il logger per questa pagina
@@ -74,7 +74,7 @@ def page():
                     logger.info(f"User logged in successfully: {login_email}")
                     st.success("✅ Logged in successfully!")
                     # Notifica di successo con markdown e priorità corretta
-                    retcode, retmsg = apprise_send_notification(
+                    retcode, retmsg = apprise_queue_notification(
                         title=f"🔑 {APP_NAME}: User Login",
                         message=f"User with email **{login_email}** has logged in successfully.",
                         priority=1,  # Default priority
@@ -91,7 +91,7 @@ def page():
                 else:
                     logger.warning(f"Login failed for {login_email}: {msg}")
                     st.error(f"{msg or 'Invalid or expired OTP.'}")
-                    retcode, retmsg = apprise_send_notification(
+                    retcode, retmsg = apprise_queue_notification(
                         title=f"❌ {APP_NAME}: Failed Login Attempt",
                         message=f"Error: failed login attempt for email **{login_email}**.\nReason: *{msg or 'Invalid or expired OTP.'}*",
                         priority=5,
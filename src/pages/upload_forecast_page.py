@@ -1,52 +1,446 @@
 import streamlit as st
 import pandas as pd
 import os
-from datetime import datetime
 import io
-import json
+import time
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 from src.utils.sidebar_style import apply_sidebar_style
-from src.utils.config import OUTPUT_DIR, BACKUP_DIR
+from src.utils.config import OUTPUT_DIR, FORECAST_CACHE_MAX_ENTRIES
 from src.utils.logger import setup_logger
-from src.utils.notification_utils import apprise_send_notification
-from utils.config import APP_NAME
+from src.utils.notification_utils import apprise_queue_notification
+from src.edi.parser import parse_edi_bytes, EDIParseError
+from src.edi.batch import expand_uploads, parse_many
+from src.edi.pipeline import save_forecast, save_batch, find_existing_forecast
+from src.edi.diff import diff_forecasts, summarize, has_changes
+from src.edi.schema import to_compact, to_display, QUANTITY_COLUMN, DATE_COLUMN
+from src.edi.patch_log import PatchLog
+from src.utils.forecast_store import read_forecast
+from src.utils.forecast_index import find_by_content_hash, compute_content_hash
+from src.utils.session_store import put, release, session_usage
+from src.utils.metrics import timer, observe
+from src.utils.config import APP_NAME
 
 # Inizializza il logger per questa pagina
 logger = setup_logger("upload_forecast_page")
 
+# Oltre questo numero di righe l'anteprima delle differenze va attivata a mano:
+# ricalcolarla ad ogni modifica costerebbe quanto l'intero forecast
+PREVIEW_AUTO_MAX_ROWS = 10_000
 
+CUSTOMERS = ["", "Navistar", "Volvo", "Man", "Scania", "Iveco", "Renault", "DAF", "Mercedes-Benz"]
+
+
+@timer("find_existing_forecast_seconds")
 def find_existing_json(uploaded_filename):
     """
-    Cerca un file JSON esistente in OUTPUT_DIR che corrisponde al filename caricato.
-    Ritorna il path completo del JSON se trovato, altrimenti None.
+    Cerca nel catalogo il forecast che corrisponde al filename caricato.
+    Ritorna il path completo del forecast (JSON o Parquet) se trovato, altrimenti None.
     """
-    if not uploaded_filename:
-        return None
-    
-    base_name = os.path.splitext(uploaded_filename)[0].lower()
-    
+    json_path = find_existing_forecast(uploaded_filename)
+    if json_path:
+        logger.debug(f"Found existing JSON for {uploaded_filename}: {json_path}")
+    return json_path
+
+
+@st.cache_data(max_entries=FORECAST_CACHE_MAX_ENTRIES, show_spinner=False)
+def load_saved_forecast(path, mtime_ns):
+    """Forecast già salvato; `mtime_ns` invalida la cache quando il file cambia."""
+    _, df = read_forecast(path)
+    return df
+
+
+def compare_with_saved(existing_path, df):
+    """Confronto tra i dati caricati e il forecast già salvato per lo stesso file."""
+    saved = load_saved_forecast(existing_path, os.stat(existing_path).st_mtime_ns)
+    return diff_forecasts(saved, to_display(df))
+
+
+def editor_column_config(df):
+    """Formato di QUANTITA e CONSEGNA nel data editor quando sono tipizzate (src.edi.schema)."""
+    config = {}
+    if pd.api.types.is_float_dtype(df[QUANTITY_COLUMN]):
+        config[QUANTITY_COLUMN] = st.column_config.NumberColumn(QUANTITY_COLUMN, format="%.2f", step=0.01)
+    if pd.api.types.is_datetime64_any_dtype(df[DATE_COLUMN]):
+        config[DATE_COLUMN] = st.column_config.DateColumn(DATE_COLUMN, format="DD.MM.YYYY")
+    return config
+
+
+def show_changes_preview(existing_path, df):
+    """Anteprima delle differenze rispetto al forecast che verrà sovrascritto."""
+    st.markdown("### 🔍 Changes compared to the saved forecast")
     try:
-        if not os.path.exists(OUTPUT_DIR):
-            return None
-            
-        for f in os.listdir(OUTPUT_DIR):
-            if f.endswith(".json"):
-                json_path = os.path.join(OUTPUT_DIR, f)
+        diff = compare_with_saved(existing_path, df)
+    except Exception as e:
+        logger.warning(f"Error comparing with saved forecast {existing_path}: {e}")
+        st.warning(f"⚠️ Unable to compare with the saved forecast: {e}")
+        return
+
+    if not has_changes(diff):
+        st.info("ℹ️ No changes: the data is identical to the saved forecast.")
+        return
+
+    counts = summarize(diff)
+    col_added, col_removed, col_changed, col_unchanged, col_qty = st.columns(5)
+    with col_added:
+        st.metric("Added rows", counts["added"])
+    with col_removed:
+        st.metric("Removed rows", counts["removed"])
+    with col_changed:
+        st.metric("Changed rows", counts["changed"])
+    with col_unchanged:
+        st.metric("Unchanged rows", counts["unchanged"])
+    with col_qty:
+        st.metric("Net quantity change", f"{counts['quantity_delta']:+,.2f}")
+
+    tab_added, tab_removed, tab_changed = st.tabs([
+        f"➕ Added ({counts['added']})", f"➖ Removed ({counts['removed']})", f"✏️ Changed ({counts['changed']})"
+    ])
+    for tab, frame in ((tab_added, diff["added"]), (tab_removed, diff["removed"]), (tab_changed, diff["changed"])):
+        with tab:
+            if len(frame):
+                st.dataframe(frame, width='stretch', hide_index=True, height=min(400, 38 + 35 * len(frame)))
+            else:
+                st.caption("No rows.")
+
+
+def edit_forecast_page(df_forecast, log, widget_version):
+    """
+    Data editor a pagine: riceve solo la finestra di righe selezionata e registra
+    le modifiche nel PatchLog, che le applica al DataFrame completo solo al salvataggio.
+    """
+    total = len(log.live_labels(df_forecast))
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+    with col_size:
+        page_size = st.selectbox("Rows per page", options=[100, 500, 1000, 5000], index=1,
+                                 key=f"editor_size_{widget_version}")
+    total_pages = max((total + page_size - 1) // page_size, 1)
+    # Righe eliminate possono ridurre le pagine sotto quella selezionata
+    if st.session_state.get(f"editor_page_{widget_version}", 1) > total_pages:
+        st.session_state[f"editor_page_{widget_version}"] = total_pages
+    with col_page:
+        page_no = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1,
+                                  key=f"editor_page_{widget_version}")
+    offset = (page_no - 1) * page_size
+    with col_info:
+        st.markdown("")
+        st.markdown(f"**Rows {min(offset + 1, total)}-{min(offset + page_size, total)} of {total}** "
+                    f"(Page {page_no}/{total_pages})")
+
+    # Un widget per pagina: cambiando pagina le modifiche della precedente vengono consolidate
+    editor_key = f"data_editor_{widget_version}_{page_size}_{page_no}"
+    with timer("editor_window_seconds"):
+        window = log.window(df_forecast, offset, offset + page_size, editor_key)
+    edited = st.data_editor(
+        window,
+        width='stretch',
+        num_rows="dynamic",
+        disabled=["Index"],
+        column_config=editor_column_config(df_forecast),
+        height=400,
+        key=editor_key
+    )
+    log.stage(editor_key, window, edited, st.session_state.get(editor_key) or {})
+
+    changes = log.summary()
+    if any(changes.values()):
+        st.caption(f"✏️ {changes['edited_cells']} cells edited, {changes['added_rows']} rows added, "
+                   f"{changes['deleted_rows']} rows deleted - applied to the full forecast on save")
+
+
+def session_id():
+    """Id della sessione Streamlit corrente (chiave dei dati nel session store)."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+
+def show_memory_gauge():
+    """Memoria usata dai dati caricati: sessione corrente e tutte le sessioni del processo."""
+    usage = session_usage(session_id())
+    mb = 1024 * 1024
+    text = f"🧠 Session memory: {usage['session_bytes'] / mb:.1f} / {usage['session_budget'] / mb:.0f} MB"
+    if usage["session_disk_bytes"]:
+        text += f" (+{usage['session_disk_bytes'] / mb:.1f} MB spilled to disk)"
+    text += (f" · All sessions: {usage['total_bytes'] / mb:.1f} / {usage['global_budget'] / mb:.0f} MB "
+             f"({usage['sessions']} active)")
+    st.progress(min(usage["session_bytes"] / usage["session_budget"], 1.0) if usage["session_budget"] else 1.0, text=text)
+
+
+def reset_single_state():
+    """Azzera l'upload singolo e rilascia i dati caricati dal session store."""
+    release(session_id(), "upload/")
+    st.session_state.df_forecast = None
+    st.session_state.patch_log = None
+    st.session_state.cliente_selezionato = None
+    st.session_state.uploaded_file_name = None
+    st.session_state.uploaded_file_content = None
+    st.session_state.show_save_summary = False
+    st.session_state.save_summary_data = None
+
+
+def reset_batch_state():
+    release(session_id(), "batch/")
+    st.session_state.batch_results = None
+    st.session_state.batch_customer = None
+    st.session_state.batch_parse_s = None
+    st.session_state.batch_summary = None
+
+
+def batch_validation_status(result):
+    """Esito di validazione di un file del lotto mostrato nella tabella riepilogativa."""
+    if not result["ok"]:
+        return f"❌ {result['error']}"
+    if result.get("existing"):
+        changes = result.get("changes")
+        if changes:
+            return (f"⚠️ Overwrites `{result['existing']}` "
+                    f"(+{changes['added']} / -{changes['removed']} / ~{changes['changed']} rows)")
+        return f"⚠️ Overwrites `{result['existing']}`"
+    if result.get("duplicate"):
+        return f"⚠️ Identical to `{result['duplicate']}`"
+    return "✅ Valid"
+
+
+def batch_upload_section(user_email):
+    """Upload multiplo: più file (o archivi zip) analizzati in parallelo e salvati in un'unica operazione."""
+    st.session_state.setdefault("batch_results", None)
+    st.session_state.setdefault("batch_customer", None)
+    st.session_state.setdefault("batch_parse_s", None)
+    st.session_state.setdefault("batch_summary", None)
+    st.session_state.setdefault("widget_version", 0)
+    widget_version = st.session_state["widget_version"]
+
+    # Se abbiamo già salvato, mostra solo il summary
+    summary = st.session_state.batch_summary
+    if summary:
+        st.divider()
+        saved = [s for s in summary["files"] if s["ok"]]
+        if len(saved) == len(summary["files"]):
+            st.success(f"### ✅ {len(saved)} files saved successfully!")
+        else:
+            st.warning(f"### ⚠️ {len(saved)} of {len(summary['files'])} files saved")
+
+        with st.expander("📋 Summary of saved files", expanded=True):
+            st.markdown(f"**Customer:** {summary['customer']}  \n**Total save time:** {summary['save_s']:.2f} s")
+            st.dataframe(
+                pd.DataFrame([{
+                    "File": s["original_filename"],
+                    "Status": "✅ Saved" if s["ok"] else f"❌ {s['error']}",
+                    "Rows": s["records_count"],
+                    "Forecast": s.get("json_filename", ""),
+                    "Action": s.get("action_msg", ""),
+                    "Revision": (s.get("revision") or {}).get("revision"),
+                    "Backup": f"#{s['backup']['id']}" if s.get("backup") else "",
+                    "Save (ms)": round(s["save_s"] * 1000, 1),
+                } for s in summary["files"]]),
+                width='stretch',
+                hide_index=True
+            )
+
+        st.divider()
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col2:
+            if st.button("🔄 Reset interface and start new upload", type="primary", width='stretch', key="reset_after_batch_save"):
+                logger.info(f"User {user_email} reset interface after batch save")
+                reset_batch_state()
+                st.session_state["widget_version"] += 1
+                st.rerun()
+        return
+
+    st.markdown("### ⚙️ Upload parameters")
+
+    cliente = st.selectbox(
+        "Customer",
+        options=CUSTOMERS,
+        index=0,
+        key=f"batch_cliente_input_{widget_version}",
+        placeholder="Select a customer..."
+    )
+
+    uploaded_files = st.file_uploader(
+        label="📄 Upload EDI files (.txt, .csv or .zip archives)",
+        type=["txt", "csv", "zip"],
+        key=f"batch_file_uploader_{widget_version}",
+        help="Each file must use '!' as the delimiter. Zip archives are expanded and their .txt/.csv files are processed.",
+        accept_multiple_files=True
+    )
+
+    data_already_loaded = st.session_state.batch_results is not None
+
+    if st.button(
+        "⬆️ Upload and validate files",
+        width='stretch',
+        disabled=data_already_loaded,
+        help="Upload is disabled because files are already loaded. Click 'Clear all' to upload new files." if data_already_loaded else "Parse and validate all selected files"
+    ):
+        if not cliente:
+            logger.warning(f"Batch upload failed for {user_email}: no customer selected")
+            st.error("❌ Select a customer first.")
+            st.stop()
+
+        if not uploaded_files:
+            logger.warning(f"Batch upload failed for {user_email}: no files selected")
+            st.error("❌ Select at least one file to upload.")
+            st.stop()
+
+        files, rejected = expand_uploads([(f.name, f.getvalue()) for f in uploaded_files])
+        for result in rejected:
+            logger.warning(f"Batch upload by {user_email}: archive {result['name']} rejected ({result['error']})")
+
+        if not files and not rejected:
+            st.error("❌ No .txt or .csv files found in the upload.")
+            st.stop()
+
+        with st.spinner(f"Parsing {len(files)} files..."):
+            start = time.perf_counter()
+            results = parse_many(files)
+            parse_s = time.perf_counter() - start
+        for result in results:
+            if result["ok"]:
+                observe("parse_seconds", result["parse_s"], mode="batch")
+
+        seen_names = set()
+        for result, (_, data) in zip(results, files):
+            if not result["ok"]:
+                continue
+            result["content"] = data.decode("utf-8")
+            name_key = os.path.splitext(result["name"])[0].lower()
+            if name_key in seen_names:
+                result.update(ok=False, error="Duplicate file name in this upload.")
+                continue
+            seen_names.add(name_key)
+            existing = find_existing_json(result["name"])
+            result["existing"] = os.path.basename(existing) if existing else None
+            if existing:
                 try:
-                    with open(json_path, "r", encoding="utf-8") as jf:
-                        data = json.load(jf)
-                    if isinstance(data, dict):
-                        original = os.path.splitext(data.get("original_filename", ""))[0].lower()
-                        if original == base_name:
-                            logger.debug(f"Found existing JSON for {uploaded_filename}: {json_path}")
-                            return json_path
+                    result["changes"] = summarize(compare_with_saved(existing, result["df"]))
                 except Exception as e:
-                    logger.warning(f"Error reading JSON file {f}: {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"Error searching for existing JSON: {e}")
-    
-    return None
+                    logger.warning(f"Error comparing {result['name']} with saved forecast: {e}")
+            duplicate = find_by_content_hash(compute_content_hash(data))
+            if duplicate and duplicate["filename"] != result["existing"]:
+                result["duplicate"] = duplicate["filename"]
+        # Gli archivi scartati compaiono tra i file non validi
+        results += rejected
+
+        # In sessione restano solo gli handle dei dati analizzati
+        for i, result in enumerate(results):
+            if result["ok"]:
+                result["df"] = put(session_id(), f"batch/{i}/df", result["df"])
+                result["content"] = put(session_id(), f"batch/{i}/content", result["content"])
+            else:
+                result["df"] = result["content"] = None
+
+        valid = [r for r in results if r["ok"]]
+        logger.info(
+            f"Batch uploaded by {user_email} - Customer: {cliente} - {len(valid)}/{len(results)} valid files, "
+            f"{sum(r['rows'] for r in valid)} rows, parsed in {parse_s:.2f}s"
+        )
+        st.session_state.batch_results = results
+        st.session_state.batch_customer = cliente
+        st.session_state.batch_parse_s = parse_s
+        st.rerun()
+
+    results = st.session_state.batch_results
+    if results is None:
+        return
+
+    # -------------------------------
+    # 📋 Validation summary
+    # -------------------------------
+    st.divider()
+    st.markdown(f"### 📋 Validation summary - Customer: **{st.session_state.batch_customer}**")
+    show_memory_gauge()
+
+    if st.button("🗑️ Clear all", width='stretch', key="batch_clear_all"):
+        logger.info(f"User {user_email} cleared batch upload")
+        reset_batch_state()
+        st.session_state["widget_version"] += 1
+        st.rerun()
+
+    valid = [r for r in results if r["ok"]]
+    total_rows = sum(r["rows"] for r in valid)
+    parse_s = st.session_state.batch_parse_s or 0
+
+    col_files, col_rows, col_time, col_rate = st.columns(4)
+    with col_files:
+        st.metric("Valid files", f"{len(valid)} / {len(results)}")
+    with col_rows:
+        st.metric("Total rows", total_rows)
+    with col_time:
+        st.metric("Parse time", f"{parse_s:.2f} s")
+    with col_rate:
+        st.metric("Throughput", f"{total_rows / parse_s:,.0f} rows/s" if parse_s else "-")
+
+    st.dataframe(
+        pd.DataFrame([{
+            "File": r["name"],
+            "Status": batch_validation_status(r),
+            "Rows": r["rows"],
+            "Size (KB)": round(r["bytes"] / 1024, 1),
+            "Parse (ms)": round(r["parse_s"] * 1000, 1),
+        } for r in results]),
+        width='stretch',
+        hide_index=True
+    )
+
+    try:
+        for r in valid:
+            with st.expander(f"🔹 {r['name']} ({r['rows']} rows)", expanded=False):
+                df = r["df"].load()
+                st.dataframe(df, width='stretch', height=300, column_config=editor_column_config(df))
+    except KeyError:
+        logger.info(f"Batch upload data of {user_email} expired")
+        reset_batch_state()
+        st.warning("⌛ The uploaded files have expired. Upload them again.")
+        st.stop()
+
+    st.divider()
+
+    # -------------------------------
+    # 💾 Save section
+    # -------------------------------
+    col_spacer1, col_backup, col_spacer2 = st.columns([1, 2, 1])
+    with col_backup:
+        if st.button(
+            f"💾 SAVE ALL ({len(valid)} files)",
+            type="primary",
+            width='stretch',
+            disabled=not valid,
+            key="batch_save",
+            help="Save backups and forecasts for all valid files"
+        ):
+            customer = st.session_state.batch_customer
+            logger.info(f"User {user_email} initiated batch save - Customer: {customer} - {len(valid)} files")
+
+            st.markdown("### 💾 Saving data...")
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+
+            def show_progress(percent, message):
+                progress_bar.progress(percent)
+                status_text.info(message)
+
+            start = time.perf_counter()
+            saved = save_batch(customer, [(r["name"], r["content"].load(), r["df"].load()) for r in valid],
+                               progress=show_progress)
+            save_s = time.perf_counter() - start
+            observe("save_seconds", save_s, mode="batch")
+
+            ok_count = sum(s["ok"] for s in saved)
+            logger.info(f"Batch save completed by {user_email} - {ok_count}/{len(saved)} files saved in {save_s:.2f}s")
+
+            retcode, retmsg = apprise_queue_notification(
+                title=f"✅ {APP_NAME}: Files Saved Successfully",
+                message=f"{ok_count} files for customer {customer} saved successfully by user **{user_email}**.",
+                priority=3,
+            )
+            if not retcode:
+                logger.error(f"Failed to send notification for batch save: {retmsg}")
+
+            st.session_state.batch_summary = {"customer": customer, "files": saved, "save_s": save_s}
+            release(session_id(), "batch/")
+            st.session_state.batch_results = None
+            st.rerun()
 
 
 def page():
@@ -64,7 +458,7 @@ def page():
 
     st.title(f"🎯 :orange[Upload EDI Forecast Requirements]")
     st.divider()
-    st.markdown(":yellow[Use this page to upload EDI forecast files, review the data, and save backups along with a JSON forecast file.]")
+    st.markdown(":yellow[Use this page to upload EDI forecast files, review the data, and save backups along with a forecast file.]")
     st.markdown("")
     st.markdown("")
     
@@ -74,19 +468,31 @@ def page():
     if "on_upload_page" not in st.session_state:
         st.session_state.on_upload_page = True
     
-    if not st.session_state.on_upload_page and st.session_state.get("df_forecast") is not None:
+    if not st.session_state.on_upload_page and (
+        st.session_state.get("df_forecast") is not None or st.session_state.get("batch_results") is not None
+        or st.session_state.get("show_save_summary", False)
+    ):
         logger.debug(f"Auto-reset triggered for user {user_email}")
-        st.session_state.df_forecast = None
-        st.session_state.cliente_selezionato = None
-        st.session_state.uploaded_file_name = None
-        st.session_state.uploaded_file_content = None
-        st.session_state.show_save_summary = False
-        st.session_state.save_summary_data = None
+        reset_batch_state()
+        reset_single_state()
         st.session_state["widget_version"] = st.session_state.get("widget_version", 0) + 1
         st.session_state.on_upload_page = True
         st.rerun()
     
     st.session_state.on_upload_page = True
+
+    # -------------------------------
+    # 🗂️ Upload mode
+    # -------------------------------
+    upload_mode = st.radio(
+        "Upload mode",
+        options=["Single file", "Batch (multiple files or zip)"],
+        horizontal=True,
+        key="upload_mode"
+    )
+    if upload_mode != "Single file":
+        batch_upload_section(user_email)
+        return
     
     # Se abbiamo già salvato, mostra solo il summary
     if st.session_state.get("show_save_summary", False):
@@ -95,6 +501,12 @@ def page():
         
         summary = st.session_state.get("save_summary_data", {})
         if summary:
+            backup = summary.get("backup")
+            backup_line = "N/A"
+            if backup:
+                backup_line = f"#{backup['id']} (`{backup['object']}`)"
+                if backup["deduplicated"]:
+                    backup_line += " - identical content already stored, no new copy written"
             with st.expander("📋 Summary of saved files", expanded=True):
                 st.markdown(f"""
                 **Customer:** {summary.get('customer', 'N/A')}  
@@ -102,22 +514,22 @@ def page():
                 **Records saved:** {summary.get('records_count', 0)} rows
                 
                 **Files created:**
-                - 📄 TXT: `{summary.get('backup_txt_filename', 'N/A')}`
-                - 📊 Excel: `{summary.get('backup_excel_filename', 'N/A')}`
-                - 🗃️ JSON: `{summary.get('json_filename', 'N/A')}` ({summary.get('action_msg', 'saved')})
+                - 📄 Backup: {backup_line}
+                - 🗃️ Forecast: `{summary.get('json_filename', 'N/A')}` ({summary.get('action_msg', 'saved')})
                 """)
+                revision = summary.get("revision")
+                if revision:
+                    changes = revision.get("changes")
+                    detail = (f" - {changes['added']} added, {changes['removed']} removed, {changes['changed']} changed rows"
+                              if changes else "")
+                    st.markdown(f"**Revision:** {revision['revision']} ({revision['kind']}){detail}")
         
         st.divider()
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🔄 Reset interface and start new upload", type="primary", width='stretch', key="reset_after_save"):
                 logger.info(f"User {user_email} reset interface after save")
-                st.session_state.df_forecast = None
-                st.session_state.cliente_selezionato = None
-                st.session_state.uploaded_file_name = None
-                st.session_state.uploaded_file_content = None
-                st.session_state.show_save_summary = False
-                st.session_state.save_summary_data = None
+                reset_single_state()
                 st.session_state["widget_version"] += 1
                 st.rerun()
         
@@ -127,6 +539,7 @@ def page():
     # 📦 Initialize session state
     # -------------------------------
     st.session_state.setdefault("df_forecast", None)
+    st.session_state.setdefault("patch_log", None)
     st.session_state.setdefault("cliente_selezionato", None)
     st.session_state.setdefault("uploaded_file_name", None)
     st.session_state.setdefault("uploaded_file_content", None)
@@ -143,7 +556,7 @@ def page():
     # -------------------------------
     cliente = st.selectbox(
         "Customer",
-        options=["", "Navistar", "Volvo", "Man", "Scania", "Iveco", "Renault", "DAF", "Mercedes-Benz"],
+        options=CUSTOMERS,
         index=0,
         key=f"cliente_input_{widget_version}",
         placeholder="Select a customer..."
@@ -175,6 +588,16 @@ def page():
                 f"If you proceed with the upload and backup, the existing forecast will be **overwritten**."
             )
 
+        # Stesso contenuto già salvato con un nome file diverso
+        duplicate = find_by_content_hash(compute_content_hash(uploaded_file.getvalue()))
+        if duplicate and os.path.join(OUTPUT_DIR, duplicate["filename"]) != existing_json_path:
+            logger.warning(f"User {user_email} uploading content identical to {duplicate['filename']}: {uploaded_file.name}")
+            st.warning(
+                f"⚠️ The content of **{uploaded_file.name}** is identical to an already saved forecast.\n\n"
+                f"**Existing file:** `{duplicate['filename']}` (original file `{duplicate['original_filename']}`, "
+                f"customer **{duplicate['customer']}**)"
+            )
+
     # -------------------------------
     # ⬆️ Upload button
     # -------------------------------
@@ -204,64 +627,29 @@ def page():
             # -------------------------------
             # 📄 Read and parse file
             # -------------------------------
-            content = uploaded_file.getvalue().decode("utf-8")
-            lines = content.split("\n")
+            raw_content = uploaded_file.getvalue()
+            content = raw_content.decode("utf-8")
             st.session_state.uploaded_file_name = uploaded_file.name
-            st.session_state.uploaded_file_content = content
-
-            logger.debug(f"File {uploaded_file.name} read successfully - {len(lines)} lines")
-
-            if len(lines) < 7:
-                logger.warning(f"Upload failed for {user_email}: file too short ({len(lines)} lines)")
-                st.error("❌ The file does not contain enough data.")
-                st.stop()
-
-            headers = ["ORD.HYD", "COD.CLIENTE", "COD. ART", "DESCRIZIONE",
-                       "OCLI GARE", "QUANTITA", "CONSEGNA", "ORD.VEN"]
-
-            data_rows = []
-            for line in lines[6:]:
-                if not line.strip() or line.strip().startswith(("-", "+")):
-                    continue
-                cols = line.split("!")
-                if cols and cols[0].strip() == "":
-                    cols.pop(0)
-                if cols and cols[-1].strip() == "":
-                    cols.pop()
-                if len(cols) >= 8:
-                    data_rows.append([col.strip() for col in cols[:8]])
-
-            if not data_rows:
-                logger.warning(f"Upload failed for {user_email}: no data rows found in {uploaded_file.name}")
-                st.error("❌ No data rows found in the file.")
+            # In sessione restano solo gli handle: i dati sono nel session store (con spill su disco)
+            st.session_state.uploaded_file_content = put(session_id(), "upload/content", content)
+
+            logger.debug(f"File {uploaded_file.name} read successfully - {len(raw_content)} bytes")
+
+            try:
+                # Forma compatta: il DataFrame resta in sessione fino al salvataggio
+                with timer("parse_seconds", mode="single"):
+                    parsed = parse_edi_bytes(raw_content)
+                with timer("dataframe_build_seconds"):
+                    df = to_compact(parsed)
+            except EDIParseError as e:
+                logger.warning(f"Upload failed for {user_email}: {e} ({uploaded_file.name})")
+                st.error(f"❌ {e}")
                 st.stop()
 
-            # -------------------------------
-            # 🧾 Create DataFrame
-            # -------------------------------
-            df = pd.DataFrame(data_rows, columns=headers).dropna(how="all")
-
-            if "CONSEGNA" in df.columns:
-                def format_date(date_str):
-                    try:
-                        date_str = str(date_str).strip()
-                        date_str = ''.join(c for c in date_str if c.isdigit())
-                        
-                        if len(date_str) == 8:
-                            return f"{date_str[:2]}.{date_str[2:4]}.{date_str[4:]}"
-                        elif len(date_str) == 7:
-                            return f"0{date_str[0]}.{date_str[1:3]}.{date_str[3:]}"
-                        elif len(date_str) == 6:
-                            return f"{date_str[:2]}.{date_str[2:4]}.20{date_str[4:]}"
-                        elif len(date_str) == 5:
-                            return f"0{date_str[0]}.{date_str[1:3]}.20{date_str[3:]}"
-                        return date_str
-                    except Exception:
-                        return date_str
-                df["CONSEGNA"] = df["CONSEGNA"].apply(format_date)
-
             df.insert(0, "Index", range(1, len(df) + 1))
-            st.session_state.df_forecast = df
+            st.session_state.df_forecast = put(session_id(), "upload/df", df)
+            # Le modifiche del data editor restano un registro di patch fino al salvataggio
+            st.session_state.patch_log = PatchLog(df)
             st.session_state.cliente_selezionato = cliente
 
             logger.info(f"File uploaded successfully by {user_email}: {uploaded_file.name} - Customer: {cliente} - {len(df)} rows")
@@ -280,28 +668,34 @@ def page():
         st.divider()
         st.markdown(f"### 📋 Loaded data - Customer: **{st.session_state.cliente_selezionato}**")
 
+        try:
+            df_forecast = st.session_state.df_forecast.load()
+        except KeyError:
+            logger.info(f"Loaded data of {user_email} expired")
+            reset_single_state()
+            st.warning("⌛ The loaded data has expired. Upload the file again.")
+            st.stop()
+
         # 🔹 Clear all
         if st.button("🗑️ Clear all", width='stretch'):
             logger.info(f"User {user_email} cleared loaded data")
-            st.session_state.df_forecast = None
-            st.session_state.cliente_selezionato = None
-            st.session_state.uploaded_file_name = None
-            st.session_state.uploaded_file_content = None
-            st.session_state.show_save_summary = False
-            st.session_state.save_summary_data = None
+            reset_single_state()
             st.session_state["widget_version"] += 1
             st.rerun()
 
         # 🔹 Data editor
-        edited_df = st.data_editor(
-            st.session_state.df_forecast,
-            width='stretch',
-            num_rows="dynamic",
-            disabled=["Index"],
-            height=400,
-            key=f"data_editor_{widget_version}"
-        )
-        st.session_state.df_forecast = edited_df
+        patch_log = st.session_state.patch_log
+        if patch_log is None:
+            patch_log = st.session_state.patch_log = PatchLog(df_forecast)
+        edit_forecast_page(df_forecast, patch_log, widget_version)
+        show_memory_gauge()
+
+        existing_path = find_existing_json(st.session_state.uploaded_file_name)
+        if existing_path:
+            st.divider()
+            if st.toggle("🔍 Preview changes compared to the saved forecast",
+                         value=len(df_forecast) <= PREVIEW_AUTO_MAX_ROWS, key=f"preview_changes_{widget_version}"):
+                show_changes_preview(existing_path, patch_log.materialize(df_forecast).drop(columns=['Index']))
 
         st.divider()
 
@@ -324,88 +718,49 @@ def page():
                 logger.info(f"User {user_email} initiated save operation - Customer: {st.session_state.cliente_selezionato}")
                 
                 try:
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    os.makedirs(BACKUP_DIR, exist_ok=True)
-                    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
                     progress_container = st.container()
                     
                     with progress_container:
                         st.markdown("### 💾 Saving data...")
                         progress_bar = st.progress(0)
                         status_text = st.empty()
+
+                        def show_progress(percent, message):
+                            progress_bar.progress(percent)
+                            status_text.info(message)
+
+                        with timer("save_seconds", mode="single"):
+                            summary = save_forecast(
+                                customer=st.session_state.cliente_selezionato,
+                                original_filename=st.session_state.uploaded_file_name,
+                                content=st.session_state.uploaded_file_content.load(),
+                                df=patch_log.materialize(df_forecast).drop(columns=['Index']),
+                                progress=show_progress,
+                            )
                         
-                        # Step 1: TXT backup
-                        status_text.info("📄 Saving TXT backup...")
-                        progress_bar.progress(25)
-                        original_name = os.path.splitext(st.session_state.uploaded_file_name or 'uploaded')[0]
-                        backup_txt_filename = f"BACKUP_{st.session_state.cliente_selezionato}_{original_name}_{timestamp}.txt"
-                        with open(os.path.join(BACKUP_DIR, backup_txt_filename), 'w', encoding='utf-8') as f:
-                            f.write(st.session_state.uploaded_file_content or "")
-                        logger.info(f"TXT backup saved: {backup_txt_filename}")
-                        status_text.success(f"✅ TXT backup saved: `{backup_txt_filename}`")
-                        
-                        # Step 2: Excel backup
-                        status_text.info("📊 Saving Excel backup...")
-                        progress_bar.progress(50)
-                        df_export = st.session_state.df_forecast.drop(columns=['Index'])
-                        backup_excel_filename = f"BACKUP_forecast_{st.session_state.cliente_selezionato}_{timestamp}.xlsx"
-                        df_export.to_excel(os.path.join(BACKUP_DIR, backup_excel_filename),
-                                           index=False, sheet_name='Forecast', engine='openpyxl')
-                        logger.info(f"Excel backup saved: {backup_excel_filename}")
-                        status_text.success(f"✅ Excel backup saved: `{backup_excel_filename}`")
-                        
-                        # Step 3: JSON
-                        status_text.info("🗃️ Saving JSON forecast...")
-                        progress_bar.progress(75)
-                        existing_json = find_existing_json(st.session_state.uploaded_file_name)
-                        
-                        if existing_json:
-                            json_path = existing_json
-                            action_msg = "overwritten"
-                            action_icon = "🔄"
-                            logger.info(f"Overwriting existing JSON: {os.path.basename(json_path)}")
-                        else:
-                            json_filename = f"forecast_{st.session_state.cliente_selezionato}_{timestamp}.json"
-                            json_path = os.path.join(OUTPUT_DIR, json_filename)
-                            action_msg = "created"
-                            action_icon = "✨"
-                            logger.info(f"Creating new JSON: {json_filename}")
-
-                        json_data = {
-                            "customer": st.session_state.cliente_selezionato,
-                            "timestamp": timestamp,
-                            "original_filename": st.session_state.uploaded_file_name,
-                            "records": df_export.to_dict(orient="records")
-                        }
-                        with open(json_path, "w", encoding="utf-8") as f:
-                            json.dump(json_data, f, ensure_ascii=False, indent=4)
-                        
-                        logger.info(f"Save operation completed successfully by {user_email} - {len(df_export)} records")
-                        status_text.success(f"{action_icon} JSON forecast {action_msg}: `{os.path.basename(json_path)}`")
+                        logger.info(f"Save operation completed successfully by {user_email} - {summary['records_count']} records")
+                        action_icon = "🔄" if summary["action_msg"] == "overwritten" else "✨"
+                        status_text.success(f"{action_icon} Forecast {summary['action_msg']}: `{summary['json_filename']}`")
                         
-                        retcode, retmsg = apprise_send_notification(
+                        retcode, retmsg = apprise_queue_notification(
                         title=f"✅ {APP_NAME}: File Saved Successfully",
                         message=f"File {st.session_state.cliente_selezionato}_{st.session_state.uploaded_file_name} saved successfully by user **{user_email}**.",
                         priority=3,  # Default priority
                         #tags=["white_check_mark", "unlock"]  # Emoji tags
                         )
                     if not retcode:
-                        logger.error(f"Failed to send notification for successful login: {retmsg}")
-                        progress_bar.progress(100)
+                        logger.error(f"Failed to send notification for successful save: {retmsg}")
                     
                     st.session_state.show_save_summary = True
-                    st.session_state.save_summary_data = {
-                        "customer": st.session_state.cliente_selezionato,
-                        "original_filename": st.session_state.uploaded_file_name,
-                        "records_count": len(df_export),
-                        "backup_txt_filename": backup_txt_filename,
-                        "backup_excel_filename": backup_excel_filename,
-                        "json_filename": os.path.basename(json_path),
-                        "action_msg": action_msg
-                    }
+                    st.session_state.save_summary_data = summary
+                    # I dati salvati non servono più: si libera subito la sessione
+                    release(session_id(), "upload/")
+                    st.session_state.df_forecast = None
+                    st.session_state.patch_log = None
+                    st.session_state.uploaded_file_content = None
                     st.rerun()
 
                 except Exception as e:
                     logger.error(f"Error during save operation for {user_email}: {e}")
-                    st.error(f"❌ Error during save: {e}")
\ No newline at end of file
+                    # Il salvataggio è transazionale: nessun file è stato modificato
+                    st.error(f"❌ Error during save, nothing was saved: {e}")
\ No newline at end of file
@@ -1,16 +1,156 @@
 import streamlit as st
 import pandas as pd
 import os
-import json
-from datetime import datetime
+from datetime import datetime, date, timedelta
 
 from src.utils.sidebar_style import apply_sidebar_style
 from src.utils.logger import setup_logger
-from src.utils.config import OUTPUT_DIR
+from src.utils.config import OUTPUT_DIR, FORECAST_CACHE_MAX_ENTRIES, EXPORT_POLL_SECONDS
+from src.utils.revision_store import list_revisions, load_revision
+from src.edi.pipeline import delete_forecast
+from src.utils.export_worker import (
+    EXPORT_FORMATS, EXPORT_DONE, EXPORT_PENDING, EXPORT_FAILED,
+    request_export, get_export_status
+)
+from src.utils.metrics import timer
+from src.utils.forecast_index import (
+    sync_index, query_forecasts, count_forecasts, list_customers, get_forecast_stats,
+    query_rows, count_rows
+)
 
 # Inizializza il logger per questa pagina
 logger = setup_logger("view_forecast_page")
 
+
+# -------------------------------
+# 🔎 Righe paginate lato server (dal catalogo, solo la pagina richiesta)
+# -------------------------------
+def show_rows_page(filters, key, hide_columns=()):
+    """Mostra una pagina delle righe che soddisfano `filters` (vedi query_rows)."""
+    total = count_rows(**filters)
+    if not total:
+        st.info("🔭 No rows match the search.")
+        return
+
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+    with col_size:
+        page_size = st.selectbox("Rows per page", options=[25, 50, 100, 500], index=1, key=f"{key}_size")
+    total_pages = (total + page_size - 1) // page_size
+    # Filtri più restrittivi possono ridurre le pagine sotto quella selezionata
+    if st.session_state.get(f"{key}_page", 1) > total_pages:
+        st.session_state[f"{key}_page"] = total_pages
+    with col_page:
+        page_no = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1, key=f"{key}_page")
+    offset = (page_no - 1) * page_size
+    with col_info:
+        st.markdown("")
+        st.markdown(f"**Rows {offset + 1}-{min(offset + page_size, total)} of {total}** (Page {page_no}/{total_pages})")
+
+    with timer("row_query_seconds"):
+        rows = query_rows(limit=page_size, offset=offset, **filters)
+    st.dataframe(rows.drop(columns=list(hide_columns)), width='stretch', hide_index=True)
+
+
+def row_search_section(customers):
+    """Ricerca per articolo, ordine, codice cliente e data di consegna su tutti i forecast correnti."""
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        article = st.text_input("COD. ART", placeholder="e.g. 108641N91", key="search_article")
+    with col2:
+        order = st.text_input("ORD.VEN", key="search_order")
+    with col3:
+        customer_code = st.text_input("COD.CLIENTE", key="search_customer_code")
+    with col4:
+        customer = st.selectbox("Customer", options=["All"] + customers, key="search_customer")
+
+    col_period, col_range = st.columns([1, 3])
+    with col_period:
+        period = st.selectbox(
+            "Delivery",
+            options=["Any date", "Next 30 days", "Next 90 days", "Custom range"],
+            key="search_period",
+        )
+    date_from = date_to = None
+    if period in ("Next 30 days", "Next 90 days"):
+        date_from = date.today()
+        date_to = date_from + timedelta(days=int(period.split()[1]))
+    elif period == "Custom range":
+        with col_range:
+            selected = st.date_input("Delivery dates", value=(date.today(), date.today() + timedelta(days=90)),
+                                     format="DD/MM/YYYY", key="search_dates")
+        if isinstance(selected, (tuple, list)) and len(selected) == 2:
+            date_from, date_to = selected
+
+    filters = {
+        "customer": None if customer == "All" else customer,
+        "article": article.strip() or None,
+        "order": order.strip() or None,
+        "customer_code": customer_code.strip() or None,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+    if not any(filters.values()):
+        st.caption("Enter an article, order or customer code, or choose a delivery period.")
+        return
+    show_rows_page(filters, key="search_rows")
+
+
+# -------------------------------
+# 🕓 Storico delle revisioni
+# -------------------------------
+@st.cache_data(max_entries=FORECAST_CACHE_MAX_ENTRIES, show_spinner=False)
+def load_revision_frame(original_filename, revision, fingerprint):
+    """Revisione ricostruita dallo storico; le revisioni non cambiano, `fingerprint` distingue storici ricreati."""
+    with timer("revision_load_seconds"):
+        _, df = load_revision(original_filename, revision)
+    return df
+
+
+def show_history(original_filename, json_file):
+    """Elenco delle revisioni del file originale e visualizzazione di una revisione passata."""
+    revisions = list_revisions(original_filename)
+    if not revisions:
+        st.info("ℹ️ No revision history for this file yet.")
+        return
+
+    history_df = pd.DataFrame([{
+        "Revision": r["revision"],
+        "Saved": r.get("timestamp"),
+        "Rows": r["row_count"],
+        "Added": (r.get("changes") or {}).get("added"),
+        "Removed": (r.get("changes") or {}).get("removed"),
+        "Changed": (r.get("changes") or {}).get("changed"),
+        "Qty Δ": (r.get("changes") or {}).get("quantity_delta"),
+        "Stored": r["kind"],
+    } for r in reversed(revisions)])
+    st.dataframe(history_df, width='stretch', hide_index=True)
+
+    by_number = {r["revision"]: r for r in revisions}
+    selected = st.selectbox(
+        "View revision",
+        options=list(reversed(by_number)),
+        format_func=lambda n: f"Revision {n} - {by_number[n].get('timestamp')}",
+        key=f"revision_{json_file}",
+    )
+    header = by_number[selected]
+    try:
+        df = load_revision_frame(original_filename, selected, header["fingerprint"])
+        st.dataframe(df, width='stretch', height=300)
+    except Exception as e:
+        logger.error(f"Error rebuilding revision {selected} of {original_filename}: {e}")
+        st.error(f"❌ Error rebuilding revision {selected}: {e}")
+
+
+@st.fragment(run_every=EXPORT_POLL_SECONDS)
+def export_progress(forecast_path, fmt):
+    """Interroga lo stato dell'export finché è in corso, poi ricarica la pagina."""
+    status = get_export_status(forecast_path, fmt)
+    if status["state"] == EXPORT_PENDING:
+        st.info(f"⏳ Preparing {EXPORT_FORMATS[fmt]['label']} file...")
+    else:
+        st.rerun()
+
+
 def page():
     apply_sidebar_style()
 
@@ -35,31 +175,30 @@ def page():
         st.info("🔭 No forecast records found. Upload and save forecasts first.")
         return
 
-    json_files = [f for f in os.listdir(OUTPUT_DIR) if f.endswith('.json')]
+    # Un solo listing della directory per allineare il catalogo
+    with timer("catalog_sync_seconds"):
+        sync_index()
+    total_files = count_forecasts()
     
-    if not json_files:
-        logger.debug(f"No JSON files found in output directory for user {user_email}")
+    if not total_files:
+        logger.debug(f"No forecast files found in output directory for user {user_email}")
         st.info("🔭 No forecast records found. Upload and save forecasts first.")
         return
     
-    json_files.sort(reverse=True)
-    logger.debug(f"Found {len(json_files)} forecast records for user {user_email}")
+    logger.debug(f"Found {total_files} forecast records for user {user_email}")
     
-    st.markdown(f"### 📊 Found **{len(json_files)}** forecast records")
+    with st.expander("🔎 Search forecast rows", expanded=False):
+        row_search_section(list_customers())
+    
+    st.markdown(f"### 📊 Found **{total_files}** forecast records")
     
     # Filtri
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        customers = set()
-        for filename in json_files:
-            parts = filename.replace('forecast_', '').replace('.json', '').split('_')
-            if len(parts) >= 1:
-                customers.add(parts[0])
-        
         customer_filter = st.selectbox(
             "Filter by customer",
-            options=["All"] + sorted(list(customers)),
+            options=["All"] + list_customers(),
             index=0
         )
     
@@ -79,15 +218,12 @@ def page():
         )
     
     # Applica filtri
-    filtered_files = json_files
-    if customer_filter != "All":
-        filtered_files = [f for f in json_files if f.startswith(f"forecast_{customer_filter}_")]
-        logger.debug(f"User {user_email} filtered by customer: {customer_filter} - {len(filtered_files)} results")
+    selected_customer = None if customer_filter == "All" else customer_filter
+    stats = get_forecast_stats(selected_customer)
+    if selected_customer:
+        logger.debug(f"User {user_email} filtered by customer: {customer_filter} - {stats['records']} results")
     
-    if date_filter == "Oldest first":
-        filtered_files = sorted(filtered_files)
-    
-    if not filtered_files:
+    if not stats["records"]:
         logger.debug(f"No records match filters for user {user_email}")
         st.warning("⚠️ No records match the selected filters.")
         return
@@ -95,7 +231,7 @@ def page():
     # -------------------------------
     # 📄 Paginazione
     # -------------------------------
-    total_records = len(filtered_files)
+    total_records = stats["records"]
     total_pages = (total_records + items_per_page - 1) // items_per_page
     
     if "current_page" not in st.session_state:
@@ -123,71 +259,97 @@ def page():
         st.markdown("")
         st.markdown(f"**Showing records {start_idx + 1}-{end_idx} of {total_records}** (Page {st.session_state.current_page}/{total_pages})")
     
-    page_files = filtered_files[start_idx:end_idx]
+    with timer("forecast_list_seconds"):
+        page_entries = query_forecasts(
+            customer=selected_customer,
+            newest_first=(date_filter == "Newest first"),
+            limit=items_per_page,
+            offset=start_idx,
+        )
     
-    # Visualizza i forecast
-    for json_file in page_files:
+    # Visualizza i forecast: l'intestazione usa solo il catalogo,
+    # dati ed export vengono caricati solo su richiesta
+    for entry in page_entries:
+        json_file = entry["filename"]
         json_path = os.path.join(OUTPUT_DIR, json_file)
         
+        customer = entry["customer"]
+        timestamp = entry["timestamp"]
+        original_filename = entry["original_filename"] or "N/A"
+        records = entry["row_count"]
+        
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            dt = datetime.strptime(timestamp, '%Y%m%d_%H%M%S')
+            display_date = dt.strftime('%d/%m/%Y %H:%M:%S')
+        except:
+            display_date = timestamp
+        
+        with st.expander(f"🔹 **{customer}** - {display_date} ({records} rows)", expanded=False):
+            st.markdown(f"**Original file:** `{original_filename}`")
+            st.markdown(f"**Timestamp:** {display_date}")
+            st.markdown(f"**Records:** {records}")
+            
+            if records:
+                show_data = st.toggle("📂 Show data", key=f"show_{json_file}")
+                if show_data:
+                    try:
+                        show_rows_page({"filename": json_file}, key=f"rows_{json_file}",
+                                       hide_columns=("Customer", "Forecast"))
+                    except Exception as e:
+                        logger.error(f"Error reading forecast rows of {json_file} for user {user_email}: {e}")
+                        st.error(f"❌ Error reading rows of `{json_file}`: {e}")
+            else:
+                st.warning("⚠️ No data records found in this file.")
             
-            customer = data.get('customer', 'Unknown')
-            timestamp = data.get('timestamp', '')
-            original_filename = data.get('original_filename', 'N/A')
-            records = data.get('records', [])
+            if entry["original_filename"] and st.toggle("🕓 Show history", key=f"history_{json_file}"):
+                show_history(entry["original_filename"], json_file)
             
-            try:
-                dt = datetime.strptime(timestamp, '%Y%m%d_%H%M%S')
-                display_date = dt.strftime('%d/%m/%Y %H:%M:%S')
-            except:
-                display_date = timestamp
+            col_download, col_delete = st.columns(2)
             
-            with st.expander(f"🔹 **{customer}** - {display_date} ({len(records)} rows)", expanded=False):
-                st.markdown(f"**Original file:** `{original_filename}`")
-                st.markdown(f"**Timestamp:** {display_date}")
-                st.markdown(f"**Records:** {len(records)}")
-                
+            with col_download:
                 if records:
-                    df = pd.DataFrame(records)
-                    st.dataframe(df, width='stretch', height=300)
+                    fmt = st.selectbox(
+                        "Export format",
+                        options=list(EXPORT_FORMATS),
+                        format_func=lambda f: EXPORT_FORMATS[f]["label"],
+                        key=f"export_format_{json_file}",
+                        label_visibility="collapsed"
+                    )
+                    status = get_export_status(json_path, fmt)
                     
-                    col_download, col_delete = st.columns(2)
-                    
-                    with col_download:
-                        import io
-                        buffer = io.BytesIO()
-                        df.to_excel(buffer, index=False, sheet_name='Forecast', engine='openpyxl')
-                        excel_bytes = buffer.getvalue()
-                        
+                    if status["state"] == EXPORT_DONE:
+                        with open(status["path"], "rb") as f:
+                            export_bytes = f.read()
                         if st.download_button(
-                            label="📥 Download Excel",
-                            data=excel_bytes,
-                            file_name=f"forecast_{customer}_{timestamp}.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            label=f"📥 Download {EXPORT_FORMATS[fmt]['label']}",
+                            data=export_bytes,
+                            file_name=f"forecast_{customer}_{timestamp}{EXPORT_FORMATS[fmt]['extension']}",
+                            mime=EXPORT_FORMATS[fmt]["mime"],
                             width='stretch',
-                            key=f"download_{json_file}"
+                            key=f"download_{json_file}_{fmt}"
                         ):
-                            logger.info(f"User {user_email} downloaded forecast: {json_file}")
-                    
-                    with col_delete:
-                        if st.button("🗑️ Delete record", width='stretch', key=f"delete_{json_file}"):
-                            try:
-                                os.remove(json_path)
-                                logger.info(f"User {user_email} deleted forecast record: {json_file}")
-                                st.success(f"✅ Record deleted: {json_file}")
-                                st.session_state.current_page = 1
-                                st.rerun()
-                            except Exception as e:
-                                logger.error(f"Error deleting file {json_file} by user {user_email}: {e}")
-                                st.error(f"❌ Error deleting file: {e}")
-                else:
-                    st.warning("⚠️ No data records found in this file.")
-        
-        except Exception as e:
-            logger.error(f"Error reading forecast file {json_file} for user {user_email}: {e}")
-            st.error(f"❌ Error reading file `{json_file}`: {e}")
+                            logger.info(f"User {user_email} downloaded forecast: {json_file} ({fmt})")
+                    elif status["state"] == EXPORT_PENDING:
+                        export_progress(json_path, fmt)
+                    else:
+                        if status["state"] == EXPORT_FAILED:
+                            logger.error(f"Error building {fmt} export for {json_file}: {status['error']}")
+                            st.error(f"❌ Error building export file: {status['error']}")
+                        if st.button("📦 Prepare export", width='stretch', key=f"prepare_{json_file}_{fmt}"):
+                            request_export(json_path, fmt)
+                            st.rerun()
+            
+            with col_delete:
+                if st.button("🗑️ Delete record", width='stretch', key=f"delete_{json_file}"):
+                    try:
+                        delete_forecast(customer, entry["original_filename"], json_path)
+                        logger.info(f"User {user_email} deleted forecast record: {json_file}")
+                        st.success(f"✅ Record deleted: {json_file}")
+                        st.session_state.current_page = 1
+                        st.rerun()
+                    except Exception as e:
+                        logger.error(f"Error deleting file {json_file} by user {user_email}: {e}")
+                        st.error(f"❌ Error deleting file: {e}")
     
     # Controlli di navigazione in basso
     col_nav_bottom = st.columns([1, 2, 1])
@@ -222,20 +384,10 @@ def page():
     col_stat1, col_stat2, col_stat3 = st.columns(3)
     
     with col_stat1:
-        st.metric("Total records", len(filtered_files))
+        st.metric("Total records", stats["records"])
     
     with col_stat2:
-        total_rows = 0
-        for json_file in filtered_files:
-            try:
-                with open(os.path.join(OUTPUT_DIR, json_file), 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    total_rows += len(data.get('records', []))
-            except:
-                pass
-        st.metric("Total rows", total_rows)
+        st.metric("Total rows", stats["total_rows"])
     
     with col_stat3:
-        if filtered_files:
-            customers_count = len(set([f.split('_')[1] for f in filtered_files if len(f.split('_')) > 1]))
-            st.metric("Customers", customers_count)
\ No newline at end of file
+        st.metric("Customers", stats["customers"])
@@ -1,44 +1,106 @@
-import json
 import os
 import random
 import string
+import threading
 from datetime import datetime, timedelta
-from utils.email_utils import mailjet_send_email
-from utils.config import USERS_FILE, ALLOWED_DOMAINS
+from src.utils.email_utils import mailjet_queue_email
+from src.utils.config import ALLOWED_DOMAINS
 from src.utils.logger import setup_logger
+from src.utils.metrics import timer, register_collector
+from src.utils.user_repository import get_user_repository, UserAlreadyExistsError
 
 # Inizializza il logger per questa pagina
 logger = setup_logger("login_page")
 
 # -----------------------------
-# FUNZIONI BASE
+# CACHE UTENTI
 # -----------------------------
-def load_users():
-    """Carica gli utenti dal file JSON (come dict {email: user_data})"""
-    if not os.path.exists(USERS_FILE):
-        return {}
-    with open(USERS_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
+# Cache di processo condivisa tra le sessioni: ad ogni rerun app.py legge il
+# ruolo dell'utente loggato, e con la cache la lookup non tocca l'archivio.
+# La cache viene svuotata quando cambia la versione dell'archivio (anche per
+# scritture di altri processi); le scritture fatte da questo modulo aggiornano
+# invece la cache direttamente (write-through).
+_cache_lock = threading.RLock()
+_cache_version = None
+_cache_users = {}       # email -> user_data (None = utente non registrato)
+_cache_all = None       # lista completa, per la pagina admin
+_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _check_cache_version(repo):
+    """Svuota la cache se l'archivio è stato modificato dall'ultima lettura."""
+    global _cache_version, _cache_all
+    version = repo.version()
+    if version != _cache_version:
+        if _cache_version is not None:
+            _cache_stats["invalidations"] += 1
+        _cache_users.clear()
+        _cache_all = None
+        _cache_version = version
+
+
+def _cached_write(email, write):
+    """
+    Esegue una scrittura sull'archivio mantenendo la cache allineata (email
+    None = tutte le voci). La scrittura avviene fuori dal lock, così le letture
+    in cache non attendono la transazione; poi, se la scrittura è partita dalla
+    versione in cache, si rilegge solo la voce modificata, altrimenti (scritture
+    di altri processi nel frattempo) la cache viene svuotata.
+    """
+    global _cache_version, _cache_all
+    repo = get_user_repository()
+    repo.take_write_versions()
+    try:
+        return write(repo)
+    finally:
+        before, after = repo.take_write_versions()
+        with _cache_lock:
+            _cache_all = None
+            if after is None or before != _cache_version:
+                _check_cache_version(repo)
+            elif email is None:
+                _cache_users.clear()
+                _cache_version = after
+            else:
+                _cache_users[email] = repo.get(email)
+                _cache_version = after
+
+
+def get_user_cache_stats() -> dict:
+    """Contatori della cache utenti (per il monitoraggio)."""
+    with _cache_lock:
+        lookups = _cache_stats["hits"] + _cache_stats["misses"]
+        return {
+            **_cache_stats,
+            "entries": len(_cache_users),
+            "hit_ratio": _cache_stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+register_collector("user_cache", get_user_cache_stats)
+
+
+def clear_user_cache():
+    """Svuota la cache utenti (es. dopo modifiche manuali all'archivio)."""
+    global _cache_version, _cache_all
+    with _cache_lock:
+        _cache_users.clear()
+        _cache_all = None
+        _cache_version = None
 
-    # Se era una lista, convertila subito
-    if isinstance(data, list):
-        users_dict = {}
-        for user in data:
-            if "email" in user:
-                users_dict[user["email"].lower()] = user
-        save_users(users_dict)
-        return users_dict
 
-    # Se era già un dizionario, normalizza chiavi in minuscolo
-    return {k.lower(): v for k, v in data.items()}
+# -----------------------------
+# FUNZIONI BASE
+# -----------------------------
+def load_users():
+    """Carica tutti gli utenti dall'archivio (come dict {email: user_data})"""
+    return {user["email"].lower(): user for user in get_all_users() if "email" in user}
 
 
 def save_users(users: dict) -> tuple[bool, str]:
-    """Salva gli utenti nel file JSON"""
+    """Sostituisce l'intero archivio utenti (preferire update_user_data per le modifiche puntuali)"""
     try:
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(users, f, indent=2, ensure_ascii=False)
-
+        _cached_write(None, lambda repo: repo.replace_all(users))
     except Exception as e:
         logger.error(f"Error saving users: {e}")
         return False, str(e)
@@ -55,15 +117,38 @@ def generate_otp(length=6):
 
 
 def get_user_by_email(email):
-    """Restituisce l'utente corrispondente, oppure None"""
-    users = load_users()
-    return users.get(email.lower())
+    """Restituisce l'utente corrispondente (dalla cache), oppure None"""
+    if not email:
+        return None
+    email = email.strip().lower()
+    repo = get_user_repository()
+    with _cache_lock:
+        _check_cache_version(repo)
+        if email in _cache_users:
+            _cache_stats["hits"] += 1
+        else:
+            _cache_stats["misses"] += 1
+            with timer("user_store_read_seconds", op="get"):
+                _cache_users[email] = repo.get(email)
+        user = _cache_users[email]
+    # Copia: i chiamanti non devono poter modificare la voce in cache
+    return dict(user) if user is not None else None
 
 
 def get_all_users():
     """Restituisce la lista di tutti gli utenti registrati (per admin)"""
-    users = load_users()
-    return list(users.values())
+    global _cache_all
+    repo = get_user_repository()
+    with _cache_lock:
+        _check_cache_version(repo)
+        if _cache_all is not None:
+            _cache_stats["hits"] += 1
+        else:
+            _cache_stats["misses"] += 1
+            with timer("user_store_read_seconds", op="all"):
+                _cache_all = repo.all()
+        users = _cache_all
+    return [dict(user) for user in users]
 
 
 # -----------------------------
@@ -74,10 +159,6 @@ def register_user(name, surname, email, role="sales_user") -> tuple[bool, str]:
     if not is_allowed_domain(email):
         return False, "Dominio email non ammesso."
 
-    users = load_users()
-    if email in users:
-        return False, "User already registered."
-
     activation_code = generate_otp()
     new_user = {
         "name": name,
@@ -90,8 +171,13 @@ def register_user(name, surname, email, role="sales_user") -> tuple[bool, str]:
         "otp_expires_at": (datetime.now() + timedelta(minutes=10)).isoformat()
     }
 
-    users[email] = new_user
-    save_users(users)
+    try:
+        _cached_write(email, lambda repo: repo.add(new_user))
+    except UserAlreadyExistsError:
+        return False, "User already registered."
+    except Exception as e:
+        logger.error(f"Error saving new user {email}: {e}")
+        return False, f"Errore salvataggio utente: {e}"
 
     subject = "Codice di attivazione Forecast WebApp"
     message = (
@@ -99,7 +185,7 @@ def register_user(name, surname, email, role="sales_user") -> tuple[bool, str]:
         f"Il tuo codice di attivazione è: {activation_code}\n"
         "Questo codice scadrà tra 10 minuti."
     )
-    rcode, rmsg = mailjet_send_email(email, subject, message)
+    rcode, rmsg = mailjet_queue_email(email, subject, message)
     if rcode is False:
         logger.error(f"Error sending activation email: {rmsg}")
         return False, f"Errore invio email: {rmsg}"
@@ -109,8 +195,7 @@ def register_user(name, surname, email, role="sales_user") -> tuple[bool, str]:
 
 def activate_user(email, activation_code) -> tuple[bool, str]:
     email = email.strip().lower()
-    users = load_users()
-    user = users.get(email)
+    user = get_user_by_email(email)
     if not user:
         return False, "User not found."
 
@@ -121,9 +206,7 @@ def activate_user(email, activation_code) -> tuple[bool, str]:
     if datetime.now() > expiry:
         return False, "OTP code expired."
 
-    user["is_active"] = True
-    users[email] = user
-    save_users(users)
+    _cached_write(email, lambda repo: repo.update(email, {"is_active": True}))
     return True, "User activated successfully!"
 
 
@@ -132,8 +215,7 @@ def activate_user(email, activation_code) -> tuple[bool, str]:
 # -----------------------------
 def send_login_code(email):
     email = email.strip().lower()
-    users = load_users()
-    user = users.get(email)
+    user = get_user_by_email(email)
 
     if not user:
         return False, "User not registered."
@@ -141,11 +223,10 @@ def send_login_code(email):
         return False, "User not active."
 
     otp = generate_otp()
-    user["login_code"] = otp
-    user["otp_expires_at"] = (datetime.now() + timedelta(minutes=600)).isoformat()
-
-    users[email] = user
-    save_users(users)
+    _cached_write(email, lambda repo: repo.update(email, {
+        "login_code": otp,
+        "otp_expires_at": (datetime.now() + timedelta(minutes=600)).isoformat(),
+    }))
 
     subject = "Codice di accesso EDI Forecast WebApp"
     APP_LINK = os.getenv("APP_LINK", "https://forecast-webapp.example.com")
@@ -154,7 +235,7 @@ def send_login_code(email):
         f"Il tuo codice di accesso è: {otp}\n"
         "Inseriscilo entro 10 minuti per accedere."
     )
-    rcode, rmsg = mailjet_send_email(email, subject, message)
+    rcode, rmsg = mailjet_queue_email(email, subject, message)
     if rcode is False:
         logger.error(f"Error sending  login code: {rmsg}")
         return False, f"Errore invio codice di accesso: {rmsg}"
@@ -165,8 +246,7 @@ def send_login_code(email):
 
 def verify_token(email, token):
     email = email.strip().lower()
-    users = load_users()
-    user = users.get(email)
+    user = get_user_by_email(email)
     if not user:
         return False, "Utente non trovato."
     if not user.get("is_active"):
@@ -197,9 +277,6 @@ def update_user_data(email, updates, allow_role_change=False):
         tuple: (success: bool, message: str)
     """
     email = email.strip().lower()
-    users = load_users()
-    if email not in users:
-        return False, "User not found"
 
     # Campi sempre protetti (non modificabili)
     protected_fields = [
@@ -216,15 +293,13 @@ def update_user_data(email, updates, allow_role_change=False):
     for field in protected_fields:
         updates.pop(field, None)
 
-    user = users[email]
-    user.update(updates)
-    users[email] = user
-    rcode, rmsg = save_users(users)
-    if rcode is False:
-        logger.error(f"Error updating user data for {email}: {rmsg}")
-        return False, f"Errore aggiornamento dati: {rmsg}"
-    else:
-        return True, "User data updated successfully."
+    try:
+        if not _cached_write(email, lambda repo: repo.update(email, updates)):
+            return False, "User not found"
+    except Exception as e:
+        logger.error(f"Error updating user data for {email}: {e}")
+        return False, f"Errore aggiornamento dati: {e}"
+    return True, "User data updated successfully."
 
 
 def get_user_data(email):
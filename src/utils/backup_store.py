@@ -0,0 +1,476 @@
+"""
+Archivio dei backup dei file caricati, indirizzato per contenuto e compresso.
+
+Ogni salvataggio registra il contenuto originale del file caricato:
+
+- BACKUP_DIR/objects/<aa>/<sha256>.zst (oppure .gz): il contenuto compresso,
+  un solo oggetto per contenuto distinto. Ricaricare un file identico aggiunge
+  solo una riga al catalogo, nessun nuovo oggetto;
+- BACKUP_DIR/backups.db: catalogo SQLite dei salvataggi (cliente, file
+  originale, timestamp, hash del contenuto, dimensioni).
+
+Il backup Excel non viene più scritto ad ogni salvataggio: si rigenera su
+richiesta (restore --format xlsx) dalla revisione registrata dallo stesso
+salvataggio, cioè dai dati salvati con le modifiche fatte nell'editor. Solo
+se la revisione manca si riparte dal contenuto originale, con lo stesso
+parser usato in upload (senza le modifiche).
+
+La compressione è zstd (codec di pyarrow) oppure gzip (BACKUP_COMPRESSION).
+La politica di conservazione (BACKUP_KEEP_PER_FILE, BACKUP_RETENTION_DAYS)
+rimuove le voci vecchie dal catalogo, mantenendo sempre l'ultimo backup di
+ogni file; gc elimina poi gli oggetti non più referenziati. Scrittura di un
+backup e gc prendono lo stesso lock ("backup_store"), e gc non tocca i
+temporanei né gli oggetti scritti da meno di BACKUP_GC_GRACE_SECONDS.
+
+    python -m src.utils.backup_store list [--file FILE] [--customer C]
+    python -m src.utils.backup_store restore (--id N | --file FILE [--timestamp T]) [--format txt|xlsx|csv] [--output PATH]
+    python -m src.utils.backup_store stats
+    python -m src.utils.backup_store gc [--dry-run]
+    python -m src.utils.backup_store import-legacy [--delete]
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+
+from src.utils.config import (
+    BACKUP_DIR, BACKUP_COMPRESSION, BACKUP_GC_GRACE_SECONDS, BACKUP_KEEP_PER_FILE, BACKUP_RETENTION_DAYS,
+    ensure_data_dirs
+)
+from src.utils.logger import setup_logger
+from src.utils.file_io import atomic_write, file_lock
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("backup_store")
+
+BACKUP_DB_FILE = os.path.join(BACKUP_DIR, "backups.db")
+OBJECTS_DIR = os.path.join(BACKUP_DIR, "objects")
+
+RESTORE_FORMATS = ("txt", "xlsx", "csv")
+
+_CODECS = {"zstd": ".zst", "gzip": ".gz"}
+
+# Lock condiviso da scrittura dei backup e gc: un oggetto appena scritto ha sempre la sua voce
+_STORE_LOCK = "backup_store"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id                INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer          TEXT NOT NULL,
+    original_filename TEXT,
+    original_key      TEXT,
+    timestamp         TEXT NOT NULL,
+    content_sha256    TEXT NOT NULL,
+    byte_size         INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_backups_original_key_ts ON backups (original_key, timestamp);
+CREATE INDEX IF NOT EXISTS idx_backups_customer_ts ON backups (customer, timestamp);
+CREATE INDEX IF NOT EXISTS idx_backups_content ON backups (content_sha256);
+"""
+
+_LEGACY_TXT = re.compile(r"^BACKUP_(?P<customer>[^_]+)_(?P<stem>.+)_(?P<timestamp>\d{8}_\d{6})\.txt$")
+
+
+@contextmanager
+def _connect():
+    """Connessione al catalogo dei backup (a differenza del catalogo dei forecast non è un dato derivato)."""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    conn = sqlite3.connect(BACKUP_DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.executescript(_SCHEMA)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _original_key(filename):
+    if not filename:
+        return None
+    return os.path.splitext(os.path.basename(filename))[0].lower()
+
+
+# -----------------------------
+# OGGETTI
+# -----------------------------
+def _object_path(content_sha256, codec):
+    return os.path.join(OBJECTS_DIR, content_sha256[:2], f"{content_sha256}{_CODECS[codec]}")
+
+
+def _find_object(content_sha256):
+    for codec in _CODECS:
+        path = _object_path(content_sha256, codec)
+        if os.path.exists(path):
+            return path, codec
+    return None, None
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        # Il codec di pyarrow richiede la dimensione originale in decompressione: la si antepone
+        return struct.pack("<Q", len(data)) + pa.Codec("zstd", compression_level=9).compress(data, asbytes=True)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _decompress(blob, codec):
+    if codec == "zstd":
+        (size,) = struct.unpack("<Q", blob[:8])
+        return pa.Codec("zstd").decompress(blob[8:], decompressed_size=size, asbytes=True)
+    return gzip.decompress(blob)
+
+
+def _write_object(data, content_sha256):
+    """Scrive l'oggetto se non esiste già. Ritorna (path, True se nuovo)."""
+    path, _ = _find_object(content_sha256)
+    if path:
+        return path, False
+    codec = BACKUP_COMPRESSION if BACKUP_COMPRESSION in _CODECS else "gzip"
+    path = _object_path(content_sha256, codec)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path, "wb") as f:
+        f.write(_compress(data, codec))
+    return path, True
+
+
+def read_object(content_sha256) -> bytes:
+    """Contenuto originale di un backup a partire dal suo hash."""
+    path, codec = _find_object(content_sha256)
+    if path is None:
+        raise FileNotFoundError(f"Backup object {content_sha256} not found")
+    with open(path, "rb") as f:
+        data = _decompress(f.read(), codec)
+    if hashlib.sha256(data).hexdigest() != content_sha256:
+        raise ValueError(f"Backup object {content_sha256} is corrupted")
+    return data
+
+
+# -----------------------------
+# SCRITTURA
+# -----------------------------
+def store_backup(customer, original_filename, content, timestamp) -> dict:
+    """
+    Registra il backup del contenuto caricato (str o bytes).
+
+    Returns:
+        dict: voce di catalogo con "deduplicated" True se il contenuto era già archiviato
+    """
+    data = content.encode("utf-8") if isinstance(content, str) else (content or b"")
+    content_sha256 = hashlib.sha256(data).hexdigest()
+    entry = {
+        "customer": customer,
+        "original_filename": original_filename,
+        "original_key": _original_key(original_filename),
+        "timestamp": timestamp,
+        "content_sha256": content_sha256,
+        "byte_size": len(data),
+    }
+    with file_lock(_STORE_LOCK), _connect() as conn:
+        path, created = _write_object(data, content_sha256)
+        cursor = conn.execute(
+            """
+            INSERT INTO backups (customer, original_filename, original_key, timestamp, content_sha256, byte_size)
+            VALUES (:customer, :original_filename, :original_key, :timestamp, :content_sha256, :byte_size)
+            """,
+            entry,
+        )
+        entry["id"] = cursor.lastrowid
+    entry.update(object=os.path.relpath(path, BACKUP_DIR), deduplicated=not created)
+    return entry
+
+
+def remove_backup(backup_id):
+    """
+    Elimina una voce dal catalogo (annullamento di un salvataggio non riuscito).
+    L'oggetto resta: può essere condiviso con altre voci, gc lo elimina se non più referenziato.
+    """
+    with _connect() as conn:
+        conn.execute("DELETE FROM backups WHERE id = ?", (backup_id,))
+
+
+def last_backup_id(original_filename) -> int:
+    """Id dell'ultima voce del file originale (0 se nessuna), registrato all'inizio di un salvataggio."""
+    with _connect() as conn:
+        row = conn.execute("SELECT MAX(id) FROM backups WHERE original_key = ?",
+                           (_original_key(original_filename),)).fetchone()
+    return row[0] or 0
+
+
+def remove_backups_after(original_filename, backup_id) -> int:
+    """
+    Elimina le voci del file originale successive a `backup_id` (annullamento di
+    un salvataggio non concluso, anche di un processo terminato). Ritorna quante.
+    """
+    with _connect() as conn:
+        cursor = conn.execute("DELETE FROM backups WHERE original_key = ? AND id > ?",
+                              (_original_key(original_filename), backup_id))
+    return cursor.rowcount
+
+
+# -----------------------------
+# LETTURA
+# -----------------------------
+def list_backups(original_filename=None, customer=None) -> list[dict]:
+    """Voci di catalogo (dalla più vecchia), filtrate per file originale e/o cliente."""
+    clauses, params = [], []
+    if original_filename:
+        clauses.append("original_key = ?")
+        params.append(_original_key(original_filename))
+    if customer:
+        clauses.append("customer = ?")
+        params.append(customer)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _connect() as conn:
+        rows = conn.execute(f"SELECT * FROM backups {where} ORDER BY timestamp, id", params).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_backup(backup_id):
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM backups WHERE id = ?", (backup_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def find_backup(original_filename, customer=None, timestamp=None):
+    """Ultimo backup del file originale salvato entro `timestamp` (default: il più recente)."""
+    entries = [e for e in list_backups(original_filename, customer) if not timestamp or e["timestamp"] <= timestamp]
+    return entries[-1] if entries else None
+
+
+def read_backup(entry) -> bytes:
+    return read_object(entry["content_sha256"])
+
+
+def saved_revision(entry):
+    """Intestazione della revisione registrata dallo stesso salvataggio del backup, altrimenti None."""
+    from src.utils.revision_store import list_revisions
+
+    if not entry["original_filename"]:
+        return None
+    for header in reversed(list_revisions(entry["original_filename"])):
+        if header.get("timestamp") == entry["timestamp"] and header.get("customer") == entry["customer"]:
+            return header
+    return None
+
+
+def restore_backup(entry, dest_path, fmt="txt") -> dict:
+    """
+    Scrive il backup in `dest_path`: il file originale ("txt") oppure i dati
+    salvati ("xlsx", "csv"), presi dalla revisione dello stesso salvataggio.
+    Senza revisione i dati vengono rigenerati dal file originale, senza le
+    modifiche fatte nell'editor prima del salvataggio.
+
+    Returns:
+        dict: {"path": str, "source": "original"|"revision", "revision": int|None}
+    """
+    if fmt not in RESTORE_FORMATS:
+        raise ValueError(f"Unknown restore format: {fmt}")
+    if fmt == "txt":
+        data = read_backup(entry)
+        with open(dest_path, "wb") as f:
+            f.write(data)
+        return {"path": dest_path, "source": "original", "revision": None}
+
+    from src.utils.export_worker import export_frame
+
+    header = saved_revision(entry)
+    if header:
+        from src.utils.revision_store import load_revision
+
+        _, df = load_revision(entry["original_filename"], header["revision"])
+    else:
+        from src.edi.parser import parse_edi_bytes
+
+        logger.warning(f"No revision recorded for backup #{entry['id']}: regenerating {fmt} from the original file")
+        df = parse_edi_bytes(read_backup(entry))
+    export_frame(df, dest_path, fmt)
+    return {"path": dest_path, "source": "revision" if header else "original",
+            "revision": header["revision"] if header else None}
+
+
+def backup_stats() -> dict:
+    """Voci, oggetti e spazio: byte caricati (somma delle voci) contro byte su disco."""
+    with _connect() as conn:
+        entries, logical, distinct = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(byte_size), 0), COUNT(DISTINCT content_sha256) FROM backups"
+        ).fetchone()
+    objects = stored = 0
+    if os.path.exists(OBJECTS_DIR):
+        for root, _, names in os.walk(OBJECTS_DIR):
+            for name in names:
+                if not name.endswith(".tmp"):
+                    objects += 1
+                    stored += os.path.getsize(os.path.join(root, name))
+    return {"entries": entries, "distinct_contents": distinct, "objects": objects,
+            "logical_bytes": logical, "stored_bytes": stored}
+
+
+# -----------------------------
+# CONSERVAZIONE
+# -----------------------------
+def expired_backups(keep_per_file=None, retention_days=None, now=None) -> list[dict]:
+    """
+    Voci fuori dalla politica di conservazione: oltre gli ultimi `keep_per_file`
+    backup dello stesso file o più vecchie di `retention_days` giorni (0 = nessun
+    limite). L'ultimo backup di ogni file non scade mai.
+    """
+    keep_per_file = BACKUP_KEEP_PER_FILE if keep_per_file is None else keep_per_file
+    retention_days = BACKUP_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = ((now or datetime.now()) - timedelta(days=retention_days)).strftime("%Y%m%d_%H%M%S")
+
+    groups = {}
+    for entry in list_backups():
+        groups.setdefault((entry["customer"], entry["original_key"]), []).append(entry)
+
+    expired = []
+    for entries in groups.values():
+        older = entries[:-1]
+        for position, entry in enumerate(reversed(older), start=2):
+            if (keep_per_file and position > keep_per_file) or (retention_days and entry["timestamp"] < cutoff):
+                expired.append(entry)
+    return expired
+
+
+def collect_garbage(dry_run=False, keep_per_file=None, retention_days=None, grace_seconds=None) -> dict:
+    """
+    Applica la politica di conservazione e rimuove gli oggetti non più
+    referenziati, sotto il lock dei salvataggi. Temporanei e oggetti scritti
+    da meno di `grace_seconds` (default BACKUP_GC_GRACE_SECONDS) restano.
+    """
+    grace_seconds = BACKUP_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    removed_objects = freed = 0
+    with file_lock(_STORE_LOCK):
+        expired = expired_backups(keep_per_file, retention_days)
+        with _connect() as conn:
+            if not dry_run and expired:
+                conn.executemany("DELETE FROM backups WHERE id = ?", [(e["id"],) for e in expired])
+            expired_ids = set() if not dry_run else {e["id"] for e in expired}
+            referenced = {row[0] for row in conn.execute("SELECT content_sha256, id FROM backups")
+                          if row[1] not in expired_ids}
+
+        cutoff = time.time() - grace_seconds
+        if os.path.exists(OBJECTS_DIR):
+            for root, _, names in os.walk(OBJECTS_DIR):
+                for name in names:
+                    if name.endswith(".tmp") or name.split(".")[0] in referenced:
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if stat.st_mtime > cutoff:
+                        continue
+                    removed_objects += 1
+                    freed += stat.st_size
+                    if not dry_run:
+                        os.remove(path)
+    if not dry_run:
+        logger.info(f"Backup GC: {len(expired)} entries expired, {removed_objects} objects removed ({freed} bytes)")
+    return {"expired_entries": len(expired), "removed_objects": removed_objects, "freed_bytes": freed}
+
+
+# -----------------------------
+# IMPORTAZIONE DEI BACKUP STORICI
+# -----------------------------
+def import_legacy(delete=False) -> dict:
+    """
+    Importa nell'archivio i backup BACKUP_*.txt scritti prima dell'introduzione
+    dell'archivio. Con `delete` rimuove i TXT importati. I backup Excel
+    BACKUP_forecast_*.xlsx restano: contengono i dati salvati con le modifiche
+    dell'editor, che il TXT non permette di ricostruire.
+    """
+    known = {(e["customer"], e["original_key"], e["timestamp"]) for e in list_backups()}
+    imported = skipped = deleted = 0
+    for name in sorted(os.listdir(BACKUP_DIR)):
+        match = _LEGACY_TXT.match(name)
+        if not match:
+            continue
+        path = os.path.join(BACKUP_DIR, name)
+        customer, original_filename, timestamp = match["customer"], f"{match['stem']}.txt", match["timestamp"]
+        if (customer, _original_key(original_filename), timestamp) in known:
+            skipped += 1
+        else:
+            with open(path, "rb") as f:
+                store_backup(customer, original_filename, f.read(), timestamp)
+            imported += 1
+        if delete:
+            os.remove(path)
+            deleted += 1
+    return {"imported": imported, "skipped": skipped, "deleted_files": deleted}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed backup store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    cmd_list = subparsers.add_parser("list", help="List backups")
+    cmd_list.add_argument("--file", help="Original file name")
+    cmd_list.add_argument("--customer")
+    cmd_restore = subparsers.add_parser("restore", help="Restore a backup as the original file or the saved data as Excel/CSV")
+    cmd_restore.add_argument("--id", type=int, help="Backup id (see list)")
+    cmd_restore.add_argument("--file", help="Original file name (latest backup unless --timestamp)")
+    cmd_restore.add_argument("--customer")
+    cmd_restore.add_argument("--timestamp", help="Latest backup saved at or before this time (YYYYmmdd_HHMMSS)")
+    cmd_restore.add_argument("--format", choices=RESTORE_FORMATS, default="txt")
+    cmd_restore.add_argument("--output", help="Destination path (default: current directory)")
+    subparsers.add_parser("stats", help="Entries, objects and disk usage")
+    cmd_gc = subparsers.add_parser("gc", help="Apply the retention policy and delete unreferenced objects")
+    cmd_gc.add_argument("--dry-run", action="store_true")
+    cmd_gc.add_argument("--keep", type=int, help=f"Backups kept per file (default BACKUP_KEEP_PER_FILE={BACKUP_KEEP_PER_FILE}, 0 = all)")
+    cmd_gc.add_argument("--days", type=int, help=f"Retention in days (default BACKUP_RETENTION_DAYS={BACKUP_RETENTION_DAYS}, 0 = no limit)")
+    cmd_import = subparsers.add_parser("import-legacy", help="Import BACKUP_*.txt files into the store")
+    cmd_import.add_argument("--delete", action="store_true", help="Delete the imported TXT files")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    if args.command == "list":
+        print(f"{'id':>6} {'customer':<15} {'file':<30} {'timestamp':<16} {'KB':>8}  content")
+        for e in list_backups(args.file, args.customer):
+            print(f"{e['id']:>6} {e['customer']:<15} {e['original_filename'] or '':<30} {e['timestamp']:<16} "
+                  f"{e['byte_size'] / 1024:>8.1f}  {e['content_sha256'][:12]}")
+
+    elif args.command == "restore":
+        if args.id:
+            entry = get_backup(args.id)
+        elif args.file:
+            entry = find_backup(args.file, args.customer, args.timestamp)
+        else:
+            parser.error("restore needs --id or --file")
+        if entry is None:
+            parser.error("Backup not found")
+        extension = ".txt" if args.format == "txt" else f".{args.format}"
+        stem = os.path.splitext(entry["original_filename"] or "uploaded")[0]
+        output = args.output or f"{entry['customer']}_{stem}_{entry['timestamp']}{extension}"
+        restored = restore_backup(entry, output, args.format)
+        if args.format == "txt":
+            print(f"Backup {entry['id']} restored to {output}")
+        elif restored["source"] == "revision":
+            print(f"Backup {entry['id']} restored to {output} from revision {restored['revision']} (saved data)")
+        else:
+            print(f"Backup {entry['id']} restored to {output} from the original file: no revision was recorded "
+                  f"for this save, so edits made before saving are not included")
+
+    elif args.command == "stats":
+        s = backup_stats()
+        saved = 1 - s["stored_bytes"] / s["logical_bytes"] if s["logical_bytes"] else 0
+        print(f"{s['entries']} backups, {s['distinct_contents']} distinct contents, {s['objects']} objects")
+        print(f"{s['logical_bytes'] / 1024:.1f} KB uploaded, {s['stored_bytes'] / 1024:.1f} KB on disk ({saved:.0%} saved)")
+
+    elif args.command == "gc":
+        result = collect_garbage(args.dry_run, args.keep, args.days)
+        print(f"{'Would expire' if args.dry_run else 'Expired'} {result['expired_entries']} entries, "
+              f"{'would remove' if args.dry_run else 'removed'} {result['removed_objects']} objects "
+              f"({result['freed_bytes'] / 1024:.1f} KB)")
+
+    elif args.command == "import-legacy":
+        result = import_legacy(args.delete)
+        print(f"Imported {result['imported']} backups ({result['skipped']} already in the store), "
+              f"deleted {result['deleted_files']} files")
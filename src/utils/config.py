@@ -8,19 +8,90 @@ load_dotenv()
 # __file__ è in src/utils/config.py, quindi risaliamo di 2 livelli
 BASE_DIR = Path(__file__).parent.parent.parent  # da src/utils/ -> src/ -> EDI_FORECAST/
 
-# Percorsi configurabili
-DATA_DIR = BASE_DIR / "src" / "data"
+# Percorsi configurabili; EDI_DATA_DIR sposta tutti i dati (es. su un volume condiviso dai worker)
+DATA_DIR = Path(os.getenv("EDI_DATA_DIR", BASE_DIR / "src" / "data"))
 BACKUP_DIR = DATA_DIR / "backup"
 OUTPUT_DIR = DATA_DIR / "output" / "forecast"  # Nota: output/forecast non output/forecasts
 USER_DIR = DATA_DIR / "users"
 USERS_FILE = USER_DIR / "users.json"
+USERS_DB_FILE = USER_DIR / "users.db"
 LOG_DIR = BASE_DIR / "logs"
 LOG_FILE = LOG_DIR / "app.log"
+INDEX_DIR = DATA_DIR / "index"
+FORECAST_INDEX_FILE = INDEX_DIR / "forecast_index.db"
+EXPORT_DIR = DATA_DIR / "exports"
+OUTBOX_DIR = DATA_DIR / "outbox"
+REVISION_DIR = DATA_DIR / "revisions"
+SESSION_DIR = DATA_DIR / "sessions"
+LOCK_DIR = DATA_DIR / "locks"
+JOURNAL_DIR = DATA_DIR / "journal"
 
-# Crea le directory se non esistono
-os.makedirs(BACKUP_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(LOG_DIR, exist_ok=True)
+# Formato di salvataggio dei forecast: "json" (storico) oppure "parquet" (tipizzato)
+FORECAST_STORAGE_FORMAT = os.getenv("FORECAST_STORAGE_FORMAT", "json").lower()
+
+# Numero massimo di forecast (DataFrame) tenuti in cache dal viewer
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "32"))
+
+# Export in background (Excel/CSV/Parquet): thread del pool e motore Excel ("auto", "openpyxl", "xlsxwriter")
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_XLSX_ENGINE = os.getenv("EXPORT_XLSX_ENGINE", "auto").lower()
+EXPORT_POLL_SECONDS = float(os.getenv("EXPORT_POLL_SECONDS", "1"))
+
+# Job di export ricordati per lo stato: quelli falliti restano per EXPORT_JOB_TTL_SECONDS, al massimo EXPORT_JOBS_MAX_ENTRIES
+EXPORT_JOB_TTL_SECONDS = int(os.getenv("EXPORT_JOB_TTL_SECONDS", "600"))
+EXPORT_JOBS_MAX_ENTRIES = int(os.getenv("EXPORT_JOBS_MAX_ENTRIES", "256"))
+
+# Storico delle revisioni dei forecast: una copia completa ogni N revisioni, delta nelle altre
+REVISION_SNAPSHOT_INTERVAL = int(os.getenv("REVISION_SNAPSHOT_INTERVAL", "10"))
+
+# Archivio dei backup: compressione ("zstd" o "gzip") e conservazione (0 = nessun limite)
+BACKUP_COMPRESSION = os.getenv("BACKUP_COMPRESSION", "zstd").lower()
+BACKUP_KEEP_PER_FILE = int(os.getenv("BACKUP_KEEP_PER_FILE", "0"))
+BACKUP_RETENTION_DAYS = int(os.getenv("BACKUP_RETENTION_DAYS", "0"))
+# gc non elimina gli oggetti più recenti di BACKUP_GC_GRACE_SECONDS (salvataggi in corso)
+BACKUP_GC_GRACE_SECONDS = int(os.getenv("BACKUP_GC_GRACE_SECONDS", "3600"))
+
+# Upload multiplo: processi per l'analisi in parallelo e dimensione minima del lotto per usarli
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PARSE_POOL_MIN_BYTES = int(os.getenv("PARSE_POOL_MIN_BYTES", str(1 << 20)))
+
+# Archivi zip dell'upload multiplo: dimensione massima (MB, non compressa) di un file e del totale
+ZIP_MAX_MEMBER_MB = float(os.getenv("ZIP_MAX_MEMBER_MB", "200"))
+ZIP_MAX_TOTAL_MB = float(os.getenv("ZIP_MAX_TOTAL_MB", "500"))
+
+# Dati di sessione dell'upload: budget di memoria per sessione e per processo (MB),
+# oltre i quali i valori vengono scritti su disco, e scadenza delle sessioni inattive (ore)
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "64"))
+SESSION_GLOBAL_BUDGET_MB = float(os.getenv("SESSION_GLOBAL_BUDGET_MB", "512"))
+SESSION_EXPIRY_HOURS = float(os.getenv("SESSION_EXPIRY_HOURS", "12"))
+
+# Salvataggi concorrenti: attesa massima (secondi) del lock su cliente/forecast
+LOCK_TIMEOUT_SECONDS = float(os.getenv("LOCK_TIMEOUT_SECONDS", "60"))
+
+# Metriche di processo: porta del server HTTP /metrics (formato Prometheus) e intervallo
+# di scrittura periodica nel log, in secondi (0 = disattivato)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_LOG_INTERVAL_SECONDS = float(os.getenv("METRICS_LOG_INTERVAL_SECONDS", "0"))
+
+# Avvio: moduli pesanti (pandas, pyarrow, pagine) precaricati in background dopo il primo
+# avvio dell'app, così il primo utente che apre upload/view non attende gli import
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "True").lower() == "true"
+
+# Directory dei dati: create all'avvio dell'app e dei comandi (ensure_data_dirs),
+# non all'import della configurazione
+DATA_DIRS = (BACKUP_DIR, OUTPUT_DIR, USER_DIR, LOG_DIR, INDEX_DIR, EXPORT_DIR,
+             OUTBOX_DIR, REVISION_DIR, SESSION_DIR, LOCK_DIR, JOURNAL_DIR)
+
+
+def ensure_data_dirs():
+    """Crea le directory dei dati se non esistono."""
+    for path in DATA_DIRS:
+        os.makedirs(path, exist_ok=True)
+
+
+# Archivio utenti: "sqlite" (default, import automatico da users.json) oppure "json"
+USER_STORE_BACKEND = os.getenv("USER_STORE_BACKEND", "sqlite").lower()
 
 # Configurazioni email
 ALLOWED_DOMAINS = ["@iph.it"]
@@ -39,6 +110,16 @@ APPRISE_NTFY_HOST = os.getenv("APPRISE_NTFY_HOST")
 APPRISE_NTFY_TOPIC = os.getenv("APPRISE_NTFY_TOPIC")
 APPRISE_NTFY_TOKEN = os.getenv("APPRISE_NTFY_TOKEN")
 
+# Coda di invio in background (email e notifiche): tentativi e attesa massima tra due tentativi
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "5"))
+DISPATCH_BACKOFF_MAX_SECONDS = float(os.getenv("DISPATCH_BACKOFF_MAX_SECONDS", "60"))
+
+# Più worker sulla stessa outbox: un messaggio preso da un processo terminato torna in coda
+# dopo DISPATCH_CLAIM_TIMEOUT_SECONDS (da tenere sopra DISPATCH_BACKOFF_MAX_SECONDS più il
+# timeout delle richieste); ogni DISPATCH_RESCAN_SECONDS il worker inattivo rilegge l'outbox
+DISPATCH_CLAIM_TIMEOUT_SECONDS = float(os.getenv("DISPATCH_CLAIM_TIMEOUT_SECONDS", "300"))
+DISPATCH_RESCAN_SECONDS = float(os.getenv("DISPATCH_RESCAN_SECONDS", "30"))
+
 # Configurazioni APP
 APP_URL = os.getenv("APP_URL", "http://localhost:8501/")
 APP_NAME = "EDI Forecast Requirements WebApp"
@@ -48,4 +129,8 @@ APP_VERSION = "1.0.0"
 # Livelli disponibili: DEBUG, INFO, WARNING, ERROR, CRITICAL
 LOG_LEVEL = os.getenv("APP_LOG_LEVEL", "INFO").upper()
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Con run.py --workers tutti i worker scrivono sullo stesso file: il log riporta l'indice del worker
+WORKER_ID = os.getenv("EDI_WORKER_ID")
+if WORKER_ID is not None:
+    LOG_FORMAT = f"%(asctime)s - worker {WORKER_ID} - %(name)s - %(levelname)s - %(message)s"
 LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
\ No newline at end of file
@@ -0,0 +1,347 @@
+"""
+Coda di invio in background per email (Mailjet) e notifiche (Apprise/NTFY).
+
+Le pagine non chiamano più i servizi esterni durante il rerun: il messaggio
+viene scritto nell'outbox su disco (un file JSON per messaggio in OUTBOX_DIR)
+e inviato da un thread dedicato, con una requests.Session condivisa
+(connessioni riutilizzate) e nuovi tentativi con backoff esponenziale.
+
+- i messaggi inviati vengono rimossi dall'outbox;
+- quelli rifiutati definitivamente (errori 4xx, tentativi esauriti) vengono
+  spostati in OUTBOX_DIR/failed per l'analisi;
+- all'avvio i messaggi rimasti nell'outbox (es. dopo un riavvio) vengono
+  rimessi in coda.
+
+Più processi (worker di run.py --workers, repliche) possono condividere la
+stessa outbox: prima dell'invio il messaggio viene spostato con un rename
+atomico in OUTBOX_DIR/claimed/<id>.<host>-<pid>.json e solo il processo che
+riesce nel rename lo invia, così nessun messaggio parte due volte. Un claim
+non aggiornato da DISPATCH_CLAIM_TIMEOUT_SECONDS (processo terminato a metà
+invio) torna nell'outbox; il worker inattivo rilegge l'outbox ogni
+DISPATCH_RESCAN_SECONDS e invia anche i messaggi rimasti da altri processi.
+
+Ogni tipo di messaggio ("email", "notification") ha una funzione di invio
+`sender(session, payload)` registrata in SENDERS come "modulo:funzione", così
+il payload salvato su disco non contiene credenziali: URL e chiavi vengono
+letti dalla configurazione al momento dell'invio.
+
+requests e tenacity vengono importati solo dal thread di invio: accodare un
+messaggio (es. il codice di login) non li richiede e l'avvio resta leggero.
+"""
+import importlib
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from src.utils.config import (
+    OUTBOX_DIR, DISPATCH_MAX_ATTEMPTS, DISPATCH_BACKOFF_MAX_SECONDS, DISPATCH_CLAIM_TIMEOUT_SECONDS,
+    DISPATCH_RESCAN_SECONDS
+)
+from src.utils.logger import setup_logger
+from src.utils.file_io import atomic_write
+from src.utils.metrics import observe, register_collector
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("dispatch_queue")
+
+SENDERS = {
+    "email": "src.utils.email_utils:mailjet_deliver",
+    "notification": "src.utils.notification_utils:apprise_deliver",
+}
+
+
+class DispatchError(Exception):
+    """Invio fallito; `retryable` indica se ha senso riprovare (timeout, 5xx, 429)."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def check_response(response, ok_status=(200, 201, 202, 204)):
+    """Solleva DispatchError se la risposta HTTP non è un successo."""
+    if response.status_code in ok_status:
+        return
+    retryable = response.status_code == 429 or response.status_code >= 500
+    raise DispatchError(f"HTTP {response.status_code} {response.text[:200]}", retryable=retryable)
+
+
+def _is_retryable(error):
+    import requests
+
+    if isinstance(error, DispatchError):
+        return error.retryable
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+def _new_session():
+    """requests.Session condivisa dagli invii (connessioni riutilizzate)."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _resolve_sender(kind):
+    module_name, func_name = SENDERS[kind].split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+class DispatchQueue:
+    """
+    Outbox persistente con un thread di invio.
+
+    Args:
+        outbox_dir: Directory dei messaggi in attesa
+        max_attempts: Tentativi per messaggio prima di spostarlo in failed/
+        backoff_max: Attesa massima (secondi) tra due tentativi
+        senders: Mappa tipo -> callable(session, payload); default SENDERS
+        claim_timeout: Secondi dopo i quali un claim non aggiornato torna nell'outbox
+        rescan_interval: Secondi di inattività dopo i quali l'outbox viene riletta
+    """
+
+    def __init__(self, outbox_dir=OUTBOX_DIR, max_attempts=DISPATCH_MAX_ATTEMPTS,
+                 backoff_max=DISPATCH_BACKOFF_MAX_SECONDS, senders=None,
+                 claim_timeout=DISPATCH_CLAIM_TIMEOUT_SECONDS, rescan_interval=DISPATCH_RESCAN_SECONDS):
+        self.outbox_dir = str(outbox_dir)
+        self.failed_dir = os.path.join(self.outbox_dir, "failed")
+        self.claimed_dir = os.path.join(self.outbox_dir, "claimed")
+        self.max_attempts = max_attempts
+        self.backoff_max = backoff_max
+        self.claim_timeout = claim_timeout
+        self.rescan_interval = rescan_interval
+        self._owner = f"{socket.gethostname()}-{os.getpid()}"
+        self._senders = senders or {}
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._session = None
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retries": 0, "released": 0}
+        os.makedirs(self.failed_dir, exist_ok=True)
+        os.makedirs(self.claimed_dir, exist_ok=True)
+
+    @property
+    def session(self):
+        """Sessione HTTP degli invii, creata al primo invio."""
+        if self._session is None:
+            self._session = _new_session()
+        return self._session
+
+    # -----------------------------
+    # OUTBOX
+    # -----------------------------
+    def _message_path(self, message_id):
+        return os.path.join(self.outbox_dir, f"{message_id}.json")
+
+    def _write_message(self, message):
+        path = self._message_path(message["id"])
+        with atomic_write(path) as f:
+            json.dump(message, f, ensure_ascii=False)
+
+    def pending_messages(self) -> list[str]:
+        """Id dei messaggi presenti nell'outbox, in ordine di accodamento."""
+        return sorted(
+            name[:-len(".json")] for name in os.listdir(self.outbox_dir)
+            if name.endswith(".json")
+        )
+
+    def _claim(self, message_id):
+        """
+        Sposta il messaggio in claimed/ con un rename atomico. Ritorna il nuovo
+        path, None se il messaggio è già stato inviato o preso da un altro processo.
+        """
+        path = self._message_path(message_id)
+        claimed = os.path.join(self.claimed_dir, f"{message_id}.{self._owner}.json")
+        try:
+            # mtime aggiornato prima del rename: il claim non risulta mai scaduto
+            os.utime(path)
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _unclaim(self, message_id, claimed):
+        """Rimette nell'outbox un messaggio preso da questo processo."""
+        try:
+            os.replace(claimed, self._message_path(message_id))
+        except FileNotFoundError:
+            pass  # claim scaduto e già rimesso in coda da un altro processo
+
+    def release_stale_claims(self) -> int:
+        """
+        Rimette nell'outbox i messaggi presi da processi che non li hanno
+        completati (claim non aggiornato da claim_timeout secondi). Ritorna quanti.
+        """
+        released = 0
+        now = time.time()
+        for name in os.listdir(self.claimed_dir):
+            claimed = os.path.join(self.claimed_dir, name)
+            message_id = name.split(".", 1)[0]
+            try:
+                if now - os.path.getmtime(claimed) < self.claim_timeout:
+                    continue
+                os.rename(claimed, self._message_path(message_id))
+            except FileNotFoundError:
+                continue  # completato o rilasciato nel frattempo da un altro processo
+            released += 1
+            logger.warning(f"Released stale claim on message {message_id} ({name.split('.', 1)[1][:-len('.json')]})")
+        self.stats["released"] += released
+        return released
+
+    def enqueue(self, kind, payload) -> str:
+        """Salva il messaggio nell'outbox e lo mette in coda. Ritorna subito l'id del messaggio."""
+        if kind not in SENDERS and kind not in self._senders:
+            raise ValueError(f"Unknown message kind: {kind}")
+        self.start()
+        # Il prefisso temporale mantiene l'ordine di invio anche dopo un riavvio
+        message_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+        self._write_message({
+            "id": message_id,
+            "kind": kind,
+            "payload": payload,
+            "created_at": datetime.now().isoformat(),
+        })
+        self.stats["queued"] += 1
+        self._queue.put(message_id)
+        logger.debug(f"Message queued: {kind} {message_id}")
+        return message_id
+
+    # -----------------------------
+    # WORKER
+    # -----------------------------
+    def start(self):
+        """Avvia il thread di invio (una sola volta) e rimette in coda i messaggi rimasti nell'outbox."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            recovered = self._recover()
+            if recovered:
+                logger.info(f"Recovered {len(recovered)} pending messages from outbox")
+            self._thread = threading.Thread(target=self._run, name="dispatch-queue", daemon=True)
+            self._thread.start()
+
+    def _recover(self) -> list[str]:
+        """Rimette in coda i messaggi dell'outbox, compresi i claim scaduti di altri processi."""
+        self.release_stale_claims()
+        recovered = self.pending_messages()
+        for message_id in recovered:
+            self._queue.put(message_id)
+        return recovered
+
+    def stop(self, timeout=None):
+        """Ferma il thread di invio; i messaggi non inviati restano nell'outbox."""
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def flush(self, timeout=None) -> bool:
+        """Attende che la coda sia vuota. Ritorna False allo scadere del timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                message_id = self._queue.get(timeout=self.rescan_interval)
+            except queue.Empty:
+                # Messaggi lasciati da altri worker (terminati o con la coda ferma)
+                try:
+                    recovered = self._recover()
+                except Exception as e:
+                    logger.error(f"Outbox rescan failed: {e}")
+                    continue
+                if recovered:
+                    logger.info(f"Picked up {len(recovered)} pending messages from outbox")
+                continue
+            try:
+                if message_id is not None:
+                    self._process(message_id)
+            except Exception as e:
+                logger.error(f"Unexpected error dispatching message {message_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _process(self, message_id):
+        path = self._claim(message_id)
+        if path is None:
+            return  # già inviato o preso da un altro processo (es. accodato due volte durante il recupero)
+        with open(path, "r", encoding="utf-8") as f:
+            message = json.load(f)
+
+        from tenacity import Retrying, retry_if_exception, stop_after_attempt, stop_when_event_set, wait_exponential
+
+        sender = self._senders.get(message["kind"]) or _resolve_sender(message["kind"])
+        retrying = Retrying(
+            stop=stop_after_attempt(self.max_attempts) | stop_when_event_set(self._stop),
+            wait=wait_exponential(multiplier=1, min=1, max=self.backoff_max),
+            retry=retry_if_exception(_is_retryable),
+            sleep=self._stop.wait,
+            before_sleep=self._before_sleep(message, path),
+            reraise=True,
+        )
+        try:
+            retrying(sender, self.session, message["payload"])
+        except Exception as e:
+            if self._stop.is_set():
+                self._unclaim(message_id, path)  # arresto durante il backoff: il messaggio torna nell'outbox
+                return
+            self.stats["failed"] += 1
+            os.replace(path, os.path.join(self.failed_dir, f"{message_id}.json"))
+            logger.error(f"Dispatch of {message['kind']} {message_id} failed permanently: {e}")
+            return
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Claim scaduto durante l'invio: un altro processo potrebbe inviarlo di nuovo
+            logger.warning(f"Claim on message {message_id} expired during dispatch")
+        self.stats["sent"] += 1
+        # Latenza complessiva: dall'accodamento all'invio riuscito (tentativi compresi)
+        observe("dispatch_latency_seconds",
+                (datetime.now() - datetime.fromisoformat(message["created_at"])).total_seconds(), kind=message["kind"])
+        logger.info(f"Dispatched {message['kind']} {message_id}")
+
+    def _before_sleep(self, message, claimed):
+        def log_retry(retry_state):
+            self.stats["retries"] += 1
+            try:
+                os.utime(claimed)  # il claim resta valido durante il backoff
+            except FileNotFoundError:
+                pass
+            logger.warning(
+                f"Dispatch of {message['kind']} {message['id']} failed "
+                f"(attempt {retry_state.attempt_number}/{self.max_attempts}): "
+                f"{retry_state.outcome.exception()} - retrying in {retry_state.next_action.sleep:.0f}s"
+            )
+        return log_retry
+
+
+_dispatch_queue = None
+_dispatch_queue_lock = threading.Lock()
+
+
+def get_dispatch_queue() -> DispatchQueue:
+    """Coda di invio del processo; al primo utilizzo avvia il worker e recupera l'outbox."""
+    global _dispatch_queue
+    with _dispatch_queue_lock:
+        if _dispatch_queue is None:
+            _dispatch_queue = DispatchQueue()
+            _dispatch_queue.start()
+            register_collector("dispatch", lambda: dict(_dispatch_queue.stats))
+        return _dispatch_queue
@@ -1,26 +1,65 @@
-import requests
 from src.utils.logger import setup_logger
-from utils.config import MAILJET_URL, MAILJET_API_KEY, MAILJET_API_SECRET, MAILJET_SENDER_EMAIL, MAILJET_SENDER_NAME, DEBUG_MODE
+from src.utils.config import MAILJET_URL, MAILJET_API_KEY, MAILJET_API_SECRET, MAILJET_SENDER_EMAIL, MAILJET_SENDER_NAME, DEBUG_MODE
+from src.utils.dispatch_queue import get_dispatch_queue, check_response
 
 # Inizializza il logger per questa pagina
 logger = setup_logger("login_page")
 
-def mailjet_send_email(to_email: str, subject: str, text_content: str) -> (tuple[bool, str]):
+
+def _mailjet_payload(to_email: str, subject: str, text_content: str) -> dict:
+    return {"Messages": [{"From": {"Email": MAILJET_SENDER_EMAIL, "Name": MAILJET_SENDER_NAME},
+                          "To": [{"Email": to_email}],
+                          "Subject": subject,
+                          "TextPart": text_content}]}
+
+
+def _mailjet_keys_missing(to_email: str, subject: str, text_content: str) -> bool:
     if MAILJET_API_KEY and MAILJET_API_SECRET:
-        try:
-            url = MAILJET_URL
-            data = {"Messages": [{"From": {"Email": MAILJET_SENDER_EMAIL, "Name": MAILJET_SENDER_NAME},
-                                  "To": [{"Email": to_email}],
-                                  "Subject": subject,
-                                  "TextPart": text_content}]}
-            resp = requests.post(url, auth=(MAILJET_API_KEY, MAILJET_API_SECRET), json=data, timeout=10)
-            if resp.status_code in (200, 201):
-                return True, ""
-            else:
-                return False, f"Mailjet error: {resp.status_code} {resp.text}"
-        except Exception as e:
-            return False, f"Exception sending email: {e}"
-    else:
-        logger.error("Mailjet API keys are not set. Email not sent.")
-        logger.debug("=== DEBUG EMAIL ===\nTo: %s\nSubject: %s\nBody: %s\n==============", to_email, subject, text_content)
+        return False
+    logger.error("Mailjet API keys are not set. Email not sent.")
+    logger.debug("=== DEBUG EMAIL ===\nTo: %s\nSubject: %s\nBody: %s\n==============", to_email, subject, text_content)
+    return True
+
+
+def mailjet_send_email(to_email: str, subject: str, text_content: str) -> (tuple[bool, str]):
+    """Invio sincrono (attende la risposta di Mailjet). Dalle pagine usare mailjet_queue_email."""
+    import requests
+
+    if _mailjet_keys_missing(to_email, subject, text_content):
+        return False, "Mailjet API keys are not set. Email not sent."
+    try:
+        data = _mailjet_payload(to_email, subject, text_content)
+        resp = requests.post(MAILJET_URL, auth=(MAILJET_API_KEY, MAILJET_API_SECRET), json=data, timeout=10)
+        if resp.status_code in (200, 201):
+            return True, ""
+        else:
+            return False, f"Mailjet error: {resp.status_code} {resp.text}"
+    except Exception as e:
+        return False, f"Exception sending email: {e}"
+
+
+def mailjet_queue_email(to_email: str, subject: str, text_content: str) -> (tuple[bool, str]):
+    """
+    Accoda l'email nella coda di invio in background e ritorna subito.
+    La configurazione (chiavi Mailjet) viene comunque verificata qui, così
+    l'errore arriva all'utente; gli errori di rete sono gestiti dalla coda.
+    """
+    if _mailjet_keys_missing(to_email, subject, text_content):
         return False, "Mailjet API keys are not set. Email not sent."
+    try:
+        get_dispatch_queue().enqueue("email", {"to_email": to_email, "subject": subject, "text_content": text_content})
+    except Exception as e:
+        logger.error(f"Error queueing email to {to_email}: {e}")
+        return False, f"Exception queueing email: {e}"
+    return True, ""
+
+
+def mailjet_deliver(session, payload):
+    """Funzione di invio usata dalla coda: solleva DispatchError/RequestException in caso di errore."""
+    resp = session.post(
+        MAILJET_URL,
+        auth=(MAILJET_API_KEY, MAILJET_API_SECRET),
+        json=_mailjet_payload(payload["to_email"], payload["subject"], payload["text_content"]),
+        timeout=10,
+    )
+    check_response(resp, ok_status=(200, 201))
@@ -0,0 +1,197 @@
+"""
+Generazione asincrona degli export dei forecast (Excel, CSV, Parquet).
+
+Gli export vengono prodotti da un pool di thread in background, così lo
+script Streamlit non resta bloccato durante la scrittura (openpyxl è lento
+sui fogli grandi). Ogni file prodotto resta in cache in EXPORT_DIR con nome
+`<forecast>_<mtime_ns>.<ext>`: finché il forecast non cambia, i download
+successivi vengono serviti direttamente dal disco.
+
+La UI chiama request_export() e interroga get_export_status() finché lo
+stato non è EXPORT_DONE (o EXPORT_FAILED).
+"""
+import importlib.util
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pyarrow.parquet as pq
+
+from src.utils.config import (EXPORT_DIR, EXPORT_JOB_TTL_SECONDS, EXPORT_JOBS_MAX_ENTRIES, EXPORT_WORKERS,
+                              EXPORT_XLSX_ENGINE)
+from src.utils.logger import setup_logger
+from src.utils.metrics import timer
+from src.utils.file_io import atomic_path
+from src.utils.forecast_store import read_forecast, to_typed_table
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("export_worker")
+
+EXPORT_PENDING = "pending"
+EXPORT_DONE = "done"
+EXPORT_FAILED = "failed"
+EXPORT_MISSING = "missing"
+
+EXPORT_FORMATS = {
+    "xlsx": {"extension": ".xlsx", "label": "Excel",
+             "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    "csv": {"extension": ".csv", "label": "CSV", "mime": "text/csv"},
+    "parquet": {"extension": ".parquet", "label": "Parquet", "mime": "application/vnd.apache.parquet"},
+}
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+_jobs = {}  # dest_path -> (Future, istante di accodamento)
+_jobs_lock = threading.Lock()
+_pending_frames = set()
+
+
+def _xlsx_engine():
+    """xlsxwriter è molto più veloce di openpyxl in scrittura: lo si usa se installato."""
+    if EXPORT_XLSX_ENGINE != "auto":
+        return EXPORT_XLSX_ENGINE
+    return "xlsxwriter" if importlib.util.find_spec("xlsxwriter") else "openpyxl"
+
+
+# -----------------------------
+# SCRITTURA
+# -----------------------------
+def export_frame(df, dest_path, fmt):
+    """
+    Scrive `df` in `dest_path` nel formato richiesto (sincrono).
+    Il file viene scritto con un nome temporaneo e poi rinominato, così
+    un export a metà non viene mai servito.
+    """
+    # Il temporaneo conserva l'estensione: serve a pandas per scegliere il writer
+    with atomic_path(dest_path) as tmp_path, timer("export_write_seconds", format=fmt):
+        if fmt == "xlsx":
+            df.to_excel(tmp_path, index=False, sheet_name="Forecast", engine=_xlsx_engine())
+        elif fmt == "csv":
+            # ";" perché QUANTITA usa la virgola come separatore decimale
+            df.to_csv(tmp_path, index=False, sep=";", encoding="utf-8-sig")
+        elif fmt == "parquet":
+            pq.write_table(to_typed_table(df), tmp_path, compression="zstd")
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+
+
+def submit_frame_export(df, dest_path, fmt):
+    """Accoda la scrittura di un DataFrame già in memoria (es. backup Excel). Ritorna il Future."""
+    def job():
+        try:
+            export_frame(df, dest_path, fmt)
+            logger.info(f"Export written: {os.path.basename(dest_path)}")
+        except Exception as e:
+            logger.error(f"Error writing export {dest_path}: {e}")
+            raise
+
+    future = _executor.submit(job)
+    with _jobs_lock:
+        _pending_frames.add(future)
+    future.add_done_callback(_frame_export_done)
+    return future
+
+
+def _frame_export_done(future):
+    with _jobs_lock:
+        _pending_frames.discard(future)
+
+
+def wait_for_frame_exports(timeout=None) -> int:
+    """
+    Attende la fine delle scritture accodate con submit_frame_export (es. prima
+    di terminare un processo batch). Ritorna il numero di scritture ancora in corso.
+    """
+    with _jobs_lock:
+        pending = set(_pending_frames)
+    _, not_done = wait(pending, timeout=timeout)
+    return len(not_done)
+
+
+# -----------------------------
+# EXPORT DEI FORECAST CON CACHE
+# -----------------------------
+def export_path(forecast_path, fmt):
+    """Path in cache dell'export di un forecast, legato al suo mtime."""
+    stem = os.path.splitext(os.path.basename(forecast_path))[0]
+    mtime_ns = os.stat(forecast_path).st_mtime_ns
+    return os.path.join(EXPORT_DIR, f"{stem}_{mtime_ns}{EXPORT_FORMATS[fmt]['extension']}")
+
+
+def _run_export(forecast_path, fmt, dest_path):
+    _, df = read_forecast(forecast_path)
+    export_frame(df, dest_path, fmt)
+    purge_exports(os.path.basename(forecast_path), fmt, keep=dest_path)
+    logger.info(f"Export ready: {os.path.basename(dest_path)} ({len(df)} rows)")
+
+
+def _prune_jobs():
+    """
+    Scarta i job conclusi (da chiamare con _jobs_lock): quelli riusciti sono
+    serviti dal file in cache, quelli falliti restano per EXPORT_JOB_TTL_SECONDS
+    per mostrarne l'errore. Oltre EXPORT_JOBS_MAX_ENTRIES si scartano i più
+    vecchi tra i conclusi.
+    """
+    now = time.monotonic()
+    for dest_path, (future, queued_at) in list(_jobs.items()):
+        if future.done() and (future.exception() is None or now - queued_at > EXPORT_JOB_TTL_SECONDS):
+            del _jobs[dest_path]
+    finished = [dest_path for dest_path, (future, _) in _jobs.items() if future.done()]
+    for dest_path in finished[:max(0, len(_jobs) - EXPORT_JOBS_MAX_ENTRIES)]:
+        del _jobs[dest_path]
+
+
+def request_export(forecast_path, fmt) -> dict:
+    """Avvia (se non già in cache o in corso) l'export del forecast e ne restituisce lo stato."""
+    dest_path = export_path(forecast_path, fmt)
+    with _jobs_lock:
+        _prune_jobs()
+        future = _jobs.get(dest_path, (None, None))[0]
+        if not os.path.exists(dest_path) and (future is None or future.done() and future.exception()):
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            _jobs[dest_path] = (_executor.submit(_run_export, forecast_path, fmt, dest_path), time.monotonic())
+            logger.debug(f"Export queued: {os.path.basename(dest_path)}")
+    return get_export_status(forecast_path, fmt)
+
+
+def get_export_status(forecast_path, fmt) -> dict:
+    """
+    Stato dell'export del forecast nel formato richiesto.
+
+    Returns:
+        dict: {"state": pending|done|failed|missing, "path": str, "error": str|None}
+    """
+    dest_path = export_path(forecast_path, fmt)
+    if os.path.exists(dest_path):
+        return {"state": EXPORT_DONE, "path": dest_path, "error": None}
+
+    with _jobs_lock:
+        future = _jobs.get(dest_path, (None, None))[0]
+    if future is None:
+        return {"state": EXPORT_MISSING, "path": dest_path, "error": None}
+    if not future.done():
+        return {"state": EXPORT_PENDING, "path": dest_path, "error": None}
+    error = future.exception()
+    if error is not None:
+        return {"state": EXPORT_FAILED, "path": dest_path, "error": str(error)}
+    # Completato ma il file non c'è più (es. cache ripulita): va rigenerato
+    return {"state": EXPORT_MISSING, "path": dest_path, "error": None}
+
+
+def purge_exports(forecast_filename, fmt=None, keep=None) -> int:
+    """Rimuove dalla cache gli export di un forecast (tutti, o di un formato, tranne `keep`)."""
+    stem = os.path.splitext(os.path.basename(forecast_filename))[0]
+    extensions = [EXPORT_FORMATS[fmt]["extension"]] if fmt else [f["extension"] for f in EXPORT_FORMATS.values()]
+    removed = 0
+    if not os.path.exists(EXPORT_DIR):
+        return removed
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if (name.startswith(f"{stem}_") and name.endswith(tuple(extensions))
+                and path != keep and name[len(stem) + 1:].split(".")[0].isdigit()):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Error removing cached export {name}: {e}")
+    return removed
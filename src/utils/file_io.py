@@ -0,0 +1,170 @@
+"""
+Scritture atomiche e lock tra processi per i file dell'applicazione.
+
+- atomic_write(path): il file viene scritto con un nome temporaneo nella
+  stessa directory, sincronizzato su disco (fsync) e rinominato sul nome
+  finale; anche la directory viene sincronizzata. Un lettore vede sempre il
+  file precedente o quello nuovo completo, mai uno troncato, anche se il
+  processo o il container si fermano a metà scrittura;
+- atomic_path(path): come atomic_write per le librerie che scrivono su un
+  path (es. pandas.to_excel), il temporaneo conserva l'estensione;
+- file_lock("customer:ACME", "forecast:abc"): lock esclusivi e consultivi su
+  LOCK_DIR/<nome>.lock (flock, msvcrt su Windows), validi tra sessioni, processi
+  e repliche che condividono la directory dei dati. Più nomi vengono acquisiti
+  in ordine, così due salvataggi non si bloccano a vicenda.
+
+Ogni scrittura usa un temporaneo con nome proprio: due scrittori concorrenti
+dello stesso file non si sovrascrivono il temporaneo (vince l'ultimo rename).
+"""
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from src.utils.config import LOCK_DIR, LOCK_TIMEOUT_SECONDS
+from src.utils.logger import setup_logger
+from src.utils.metrics import observe
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("file_io")
+
+_LOCK_POLL_SECONDS = 0.05
+
+
+class LockTimeoutError(TimeoutError):
+    """Lock non ottenuto entro il timeout (un altro salvataggio è in corso)."""
+
+
+# -----------------------------
+# SCRITTURE ATOMICHE
+# -----------------------------
+def fsync_dir(path):
+    """Sincronizza la directory (il rename è persistente solo dopo). Non disponibile su Windows."""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _temp_path(path, keep_extension=False):
+    token = f"{os.getpid()}.{uuid.uuid4().hex[:8]}"
+    if keep_extension:
+        root, extension = os.path.splitext(path)
+        return f"{root}.{token}.tmp{extension}"
+    return f"{path}.{token}.tmp"
+
+
+def _commit(tmp_path, path):
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+@contextmanager
+def atomic_write(path, mode="w", encoding="utf-8", newline=None):
+    """
+    Apre un temporaneo al posto di `path` ("w" testo, "wb" binario); all'uscita
+    senza errori lo sincronizza e lo rinomina su `path`, altrimenti lo elimina.
+    """
+    if "b" in mode:
+        encoding = newline = None
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, mode, encoding=encoding, newline=newline) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        _commit(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Path temporaneo (con la stessa estensione) da passare a chi scrive su file;
+    all'uscita senza errori il file viene sincronizzato e rinominato su `path`.
+    """
+    tmp_path = _temp_path(path, keep_extension=True)
+    try:
+        yield tmp_path
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        _commit(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# -----------------------------
+# LOCK
+# -----------------------------
+def _lock_path(name):
+    return os.path.join(LOCK_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", name) + ".lock")
+
+
+def _try_lock(f):
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(f):
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        f.close()
+
+
+def _acquire(name, deadline):
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    f = open(_lock_path(name), "a+b")
+    while not _try_lock(f):
+        if deadline is not None and time.monotonic() >= deadline:
+            f.close()
+            raise LockTimeoutError(f"Timed out waiting for lock {name}")
+        time.sleep(_LOCK_POLL_SECONDS)
+    return f
+
+
+@contextmanager
+def file_lock(*names, timeout=LOCK_TIMEOUT_SECONDS):
+    """
+    Lock esclusivo sui nomi indicati (tra thread, processi e repliche), acquisiti
+    in ordine alfabetico. LockTimeoutError se non ottenuti entro `timeout`
+    secondi (None = attesa illimitata).
+    """
+    start = time.monotonic()
+    deadline = start + timeout if timeout is not None else None
+    handles = []
+    try:
+        for name in sorted(set(names)):
+            handles.append(_acquire(name, deadline))
+        waited = time.monotonic() - start
+        observe("lock_wait_seconds", waited)
+        if waited > 1:
+            logger.info(f"Waited {waited:.1f}s for lock {', '.join(sorted(set(names)))}")
+        yield
+    finally:
+        for f in reversed(handles):
+            _unlock(f)
@@ -0,0 +1,569 @@
+"""
+Catalogo persistente dei forecast salvati in OUTPUT_DIR.
+
+Il catalogo è un piccolo database SQLite (FORECAST_INDEX_FILE) che contiene,
+per ogni file forecast, i metadati necessari alla pagina di visualizzazione:
+customer, timestamp, original_filename, numero di righe, dimensione e mtime.
+In questo modo filtri, ordinamento, paginazione e statistiche non devono più
+aprire i file forecast ad ogni rerun.
+
+Il catalogo mappa inoltre il nome del file originale (basename minuscolo, senza
+estensione) e l'hash SHA-256 del contenuto caricato sul forecast corrispondente,
+così il controllo dei duplicati in upload è una singola lookup indicizzata.
+
+Per ogni forecast il catalogo conserva anche il rollup della domanda
+(QUANTITA per articolo e settimana ISO, vedi src/edi/demand.py), aggiornato
+insieme alla voce del forecast: la domanda complessiva per cliente è una
+query aggregata sul rollup (query_demand).
+
+Le righe dei forecast sono copiate nella tabella forecast_rows, indicizzata
+su COD. ART, ORD.VEN, COD.CLIENTE e data di consegna: ricerche e paginazione
+delle righe (query_rows / count_rows) avvengono in SQL e alla UI arriva solo
+la pagina richiesta.
+
+Il catalogo è un dato derivato: può essere ricostruito in qualsiasi momento con
+
+    python -m src.utils.forecast_index --rebuild
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+from src.utils.config import OUTPUT_DIR, BACKUP_DIR, FORECAST_INDEX_FILE, ensure_data_dirs
+from src.utils.logger import setup_logger
+from src.utils.forecast_store import is_forecast_file, read_forecast_metadata, read_forecast
+from src.edi.demand import weekly_demand, DATE_FORMAT
+from src.edi.diff import quantity_to_float
+from src.utils.backup_store import find_backup
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("forecast_index")
+
+# Incrementare quando cambia lo schema: il catalogo viene ricostruito da zero
+SCHEMA_VERSION = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    filename          TEXT PRIMARY KEY,
+    customer          TEXT NOT NULL,
+    timestamp         TEXT NOT NULL,
+    original_filename TEXT,
+    original_key      TEXT,
+    content_hash      TEXT,
+    row_count         INTEGER NOT NULL,
+    byte_size         INTEGER NOT NULL,
+    mtime_ns          INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_forecasts_customer_ts ON forecasts (customer, timestamp);
+CREATE INDEX IF NOT EXISTS idx_forecasts_ts ON forecasts (timestamp);
+CREATE INDEX IF NOT EXISTS idx_forecasts_original_key ON forecasts (original_key);
+CREATE INDEX IF NOT EXISTS idx_forecasts_content_hash ON forecasts (content_hash);
+
+CREATE TABLE IF NOT EXISTS demand_rollup (
+    filename TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    article  TEXT NOT NULL,
+    week     TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    rows     INTEGER NOT NULL,
+    PRIMARY KEY (filename, article, week)
+);
+-- Indice "coprente": la query per cliente non legge la tabella
+CREATE INDEX IF NOT EXISTS idx_demand_customer_article_week ON demand_rollup (customer, article, week, quantity, rows);
+CREATE INDEX IF NOT EXISTS idx_demand_week ON demand_rollup (week);
+
+CREATE TABLE IF NOT EXISTS forecast_rows (
+    filename    TEXT NOT NULL,
+    customer    TEXT NOT NULL,
+    row_no      INTEGER NOT NULL,
+    ord_hyd     TEXT,
+    cod_cliente TEXT,
+    cod_art     TEXT,
+    descrizione TEXT,
+    ocli_gare   TEXT,
+    quantita    TEXT,
+    consegna    TEXT,
+    ord_ven     TEXT,
+    quantity    REAL,
+    delivery    TEXT,
+    PRIMARY KEY (filename, row_no)
+);
+CREATE INDEX IF NOT EXISTS idx_rows_article_delivery ON forecast_rows (cod_art, delivery);
+CREATE INDEX IF NOT EXISTS idx_rows_order ON forecast_rows (ord_ven);
+CREATE INDEX IF NOT EXISTS idx_rows_customer_code ON forecast_rows (cod_cliente, delivery);
+CREATE INDEX IF NOT EXISTS idx_rows_customer_delivery ON forecast_rows (customer, delivery);
+CREATE INDEX IF NOT EXISTS idx_rows_delivery ON forecast_rows (delivery);
+"""
+
+# Colonne del forecast -> colonne di forecast_rows (valori come nel file)
+ROW_COLUMNS = {
+    "ORD.HYD": "ord_hyd",
+    "COD.CLIENTE": "cod_cliente",
+    "COD. ART": "cod_art",
+    "DESCRIZIONE": "descrizione",
+    "OCLI GARE": "ocli_gare",
+    "QUANTITA": "quantita",
+    "CONSEGNA": "consegna",
+    "ORD.VEN": "ord_ven",
+}
+
+
+# -----------------------------
+# CONNESSIONE
+# -----------------------------
+@contextmanager
+def _connect():
+    """Apre una connessione al catalogo, creando/aggiornando lo schema se necessario."""
+    os.makedirs(os.path.dirname(FORECAST_INDEX_FILE), exist_ok=True)
+    conn = sqlite3.connect(FORECAST_INDEX_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            # Schema obsoleto: il catalogo è derivato, quindi lo si ricrea
+            conn.execute("DROP TABLE IF EXISTS forecasts")
+            conn.execute("DROP TABLE IF EXISTS demand_rollup")
+            conn.execute("DROP TABLE IF EXISTS forecast_rows")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript(_SCHEMA)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+_synced = False
+
+
+def original_key(filename):
+    """Chiave di confronto per il nome file originale: basename minuscolo senza estensione."""
+    if not filename:
+        return None
+    return os.path.splitext(os.path.basename(filename))[0].lower()
+
+
+def compute_content_hash(content) -> str:
+    """SHA-256 esadecimale del contenuto caricato (str codificata UTF-8 o bytes)."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content or b"").hexdigest()
+
+
+def _legacy_content_hash(meta):
+    """
+    Per i forecast salvati prima dell'introduzione di `content_sha256` l'hash
+    viene ricavato dal backup scritto nello stesso salvataggio, se presente
+    (nell'archivio dei backup o come BACKUP_*.txt non ancora importato).
+    """
+    original = meta.get("original_filename")
+    if not original:
+        return None
+    entry = find_backup(original, meta.get("customer"), meta.get("timestamp"))
+    if entry and entry["timestamp"] == meta.get("timestamp"):
+        return entry["content_sha256"]
+    backup_name = f"BACKUP_{meta.get('customer')}_{os.path.splitext(original)[0]}_{meta.get('timestamp')}.txt"
+    backup_path = os.path.join(BACKUP_DIR, backup_name)
+    if not os.path.exists(backup_path):
+        return None
+    with open(backup_path, "rb") as f:
+        return compute_content_hash(f.read())
+
+
+def _build_entry(path, meta=None):
+    """
+    Costruisce la riga di catalogo per un file forecast.
+    Se `meta` (metadati + row_count) non è fornito viene letto da disco.
+    """
+    stat = os.stat(path)
+    if meta is None:
+        meta = read_forecast_metadata(path)
+
+    return {
+        "filename": os.path.basename(path),
+        "customer": meta.get("customer") or "Unknown",
+        "timestamp": meta.get("timestamp") or "",
+        "original_filename": meta.get("original_filename"),
+        "original_key": original_key(meta.get("original_filename")),
+        "content_hash": meta.get("content_sha256") or _legacy_content_hash(meta),
+        "row_count": int(meta.get("row_count") or 0),
+        "byte_size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _upsert(conn, entry):
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO forecasts
+            (filename, customer, timestamp, original_filename, original_key, content_hash,
+             row_count, byte_size, mtime_ns)
+        VALUES
+            (:filename, :customer, :timestamp, :original_filename, :original_key, :content_hash,
+             :row_count, :byte_size, :mtime_ns)
+        """,
+        entry,
+    )
+
+
+def _replace_rollup(conn, entry, df):
+    """Sostituisce il rollup della domanda del forecast (stessa transazione della voce di catalogo)."""
+    conn.execute("DELETE FROM demand_rollup WHERE filename = ?", (entry["filename"],))
+    rollup = weekly_demand(df)
+    conn.executemany(
+        "INSERT INTO demand_rollup (filename, customer, article, week, quantity, rows) VALUES (?, ?, ?, ?, ?, ?)",
+        [(entry["filename"], entry["customer"], article, week, float(quantity), int(rows))
+         for article, week, quantity, rows in rollup.itertuples(index=False)],
+    )
+
+
+def _replace_rows(conn, entry, df):
+    """Sostituisce le righe del forecast, con QUANTITA e CONSEGNA anche tipizzate per filtri e ordinamento."""
+    conn.execute("DELETE FROM forecast_rows WHERE filename = ?", (entry["filename"],))
+    if df is None or df.empty:
+        return
+    frame = df.reindex(columns=list(ROW_COLUMNS)).astype(object)
+    frame = frame.where(frame.notna(), None)
+    quantity = quantity_to_float(df["QUANTITA"]) if "QUANTITA" in df else pd.Series(float("nan"), index=df.index)
+    delivery = (pd.to_datetime(df["CONSEGNA"].astype("string").str.strip(), format=DATE_FORMAT, errors="coerce")
+                if "CONSEGNA" in df else pd.Series(pd.NaT, index=df.index))
+    frame["quantity"] = quantity.astype(object).where(quantity.notna(), None).to_numpy()
+    frame["delivery"] = delivery.dt.strftime("%Y-%m-%d").astype(object).where(delivery.notna(), None).to_numpy()
+    columns = ", ".join(["filename", "customer", "row_no"] + list(ROW_COLUMNS.values()) + ["quantity", "delivery"])
+    placeholders = ", ".join("?" * (len(ROW_COLUMNS) + 5))
+    conn.executemany(
+        f"INSERT INTO forecast_rows ({columns}) VALUES ({placeholders})",
+        ((entry["filename"], entry["customer"], row_no, *values)
+         for row_no, values in enumerate(frame.itertuples(index=False, name=None))),
+    )
+
+
+def _replace_data(conn, entry, df):
+    _upsert(conn, entry)
+    _replace_rollup(conn, entry, df)
+    _replace_rows(conn, entry, df)
+
+
+def _delete(conn, filename):
+    conn.execute("DELETE FROM forecasts WHERE filename = ?", (filename,))
+    conn.execute("DELETE FROM demand_rollup WHERE filename = ?", (filename,))
+    conn.execute("DELETE FROM forecast_rows WHERE filename = ?", (filename,))
+
+
+# -----------------------------
+# AGGIORNAMENTO INCREMENTALE
+# -----------------------------
+def index_forecast(path, meta=None, df=None) -> tuple[bool, str]:
+    """
+    Inserisce o aggiorna nel catalogo il forecast indicato, il suo rollup della domanda e le sue righe.
+
+    Args:
+        path: Path del file forecast appena scritto
+        meta: Metadati già in memoria, con `row_count` (evita di rileggere il file)
+        df: Righe già in memoria (evita di rileggere il file per rollup e righe)
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        if df is None:
+            file_meta, df = read_forecast(path)
+            meta = meta or {**file_meta, "row_count": len(df)}
+        entry = _build_entry(path, meta)
+        with _connect() as conn:
+            _replace_data(conn, entry, df)
+    except Exception as e:
+        logger.error(f"Error indexing forecast {path}: {e}")
+        return False, str(e)
+    logger.debug(f"Forecast indexed: {entry['filename']} ({entry['row_count']} rows)")
+    return True, "Forecast indexed successfully"
+
+
+def remove_forecast(filename) -> tuple[bool, str]:
+    """Rimuove dal catalogo il forecast indicato (solo il nome file)."""
+    try:
+        with _connect() as conn:
+            _delete(conn, os.path.basename(filename))
+    except Exception as e:
+        logger.error(f"Error removing forecast {filename} from index: {e}")
+        return False, str(e)
+    return True, "Forecast removed from index"
+
+
+def sync_index() -> int:
+    """
+    Allinea il catalogo al contenuto di OUTPUT_DIR con un solo listing della directory.
+    Vengono riletti (per intero, per rollup e righe) solo i file nuovi
+    o modificati (mtime/size diversi) e rimossi quelli non più presenti.
+    Ritorna il numero di voci aggiornate.
+    """
+    global _synced
+    on_disk = {}
+    if os.path.exists(OUTPUT_DIR):
+        with os.scandir(OUTPUT_DIR) as it:
+            for entry in it:
+                if entry.is_file() and is_forecast_file(entry.name):
+                    stat = entry.stat()
+                    on_disk[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+    changes = 0
+    with _connect() as conn:
+        indexed = {
+            row["filename"]: (row["mtime_ns"], row["byte_size"])
+            for row in conn.execute("SELECT filename, mtime_ns, byte_size FROM forecasts")
+        }
+
+        for filename in indexed.keys() - on_disk.keys():
+            _delete(conn, filename)
+            changes += 1
+
+        for filename, signature in on_disk.items():
+            if indexed.get(filename) == signature:
+                continue
+            try:
+                path = os.path.join(OUTPUT_DIR, filename)
+                meta, df = read_forecast(path)
+                _replace_data(conn, _build_entry(path, {**meta, "row_count": len(df)}), df)
+                changes += 1
+            except Exception as e:
+                logger.warning(f"Error indexing forecast file {filename}: {e}")
+
+    _synced = True
+    if changes:
+        logger.debug(f"Forecast index synchronized: {changes} entries updated")
+    return changes
+
+
+def _ensure_synced():
+    """Al primo utilizzo nel processo allinea il catalogo (es. dopo un upgrade dello schema)."""
+    if not _synced:
+        sync_index()
+
+
+def rebuild_index() -> int:
+    """Svuota e ricostruisce il catalogo leggendo tutti i forecast. Ritorna il numero di voci."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM forecasts")
+        conn.execute("DELETE FROM demand_rollup")
+        conn.execute("DELETE FROM forecast_rows")
+    sync_index()
+    count = count_forecasts()
+    logger.info(f"Forecast index rebuilt: {count} entries")
+    return count
+
+
+# -----------------------------
+# INTERROGAZIONI
+# -----------------------------
+def _where(customer):
+    if customer:
+        return " WHERE customer = ?", (customer,)
+    return "", ()
+
+
+def query_forecasts(customer=None, newest_first=True, limit=None, offset=0) -> list[dict]:
+    """
+    Restituisce le voci di catalogo filtrate, ordinate e paginate.
+
+    Args:
+        customer: Filtra per cliente (None = tutti)
+        newest_first: Ordinamento per timestamp decrescente
+        limit: Numero massimo di voci (None = tutte)
+        offset: Voci da saltare (paginazione)
+    """
+    where, params = _where(customer)
+    order = "DESC" if newest_first else "ASC"
+    sql = f"SELECT * FROM forecasts{where} ORDER BY timestamp {order}, filename {order}"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params = params + (int(limit), int(offset))
+    with _connect() as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+
+def count_forecasts(customer=None) -> int:
+    where, params = _where(customer)
+    with _connect() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM forecasts{where}", params).fetchone()[0]
+
+
+def list_customers() -> list[str]:
+    with _connect() as conn:
+        return [row[0] for row in conn.execute("SELECT DISTINCT customer FROM forecasts ORDER BY customer")]
+
+
+def find_by_original_filename(filename):
+    """
+    Restituisce la voce di catalogo (la più recente) il cui file originale
+    corrisponde a `filename`, altrimenti None.
+    """
+    key = original_key(filename)
+    if not key:
+        return None
+    _ensure_synced()
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM forecasts WHERE original_key = ? ORDER BY timestamp DESC LIMIT 1",
+            (key,),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def find_by_content_hash(content_hash):
+    """Restituisce la voce di catalogo (la più recente) con lo stesso hash di contenuto, altrimenti None."""
+    if not content_hash:
+        return None
+    _ensure_synced()
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM forecasts WHERE content_hash = ? ORDER BY timestamp DESC LIMIT 1",
+            (content_hash,),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def get_forecast_stats(customer=None) -> dict:
+    """Statistiche aggregate: numero di forecast, righe totali e clienti distinti."""
+    where, params = _where(customer)
+    with _connect() as conn:
+        row = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(row_count), 0), COUNT(DISTINCT customer) FROM forecasts{where}",
+            params,
+        ).fetchone()
+    return {"records": row[0], "total_rows": row[1], "customers": row[2]}
+
+
+def _demand_where(customer=None, articles=None, week_from=None, week_to=None):
+    clauses, params = [], []
+    if customer:
+        clauses.append("customer = ?")
+        params.append(customer)
+    if articles:
+        clauses.append(f"article IN ({', '.join('?' * len(articles))})")
+        params.extend(articles)
+    if week_from:
+        clauses.append("week >= ?")
+        params.append(week_from)
+    if week_to:
+        clauses.append("week <= ?")
+        params.append(week_to)
+    return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+def query_demand(customer=None, articles=None, week_from=None, week_to=None) -> pd.DataFrame:
+    """
+    Domanda complessiva dei forecast correnti: QUANTITA per articolo e settimana ISO.
+
+    Args:
+        customer: Filtra per cliente (None = tutti)
+        articles: Lista di COD. ART (None = tutti)
+        week_from / week_to: Intervallo di settimane 'YYYY-Www' (estremi inclusi)
+
+    Returns:
+        DataFrame: article, week, quantity, rows, forecasts (numero di forecast che contribuiscono)
+    """
+    _ensure_synced()
+    where, params = _demand_where(customer, articles, week_from, week_to)
+    # Una riga per (forecast, articolo, settimana): COUNT(*) è il numero di forecast
+    sql = (
+        "SELECT article, week, ROUND(SUM(quantity), 2), SUM(rows), COUNT(*) "
+        f"FROM demand_rollup{where} GROUP BY article, week ORDER BY article, week"
+    )
+    with _connect() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return pd.DataFrame(rows, columns=["article", "week", "quantity", "rows", "forecasts"])
+
+
+def list_demand_articles(customer=None) -> list[str]:
+    where, params = _demand_where(customer)
+    with _connect() as conn:
+        return [row[0] for row in conn.execute(f"SELECT DISTINCT article FROM demand_rollup{where} ORDER BY article", params)]
+
+
+def list_demand_weeks(customer=None) -> list[str]:
+    where, params = _demand_where(customer)
+    with _connect() as conn:
+        return [row[0] for row in conn.execute(f"SELECT DISTINCT week FROM demand_rollup{where} ORDER BY week", params)]
+
+
+# -----------------------------
+# RICERCA SULLE RIGHE
+# -----------------------------
+def _prefix_clause(column, value, clauses, params):
+    """Confronto per prefisso come intervallo, così l'indice sulla colonna viene usato."""
+    value = value.strip()
+    clauses.append(f"{column} >= ? AND {column} < ?")
+    params.extend([value, value + "\U0010ffff"])
+
+
+def _rows_where(customer=None, filename=None, article=None, order=None, customer_code=None,
+                date_from=None, date_to=None):
+    clauses, params = [], []
+    if customer:
+        clauses.append("customer = ?")
+        params.append(customer)
+    if filename:
+        clauses.append("filename = ?")
+        params.append(os.path.basename(filename))
+    if article:
+        _prefix_clause("cod_art", article.upper(), clauses, params)
+    if order:
+        _prefix_clause("ord_ven", order.upper(), clauses, params)
+    if customer_code:
+        _prefix_clause("cod_cliente", customer_code, clauses, params)
+    if date_from:
+        clauses.append("delivery >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("delivery <= ?")
+        params.append(str(date_to))
+    return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+def count_rows(**filters) -> int:
+    """Numero di righe che soddisfano i filtri (vedi query_rows)."""
+    _ensure_synced()
+    where, params = _rows_where(**filters)
+    with _connect() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM forecast_rows{where}", params).fetchone()[0]
+
+
+def query_rows(limit=50, offset=0, **filters) -> pd.DataFrame:
+    """
+    Una pagina di righe dei forecast correnti.
+
+    Filtri (tutti opzionali): customer, filename (righe di un solo forecast,
+    nell'ordine del file), article (COD. ART, per prefisso), order (ORD.VEN,
+    per prefisso), customer_code (COD.CLIENTE, per prefisso), date_from /
+    date_to (date di consegna, date o 'YYYY-MM-DD', estremi inclusi).
+
+    Returns:
+        DataFrame: colonne del forecast più Customer e Forecast (file di provenienza)
+    """
+    _ensure_synced()
+    where, params = _rows_where(**filters)
+    order_by = "row_no" if filters.get("filename") else "delivery, cod_art, customer, filename, row_no"
+    sql = (
+        f"SELECT customer, filename, {', '.join(ROW_COLUMNS.values())} FROM forecast_rows{where} "
+        f"ORDER BY {order_by} LIMIT ? OFFSET ?"
+    )
+    with _connect() as conn:
+        rows = conn.execute(sql, params + [int(limit), int(offset)]).fetchall()
+    return pd.DataFrame(rows, columns=["Customer", "Forecast"] + list(ROW_COLUMNS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the forecast catalog index")
+    parser.add_argument("--rebuild", action="store_true", help="Drop and rebuild the index from OUTPUT_DIR")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    if args.rebuild:
+        total = rebuild_index()
+    else:
+        sync_index()
+        total = count_forecasts()
+    print(f"Forecast index {FORECAST_INDEX_FILE}: {total} entries")
@@ -0,0 +1,325 @@
+"""
+Storage dei forecast salvati in OUTPUT_DIR con backend intercambiabili.
+
+- "json":    formato storico, lista di record con tutti i valori stringa
+             (indentato, leggibile a mano);
+- "parquet": formato colonnare tipizzato, QUANTITA come decimale e CONSEGNA
+             come data; i metadati (customer, timestamp, ...) sono salvati
+             nei metadati dello schema Parquet.
+
+Il backend usato per i nuovi salvataggi è scelto con FORECAST_STORAGE_FORMAT;
+la lettura riconosce il backend dall'estensione del file, quindi i due formati
+possono convivere. Per convertire i forecast JSON esistenti:
+
+    python -m src.utils.forecast_store migrate [--dry-run]
+"""
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.edi.schema import DATE_FORMAT, to_display
+from src.utils.config import OUTPUT_DIR, FORECAST_STORAGE_FORMAT, ensure_data_dirs
+from src.utils.logger import setup_logger
+from src.utils.metrics import timer
+from src.utils.file_io import atomic_write
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("forecast_store")
+
+METADATA_FIELDS = ("customer", "timestamp", "original_filename", "content_sha256")
+
+QUANTITY_TYPE = pa.decimal128(15, 2)
+_PARQUET_METADATA_KEY = b"edi_forecast"
+
+
+# -----------------------------
+# CONVERSIONI TIPIZZATE
+# -----------------------------
+def _quantity_to_typed(values):
+    """'1040,00' -> Decimal('1040.00'); None se la conversione non è reversibile."""
+    values = pc.utf8_trim_whitespace(values)
+    empty = pc.equal(values, "")
+    try:
+        typed = pc.cast(pc.replace_substring(pc.if_else(empty, None, values), ",", "."), QUANTITY_TYPE)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return None
+    return typed if pc.all(pc.equal(_quantity_to_display(typed), values)).as_py() else None
+
+
+def _quantity_to_display(values):
+    return pc.fill_null(pc.replace_substring(pc.cast(values, pa.string()), ".", ","), "")
+
+
+def _date_to_typed(values):
+    """'26.05.2025' -> date(2025, 5, 26); None se la conversione non è reversibile."""
+    values = pc.utf8_trim_whitespace(values)
+    empty = pc.equal(values, "")
+    try:
+        parsed = pc.strptime(pc.if_else(empty, None, values), format=DATE_FORMAT, unit="s")
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return None
+    typed = pc.cast(parsed, pa.date32())
+    # strptime normalizza date inesistenti (31.02 -> 03.03): si verifica il round-trip
+    return typed if pc.all(pc.equal(_date_to_display(typed), values)).as_py() else None
+
+
+def _date_to_display(values):
+    return pc.fill_null(pc.strftime(pc.cast(values, pa.timestamp("s")), format=DATE_FORMAT), "")
+
+
+_TYPED_COLUMNS = {
+    "QUANTITA": (_quantity_to_typed, _quantity_to_display),
+    "CONSEGNA": (_date_to_typed, _date_to_display),
+}
+
+
+def _as_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """Valori stringa del formato su disco, "" per i mancanti (anche nelle colonne fuori schema)."""
+    # fillna prima di astype: astype(str) scriverebbe "None"/"nan"
+    return to_display(df).fillna("").astype(str)
+
+
+def to_typed_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Converte il DataFrame (valori stringa) in tabella Arrow tipizzata.
+    Le colonne QUANTITA/CONSEGNA restano stringhe se anche un solo valore
+    non è convertibile senza perdita (es. dati modificati a mano nell'editor).
+    """
+    table = pa.Table.from_pandas(_as_strings(df), preserve_index=False)
+    for name, (to_typed, _) in _TYPED_COLUMNS.items():
+        if name not in table.column_names:
+            continue
+        typed = to_typed(table[name])
+        if typed is None:
+            logger.debug(f"Column {name} kept as string: values not convertible without loss")
+            continue
+        table = table.set_column(table.column_names.index(name), name, typed)
+    return table
+
+
+def to_display_frame(table: pa.Table) -> pd.DataFrame:
+    """Riporta una tabella tipizzata al formato stringa usato dalla UI e dal JSON."""
+    for name, (_, column_to_display) in _TYPED_COLUMNS.items():
+        if name in table.column_names and not pa.types.is_string(table.schema.field(name).type):
+            table = table.set_column(table.column_names.index(name), name, column_to_display(table[name]))
+    return table.to_pandas()
+
+
+# -----------------------------
+# BACKEND
+# -----------------------------
+class JsonForecastBackend:
+    """Formato storico: {customer, timestamp, original_filename, ..., records: [...]}"""
+
+    name = "json"
+    extension = ".json"
+
+    def write(self, path, meta, df):
+        data = {key: meta.get(key) for key in METADATA_FIELDS if key in meta}
+        data["records"] = df.to_dict(orient="records")
+        with atomic_write(path) as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+
+    def read(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            data = {}
+        records = data.pop("records", None) or []
+        return data, pd.DataFrame(records)
+
+    def read_metadata(self, path):
+        # Il JSON va comunque letto per intero: si evita solo di costruire il DataFrame
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            data = {}
+        meta = {key: data.get(key) for key in METADATA_FIELDS}
+        meta["row_count"] = len(data.get("records") or [])
+        return meta
+
+
+class ParquetForecastBackend:
+    """Formato colonnare tipizzato, metadati nello schema Parquet."""
+
+    name = "parquet"
+    extension = ".parquet"
+
+    def write(self, path, meta, df):
+        table = to_typed_table(df)
+        payload = json.dumps({key: meta.get(key) for key in METADATA_FIELDS}, ensure_ascii=False)
+        table = table.replace_schema_metadata({_PARQUET_METADATA_KEY: payload.encode("utf-8")})
+        with atomic_write(path, "wb") as f:
+            pq.write_table(table, f, compression="zstd")
+
+    def _meta_from_schema(self, schema):
+        raw = (schema.metadata or {}).get(_PARQUET_METADATA_KEY)
+        return json.loads(raw) if raw else {}
+
+    def read(self, path):
+        table = pq.read_table(path)
+        return self._meta_from_schema(table.schema), to_display_frame(table)
+
+    def read_metadata(self, path):
+        # Solo il footer del file: nessuna colonna viene letta
+        parquet_file = pq.ParquetFile(path)
+        meta = self._meta_from_schema(parquet_file.schema_arrow)
+        meta["row_count"] = parquet_file.metadata.num_rows
+        return meta
+
+
+BACKENDS = {
+    JsonForecastBackend.name: JsonForecastBackend(),
+    ParquetForecastBackend.name: ParquetForecastBackend(),
+}
+FORECAST_EXTENSIONS = tuple(backend.extension for backend in BACKENDS.values())
+
+
+def get_backend(fmt=None):
+    """Backend per il formato richiesto (default: FORECAST_STORAGE_FORMAT)."""
+    fmt = (fmt or FORECAST_STORAGE_FORMAT).lower()
+    if fmt not in BACKENDS:
+        raise ValueError(f"Unknown forecast storage format: {fmt}")
+    return BACKENDS[fmt]
+
+
+def backend_for_path(path):
+    """Backend corrispondente all'estensione del file."""
+    extension = os.path.splitext(path)[1].lower()
+    for backend in BACKENDS.values():
+        if backend.extension == extension:
+            return backend
+    raise ValueError(f"Unsupported forecast file: {path}")
+
+
+def is_forecast_file(filename):
+    return filename.lower().endswith(FORECAST_EXTENSIONS)
+
+
+def forecast_filename(customer, timestamp, fmt=None):
+    return f"forecast_{customer}_{timestamp}{get_backend(fmt).extension}"
+
+
+# -----------------------------
+# API
+# -----------------------------
+def write_forecast(path, meta, df):
+    """
+    Scrive il forecast con il backend indicato dall'estensione di `path`.
+    Accetta anche DataFrame compatti (src.edi.schema), riportati ai valori stringa.
+    """
+    df = to_display(df)
+    backend_for_path(path).write(path, meta, df)
+    logger.debug(f"Forecast written: {os.path.basename(path)} ({len(df)} rows)")
+
+
+def read_forecast(path) -> tuple[dict, pd.DataFrame]:
+    """Legge un forecast: (metadati, DataFrame con valori stringa)."""
+    with timer("forecast_read_seconds", format=os.path.splitext(path)[1].lstrip(".")):
+        return backend_for_path(path).read(path)
+
+
+def read_forecast_metadata(path) -> dict:
+    """Metadati del forecast più `row_count`."""
+    return backend_for_path(path).read_metadata(path)
+
+
+def migrate_json_to_parquet(dry_run=False) -> list[dict]:
+    """
+    Converte tutti i forecast JSON di OUTPUT_DIR in Parquet.
+    Il JSON viene rimosso solo dopo aver verificato che il Parquet restituisca
+    gli stessi dati (valori mancanti come ""); con `dry_run` vengono solo
+    misurate dimensioni e tempi. Ogni file viene convertito sotto i lock di
+    salvataggio del suo cliente e file originale (src/edi/pipeline.py); i file
+    con un Parquet omonimo già presente vengono saltati.
+
+    Returns:
+        list: una voce per file con dimensioni e tempi di caricamento dei due formati
+    """
+    # Import qui: la pipeline importa questo modulo
+    from src.edi.pipeline import forecast_lock
+
+    json_backend = BACKENDS["json"]
+    parquet_backend = BACKENDS["parquet"]
+    report = []
+
+    for filename in sorted(os.listdir(OUTPUT_DIR)):
+        if not filename.endswith(json_backend.extension):
+            continue
+        json_path = os.path.join(OUTPUT_DIR, filename)
+        parquet_path = os.path.splitext(json_path)[0] + parquet_backend.extension
+        try:
+            meta = json_backend.read_metadata(json_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Migration skipped for {filename}: {e}")
+            continue
+
+        with forecast_lock(meta.get("customer"), meta.get("original_filename")):
+            # Un salvataggio concluso nel frattempo può aver già riscritto o rimosso il JSON
+            if not os.path.exists(json_path):
+                continue
+            if os.path.exists(parquet_path):
+                logger.warning(f"Migration skipped for {filename}: {os.path.basename(parquet_path)} already exists")
+                continue
+
+            start = time.perf_counter()
+            meta, df = json_backend.read(json_path)
+            json_load = time.perf_counter() - start
+
+            parquet_backend.write(parquet_path, meta, df)
+
+            start = time.perf_counter()
+            _, df_parquet = parquet_backend.read(parquet_path)
+            parquet_load = time.perf_counter() - start
+
+            if not df_parquet.equals(df.fillna("").astype(str)):
+                logger.error(f"Migration check failed for {filename}: Parquet content differs, JSON kept")
+                os.remove(parquet_path)
+                continue
+
+            report.append({
+                "filename": filename,
+                "rows": len(df),
+                "json_bytes": os.path.getsize(json_path),
+                "parquet_bytes": os.path.getsize(parquet_path),
+                "json_load_s": json_load,
+                "parquet_load_s": parquet_load,
+            })
+            if dry_run:
+                os.remove(parquet_path)
+            else:
+                os.remove(json_path)
+                logger.info(f"Forecast migrated to Parquet: {filename}")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast storage tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Convert forecast_*.json files to Parquet")
+    migrate.add_argument("--dry-run", action="store_true", help="Only report size/load-time comparison, keep JSON files")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    if args.command == "migrate":
+        rows = migrate_json_to_parquet(dry_run=args.dry_run)
+        print(f"{'file':<45} {'rows':>7} {'json KB':>9} {'parquet KB':>11} {'json ms':>8} {'parquet ms':>11}")
+        for r in rows:
+            print(f"{r['filename']:<45} {r['rows']:>7} {r['json_bytes'] / 1024:>9.1f} {r['parquet_bytes'] / 1024:>11.1f} "
+                  f"{r['json_load_s'] * 1000:>8.2f} {r['parquet_load_s'] * 1000:>11.2f}")
+        if rows:
+            json_total = sum(r["json_bytes"] for r in rows)
+            parquet_total = sum(r["parquet_bytes"] for r in rows)
+            print(f"Total: {json_total / 1024:.1f} KB JSON -> {parquet_total / 1024:.1f} KB Parquet "
+                  f"({parquet_total / json_total:.0%} of original size)")
+
+        # Il catalogo dei forecast va riallineato ai nuovi file
+        from src.utils.forecast_index import sync_index
+        sync_index()
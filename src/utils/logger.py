@@ -1,5 +1,6 @@
 import logging
-from utils.config import LOG_FILE, LOG_LEVEL, LOG_FORMAT, LOG_DATE_FORMAT
+import os
+from src.utils.config import LOG_DIR, LOG_FILE, LOG_LEVEL, LOG_FORMAT, LOG_DATE_FORMAT
 
 def setup_logger(name):
     """
@@ -21,6 +22,7 @@ def setup_logger(name):
     logger.setLevel(LOG_LEVEL)
     
     # Handler per file
+    os.makedirs(LOG_DIR, exist_ok=True)
     file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
     file_handler.setLevel(LOG_LEVEL)
     
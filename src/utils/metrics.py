@@ -0,0 +1,277 @@
+"""
+Metriche di processo: tempi dei percorsi critici, contatori e indicatori.
+
+- timer("parse_seconds", mode="single") misura un blocco (context manager) o
+  una funzione (decoratore) e registra la durata nell'istogramma del processo;
+  le eccezioni del blocco incrementano il contatore "<nome>_errors";
+- observe() registra una durata già misurata, increment() un contatore;
+- register_collector() aggiunge indicatori letti al momento dell'export
+  (es. statistiche della cache utenti o della coda di invio).
+
+Gli istogrammi hanno bucket fissi (BUCKETS, in secondi): registrare un valore
+costa una ricerca binaria e un incremento sotto lock, senza conservare i
+singoli campioni. Le metriche vengono esposte:
+- in formato testo Prometheus da un server HTTP in un thread (METRICS_PORT,
+  es. http://127.0.0.1:9464/metrics);
+- nel log ogni METRICS_LOG_INTERVAL_SECONDS, con conteggio, media e
+  percentili stimati dai bucket.
+Entrambi sono disattivati con 0; start_exporters() li avvia una sola volta
+per processo.
+"""
+import bisect
+import threading
+import time
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.utils.config import METRICS_PORT, METRICS_HOST, METRICS_LOG_INTERVAL_SECONDS
+from src.utils.logger import setup_logger
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("metrics")
+
+PREFIX = "edi_"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_histograms = {}   # (nome, etichette) -> {"buckets": [conteggi per bucket], "sum": secondi, "count": n}
+_counters = {}     # (nome, etichette) -> valore
+_collectors = {}   # nome -> funzione che ritorna {indicatore: valore}
+_exporters_started = False
+
+
+def _series_key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+# -----------------------------
+# REGISTRAZIONE
+# -----------------------------
+def observe(name, seconds, **labels):
+    """Registra una durata (secondi) nell'istogramma `name` con le etichette indicate."""
+    key = _series_key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        position = bisect.bisect_left(BUCKETS, seconds)
+        if position < len(BUCKETS):
+            histogram["buckets"][position] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+
+def increment(name, value=1, **labels):
+    """Incrementa il contatore `name`."""
+    key = _series_key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def register_collector(name, collect):
+    """
+    Registra una funzione `collect()` -> {indicatore: valore numerico}, letta ad
+    ogni export come gauge "<name>_<indicatore>" (es. statistiche di una cache).
+    """
+    with _lock:
+        _collectors[name] = collect
+
+
+class Timer(ContextDecorator):
+    """Misura un blocco o una funzione (vedi timer)."""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.elapsed = None
+
+    def _recreate_cm(self):
+        # Come decoratore ogni chiamata usa un'istanza propria (chiamate concorrenti da più sessioni)
+        return Timer(self.name, self.labels)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._start
+        observe(self.name, self.elapsed, **self.labels)
+        # st.stop()/st.rerun() sollevano BaseException: non sono errori
+        if exc_type is not None and issubclass(exc_type, Exception):
+            increment(f"{self.name.removesuffix('_seconds')}_errors", **self.labels)
+        return False
+
+
+def timer(name, **labels) -> Timer:
+    """
+    Misura la durata di un blocco o di una funzione:
+
+        with timer("parse_seconds", mode="single"):
+            df = parse_edi_bytes(raw)
+
+        @timer("find_existing_forecast_seconds")
+        def find_existing_json(filename): ...
+    """
+    return Timer(name, labels)
+
+
+# -----------------------------
+# LETTURA
+# -----------------------------
+def _quantile(buckets, count, q):
+    """Percentile stimato dai bucket (interpolazione lineare nel bucket)."""
+    if not count:
+        return 0.0
+    target = q * count
+    cumulative = 0
+    for position, bucket_count in enumerate(buckets):
+        if cumulative + bucket_count >= target:
+            lower = BUCKETS[position - 1] if position else 0.0
+            return lower + (BUCKETS[position] - lower) * (target - cumulative) / bucket_count
+        cumulative += bucket_count
+    return BUCKETS[-1]  # oltre l'ultimo bucket
+
+
+def _collect():
+    with _lock:
+        collectors = list(_collectors.items())
+    gauges = {}
+    for name, collect in collectors:
+        try:
+            values = collect()
+        except Exception as e:
+            logger.warning(f"Metrics collector {name} failed: {e}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges[f"{name}_{key}"] = value
+    return gauges
+
+
+def snapshot() -> dict:
+    """
+    Stato corrente delle metriche:
+    {"timers": [{name, labels, count, sum, mean, p50, p95, p99}], "counters": [...], "gauges": {...}}
+    """
+    with _lock:
+        histograms = [(key, dict(value, buckets=list(value["buckets"]))) for key, value in _histograms.items()]
+        counters = list(_counters.items())
+    timers = []
+    for (name, labels), histogram in sorted(histograms):
+        count = histogram["count"]
+        timers.append({
+            "name": name,
+            "labels": dict(labels),
+            "count": count,
+            "sum": histogram["sum"],
+            "mean": histogram["sum"] / count if count else 0.0,
+            **{f"p{int(q * 100)}": _quantile(histogram["buckets"], count, q) for q in (0.5, 0.95, 0.99)},
+        })
+    return {
+        "timers": timers,
+        "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(counters)],
+        "gauges": _collect(),
+    }
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus() -> str:
+    """Metriche nel formato testo di Prometheus (text/plain; version=0.0.4)."""
+    with _lock:
+        histograms = sorted((key, dict(value, buckets=list(value["buckets"]))) for key, value in _histograms.items())
+        counters = sorted(_counters.items())
+    lines = []
+    declared = set()
+    for (name, labels), histogram in histograms:
+        metric = PREFIX + name
+        if metric not in declared:
+            declared.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, histogram["buckets"]):
+            cumulative += bucket_count
+            lines.append(f"{metric}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{metric}_bucket{_format_labels(labels, le='+Inf')} {histogram['count']}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {histogram['count']}")
+    for (name, labels), value in counters:
+        metric = f"{PREFIX}{name}_total"
+        if metric not in declared:
+            declared.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for name, value in sorted(_collect().items()):
+        lines.append(f"# TYPE {PREFIX}{name} gauge")
+        lines.append(f"{PREFIX}{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def log_snapshot():
+    """Scrive nel log una riga per timer (conteggio, media e percentili) e gli indicatori."""
+    state = snapshot()
+    for item in state["timers"]:
+        labels = ",".join(f"{key}={value}" for key, value in item["labels"].items())
+        logger.info(f"{item['name']}{{{labels}}} count={item['count']} mean={item['mean'] * 1000:.1f}ms "
+                    f"p50={item['p50'] * 1000:.1f}ms p95={item['p95'] * 1000:.1f}ms p99={item['p99'] * 1000:.1f}ms")
+    for item in state["counters"]:
+        labels = ",".join(f"{key}={value}" for key, value in item["labels"].items())
+        logger.info(f"{item['name']}{{{labels}}} total={item['value']}")
+    if state["gauges"]:
+        logger.info(" ".join(f"{name}={value:g}" for name, value in sorted(state["gauges"].items())))
+
+
+# -----------------------------
+# EXPORT
+# -----------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # nessuna riga di log per ogni scrape
+
+
+def _log_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            log_snapshot()
+        except Exception as e:
+            logger.error(f"Error writing metrics to the log: {e}")
+
+
+def start_exporters(port=METRICS_PORT, host=METRICS_HOST, log_interval=METRICS_LOG_INTERVAL_SECONDS):
+    """Avvia (una sola volta per processo) il server /metrics e la scrittura periodica nel log, se configurati."""
+    global _exporters_started
+    with _lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    if port:
+        try:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+        else:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    if log_interval:
+        threading.Thread(target=_log_loop, args=(log_interval,), name="metrics-log", daemon=True).start()
+        logger.info(f"Metrics written to the log every {log_interval:g}s")
@@ -1,127 +1,155 @@
-import requests
 import json
 from src.utils.logger import setup_logger
-from utils.config import APPRISE_NOTFICATION_ENABLED, APPRISE_URL, APPRISE_TOKEN, APPRISE_NTFY_TOKEN, APPRISE_NTFY_HOST, APPRISE_NTFY_TOPIC
+from src.utils.config import APPRISE_NOTFICATION_ENABLED, APPRISE_URL, APPRISE_TOKEN, APPRISE_NTFY_TOKEN, APPRISE_NTFY_HOST, APPRISE_NTFY_TOPIC
+from src.utils.dispatch_queue import get_dispatch_queue, check_response
+from src.utils.metrics import timer
 
 # Inizializza il logger per questa pagina
 logger = setup_logger("notification_utils")
 
+
+def _apprise_config_error(title: str, message: str):
+    """Verifica la configurazione Apprise/NTFY: ritorna il messaggio d'errore, oppure None se completa."""
+    required = [
+        (APPRISE_URL, "Apprise URL endpoint is not set. Notification not sent."),
+        (APPRISE_TOKEN, "Apprise TOKEN not found. Notification not sent."),
+        (APPRISE_NTFY_TOKEN, "Apprise NTFY TOKEN not found. Notification not sent."),
+        (APPRISE_NTFY_HOST, "Apprise NTFY HOST not found. Notification not sent."),
+        (APPRISE_NTFY_TOPIC, "Apprise NTFY TOPIC not found. Notification not sent."),
+    ]
+    for value, error_msg in required:
+        if not value:
+            logger.error(error_msg)
+            logger.debug("=== DEBUG NOTIFICATION ===\nTitle: %s\nMessage: %s\n==============", title, message)
+            return error_msg
+    return None
+
+
+def _apprise_request(title: str, message: str, priority: int = 3, tags: list = None) -> tuple[dict, dict]:
+    """Headers e payload della richiesta Apprise -> NTFY."""
+    ntfy_url = (
+        f"ntfy://{APPRISE_NTFY_HOST}/{APPRISE_NTFY_TOPIC}?"
+        f"token={APPRISE_NTFY_TOKEN}&"
+        f"priority={priority}&"
+        f"format=markdown"
+    )
+
+    # Payload Apprise
+    payload = {
+        "urls": [ntfy_url],
+        "title": title,
+        "body": message,
+        "tag": ",".join(tags) if tags else "",
+    }
+
+    # Headers
+    headers = {"Content-Type": "application/json"}
+    if APPRISE_TOKEN:
+        headers["Authorization"] = f"Bearer {APPRISE_TOKEN}"
+
+    # DEBUG logging
+    logger.debug(f"APPRISE_URL: {APPRISE_URL}")
+    logger.debug(f"APPRISE_NTFY_HOST: {APPRISE_NTFY_HOST}")
+    logger.debug(f"APPRISE_NTFY_TOPIC: {APPRISE_NTFY_TOPIC}")
+    logger.debug(f"Title: {title}")
+    logger.debug(f"Message: {message}")
+    logger.debug(f"Priority: {priority}")
+    logger.debug(f"Tags: {tags}")
+    logger.debug(f"Full NTFY URL: {ntfy_url}")
+    logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
+    return headers, payload
+
+
+@timer("notification_delivery_seconds", mode="sync")
 def apprise_send_notification(title: str, message: str, priority: int = 3, tags: list = None, click_url: str = None) -> tuple[bool, str]:
     """
-    Invia notifica tramite Apprise -> NTFY
-    
+    Invia notifica tramite Apprise -> NTFY (sincrono, attende la risposta).
+    Dalle pagine usare apprise_queue_notification.
+
     Args:
         title: Titolo della notifica
         message: Messaggio della notifica (supporta Markdown)
         priority: Priorità (1=min, 2=low, 3=default, 4=high, 5=urgent)
         tags: Lista di emoji tags (es: ["warning", "fire"])
         click_url: URL da aprire al click
-    
+
     Returns:
         tuple: (success: bool, error_message: str)
     """
-    if APPRISE_NOTFICATION_ENABLED:
-        if not APPRISE_URL:
-            error_msg = "Apprise URL endpoint is not set. Notification not sent."
-            logger.error(error_msg)
-            logger.debug("=== DEBUG NOTIFICATION ===\nTitle: %s\nMessage: %s\n==============", title, message)
-            return False, error_msg
-        else:
-            apprise_url = APPRISE_URL
+    import requests
 
-        if not APPRISE_TOKEN:
-            error_msg = "Apprise TOKEN not found. Notification not sent."
-            logger.error(error_msg)
-            logger.debug("=== DEBUG NOTIFICATION ===\nTitle: %s\nMessage: %s\n==============", title, message)
-            return False, error_msg
-        else:
-            apprise_token = APPRISE_TOKEN
+    if not APPRISE_NOTFICATION_ENABLED:
+        logger.debug("Apprise notifications are disabled. Skipping notification send.")
+        logger.debug("=== DEBUG NOTIFICATION ===\nTitle: %s\nMessage: %s\n==============", title, message)
+        return True, "Apprise notifications are disabled."
 
-        if not APPRISE_NTFY_TOKEN:
-            error_msg = "Apprise NTFY TOKEN not found. Notification not sent."
-            logger.error(error_msg)
-            logger.debug("=== DEBUG NOTIFICATION ===\nTitle: %s\nMessage: %s\n==============", title, message)
-            return False, error_msg
-        else:
-            apprise_ntfy_token = APPRISE_NTFY_TOKEN
+    error_msg = _apprise_config_error(title, message)
+    if error_msg:
+        return False, error_msg
 
-        if not APPRISE_NTFY_HOST:
-            error_msg = "Apprise NTFY HOST not found. Notification not sent."
-            logger.error(error_msg)
-            logger.debug("=== DEBUG NOTIFICATION ===\nTitle: %s\nMessage: %s\n==============", title, message)
-            return False, error_msg
-        else:
-            apprise_ntfy_host = APPRISE_NTFY_HOST 
+    try:
+        headers, payload = _apprise_request(title, message, priority, tags)
 
-        if not APPRISE_NTFY_TOPIC:
-            error_msg = "Apprise NTFY TOPIC not found. Notification not sent."
-            logger.error(error_msg)
-            logger.debug("=== DEBUG NOTIFICATION ===\nTitle: %s\nMessage: %s\n==============", title, message)
-            return False, error_msg
+        # Invio richiesta
+        response = requests.post(
+            url=APPRISE_URL,
+            headers=headers,
+            json=payload,
+            timeout=30
+        )
+
+        if response.status_code in (200, 201, 204):
+            logger.info(f"Notification sent successfully: {title}")
+            return True, ""
         else:
-            apprise_ntfy_topic = APPRISE_NTFY_TOPIC 
-
-        try:
-            ntfy_url = (
-                f"ntfy://{apprise_ntfy_host}/{apprise_ntfy_topic}?"
-                f"token={apprise_ntfy_token}&"
-                f"priority={priority}&"
-                f"format=markdown"
-            )
-        
-            # Payload Apprise
-            payload = {
-                "urls": [ntfy_url],
-                "title": title,
-                "body": message,
-                "tag": ",".join(tags) if tags else "",
-            }
-
-            # Headers
-            headers = {"Content-Type": "application/json"}
-            if apprise_token:
-                headers["Authorization"] = f"Bearer {apprise_token}"
-        
-            # DEBUG logging
-            logger.debug(f"APPRISE_URL: {apprise_url}")
-            logger.debug(f"APPRISE_NTFY_HOST: {apprise_ntfy_host}")
-            logger.debug(f"APPRISE_NTFY_TOPIC: {apprise_ntfy_topic}")
-            logger.debug(f"Title: {title}")
-            logger.debug(f"Message: {message}")
-            logger.debug(f"Priority: {priority}")
-            logger.debug(f"Tags: {tags}")
-            logger.debug(f"Full NTFY URL: {ntfy_url}")
-            logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
-        
-            # Invio richiesta
-            response = requests.post(
-                url=apprise_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-        
-            if response.status_code in (200, 201, 204):
-                logger.info(f"Notification sent successfully: {title}")
-                return True, ""
-            else:
-                error_msg = f"Apprise error: {response.status_code} {response.text}"
-                logger.error(error_msg)
-                return False, error_msg
-            
-        except requests.exceptions.Timeout:
-            error_msg = "Timeout sending notification (30s)"
-            logger.error(error_msg)
-            return False, error_msg
-        except requests.exceptions.RequestException as e:
-            error_msg = f"Connection error sending notification: {e}"
+            error_msg = f"Apprise error: {response.status_code} {response.text}"
             logger.error(error_msg)
             return False, error_msg
-        except Exception as e:
-            error_msg = f"Exception sending notification: {e}"
-            logger.error(error_msg)
-            return False, error_msg
-    else:
+
+    except requests.exceptions.Timeout:
+        error_msg = "Timeout sending notification (30s)"
+        logger.error(error_msg)
+        return False, error_msg
+    except requests.exceptions.RequestException as e:
+        error_msg = f"Connection error sending notification: {e}"
+        logger.error(error_msg)
+        return False, error_msg
+    except Exception as e:
+        error_msg = f"Exception sending notification: {e}"
+        logger.error(error_msg)
+        return False, error_msg
+
+
+@timer("notification_enqueue_seconds")
+def apprise_queue_notification(title: str, message: str, priority: int = 3, tags: list = None, click_url: str = None) -> tuple[bool, str]:
+    """
+    Accoda la notifica nella coda di invio in background e ritorna subito
+    (stessi argomenti e valori di ritorno di apprise_send_notification).
+    """
+    if not APPRISE_NOTFICATION_ENABLED:
         logger.debug("Apprise notifications are disabled. Skipping notification send.")
         logger.debug("=== DEBUG NOTIFICATION ===\nTitle: %s\nMessage: %s\n==============", title, message)
-        return True, "Apprise notifications are disabled."    
\ No newline at end of file
+        return True, "Apprise notifications are disabled."
+
+    error_msg = _apprise_config_error(title, message)
+    if error_msg:
+        return False, error_msg
+
+    try:
+        get_dispatch_queue().enqueue("notification", {
+            "title": title, "message": message, "priority": priority, "tags": tags,
+        })
+    except Exception as e:
+        error_msg = f"Exception queueing notification: {e}"
+        logger.error(error_msg)
+        return False, error_msg
+    return True, ""
+
+
+@timer("notification_delivery_seconds", mode="queued")
+def apprise_deliver(session, payload):
+    """Funzione di invio usata dalla coda: solleva DispatchError/RequestException in caso di errore."""
+    headers, body = _apprise_request(payload["title"], payload["message"], payload.get("priority", 3), payload.get("tags"))
+    response = session.post(url=APPRISE_URL, headers=headers, json=body, timeout=30)
+    check_response(response, ok_status=(200, 201, 204))
+    logger.info(f"Notification sent successfully: {payload['title']}")
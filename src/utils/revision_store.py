@@ -0,0 +1,352 @@
+"""
+Storico delle revisioni dei forecast (upload successivi dello stesso file originale).
+
+Il forecast corrente resta in OUTPUT_DIR; qui si conserva la sua storia in
+forma compatta, una cartella per file originale (REVISION_DIR/<original_key>/):
+
+- r000001.json, r000002.json, ...: una revisione per salvataggio. Ogni
+  REVISION_SNAPSHOT_INTERVAL revisioni (e alla prima) viene salvata la copia
+  completa delle righe ("snapshot"); le altre contengono solo il delta
+  rispetto alla revisione precedente (righe aggiunte, rimosse, modificate);
+- manifest.json: intestazioni di tutte le revisioni (numero, tipo, timestamp,
+  righe, conteggi del delta, dimensione su disco), per elencare lo storico
+  senza leggere le revisioni.
+
+Per ricostruire una revisione, anche "com'era il forecast alla data T"
+(load_as_of), si parte dallo snapshot precedente più vicino e si applicano al
+massimo REVISION_SNAPSHOT_INTERVAL - 1 delta: il costo di lettura dipende
+dall'intervallo tra snapshot, non dalla lunghezza dello storico.
+
+Lo storico è solo in aggiunta: le revisioni non vengono mai riscritte (solo
+quelle di un salvataggio non riuscito vengono scartate, vedi discard_revisions).
+
+    python -m src.utils.revision_store list FILE
+    python -m src.utils.revision_store show FILE [--revision N | --as-of YYYYmmdd_HHMMSS] [--output out.csv]
+    python -m src.utils.revision_store report
+    python -m src.utils.revision_store import-backups [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+
+from src.utils.config import REVISION_DIR, REVISION_SNAPSHOT_INTERVAL, ensure_data_dirs
+from src.utils.logger import setup_logger
+from src.utils.file_io import atomic_write
+from src.utils.backup_store import list_backups, read_backup, import_legacy
+from src.edi.diff import diff_forecasts, to_delta, apply_delta, summarize
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("revision_store")
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+_MANIFEST = "manifest.json"
+
+
+def _history_dir(original_filename):
+    key = os.path.splitext(os.path.basename(original_filename))[0].lower()
+    return os.path.join(REVISION_DIR, key)
+
+
+def _revision_path(history_dir, revision):
+    return os.path.join(history_dir, f"r{revision:06d}.json")
+
+
+def _write_json(path, data, indent=None):
+    with atomic_write(path) as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Impronta del contenuto (colonne, valori e ordine delle righe) di un forecast."""
+    frame = df.reset_index(drop=True).astype(object)
+    frame = frame.where(frame.notna(), "").astype(str)
+    digest = hashlib.sha256("\x1f".join(map(str, frame.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# -----------------------------
+# LETTURA
+# -----------------------------
+def list_revisions(original_filename) -> list[dict]:
+    """Intestazioni delle revisioni del file originale, dalla più vecchia (vuota se non c'è storico)."""
+    path = os.path.join(_history_dir(original_filename), _MANIFEST)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _read_revision(history_dir, revision):
+    with open(_revision_path(history_dir, revision), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_revision(original_filename, revision=None) -> tuple[dict, pd.DataFrame]:
+    """
+    Ricostruisce una revisione (default: l'ultima) come (intestazione, DataFrame):
+    snapshot precedente più vicino + delta successivi.
+    """
+    revisions = list_revisions(original_filename)
+    if not revisions:
+        raise FileNotFoundError(f"No revision history for {original_filename}")
+    by_number = {r["revision"]: r for r in revisions}
+    revision = revision or revisions[-1]["revision"]
+    if revision not in by_number:
+        raise KeyError(f"Revision {revision} not found for {original_filename}")
+
+    base = max(r["revision"] for r in revisions if r["kind"] == SNAPSHOT and r["revision"] <= revision)
+    history_dir = _history_dir(original_filename)
+    snapshot = _read_revision(history_dir, base)
+    df = pd.DataFrame(snapshot["records"], columns=snapshot["columns"])
+    for number in range(base + 1, revision + 1):
+        df = apply_delta(df, _read_revision(history_dir, number)["delta"])
+    return by_number[revision], df
+
+
+def _timestamp_key(when):
+    """datetime o stringa (YYYYmmdd_HHMMSS, anche parziale, oppure ISO) -> stringa confrontabile."""
+    if isinstance(when, datetime):
+        return when.strftime("%Y%m%d_%H%M%S")
+    text = str(when).strip()
+    if re.fullmatch(r"\d{8}(_\d{1,6})?", text):
+        date, _, time_part = text.partition("_")
+        return f"{date}_{time_part.ljust(6, '9')}" if time_part else f"{date}_235959"
+    return datetime.fromisoformat(text).strftime("%Y%m%d_%H%M%S")
+
+
+def revision_as_of(original_filename, when):
+    """Intestazione dell'ultima revisione salvata entro `when`, altrimenti None."""
+    limit = _timestamp_key(when)
+    candidates = [r for r in list_revisions(original_filename) if (r.get("timestamp") or "") <= limit]
+    return candidates[-1] if candidates else None
+
+
+def load_as_of(original_filename, when) -> tuple[dict, pd.DataFrame]:
+    """Forecast com'era alla data `when` (datetime o 'YYYYmmdd[_HHMMSS]')."""
+    header = revision_as_of(original_filename, when)
+    if header is None:
+        raise KeyError(f"No revision of {original_filename} saved before {when}")
+    return load_revision(original_filename, header["revision"])
+
+
+# -----------------------------
+# SCRITTURA
+# -----------------------------
+def _append(history_dir, revisions, header, body):
+    path = _revision_path(history_dir, header["revision"])
+    _write_json(path, {**header, **body})
+    header["byte_size"] = os.path.getsize(path)
+    revisions.append(header)
+    _write_json(os.path.join(history_dir, _MANIFEST), revisions, indent=2)
+    return header
+
+
+def _header(revision, kind, meta, df):
+    return {
+        "revision": revision,
+        "kind": kind,
+        "timestamp": meta.get("timestamp"),
+        "customer": meta.get("customer"),
+        "original_filename": meta.get("original_filename"),
+        "content_sha256": meta.get("content_sha256"),
+        "row_count": len(df),
+        "fingerprint": frame_fingerprint(df),
+    }
+
+
+def _snapshot_body(df):
+    frame = df.reset_index(drop=True).astype(object)
+    frame = frame.where(frame.notna(), "").astype(str)
+    return {"columns": list(frame.columns), "records": frame.values.tolist()}
+
+
+def record_revision(meta, df, previous=None) -> dict:
+    """
+    Registra una nuova revisione del forecast.
+
+    Args:
+        meta: Metadati del forecast salvato (customer, timestamp, original_filename, ...)
+        df: Righe salvate
+        previous: (meta, DataFrame) del forecast sovrascritto, se presente
+
+    Returns:
+        dict: intestazione della revisione (numero, tipo, conteggi del delta)
+    """
+    original_filename = meta["original_filename"]
+    history_dir = _history_dir(original_filename)
+    os.makedirs(history_dir, exist_ok=True)
+    revisions = list_revisions(original_filename)
+
+    # Forecast salvato prima dell'introduzione dello storico: diventa la revisione 1
+    if not revisions and previous is not None:
+        previous_meta, previous_df = previous
+        _append(history_dir, revisions, _header(1, SNAPSHOT, {**meta, **previous_meta}, previous_df),
+                _snapshot_body(previous_df))
+
+    number = revisions[-1]["revision"] + 1 if revisions else 1
+    last = revisions[-1] if revisions else None
+    # Il delta si calcola rispetto al forecast sovrascritto solo se coincide con l'ultima revisione
+    chained = previous is not None and last is not None and frame_fingerprint(previous[1]) == last["fingerprint"]
+
+    if not chained or (number - 1) % REVISION_SNAPSHOT_INTERVAL == 0:
+        header = _append(history_dir, revisions, _header(number, SNAPSHOT, meta, df), _snapshot_body(df))
+    else:
+        diff = diff_forecasts(previous[1], df)
+        header = _header(number, DELTA, meta, df)
+        header["changes"] = summarize(diff)
+        header = _append(history_dir, revisions, header, {"delta": to_delta(diff)})
+
+    logger.info(f"Revision {number} ({header['kind']}) recorded for {original_filename}")
+    return header
+
+
+def discard_revisions(original_filename, keep):
+    """
+    Scarta le revisioni successive alle prime `keep` (annullamento di un
+    salvataggio non riuscito): prima il manifest, poi i file delle revisioni.
+    """
+    history_dir = _history_dir(original_filename)
+    revisions = list_revisions(original_filename)
+    if len(revisions) <= keep:
+        return
+    _write_json(os.path.join(history_dir, _MANIFEST), revisions[:keep], indent=2)
+    for header in revisions[keep:]:
+        path = _revision_path(history_dir, header["revision"])
+        if os.path.exists(path):
+            os.remove(path)
+    logger.info(f"Discarded {len(revisions) - keep} uncommitted revisions of {original_filename}")
+
+
+# -----------------------------
+# REPORT E IMPORTAZIONE
+# -----------------------------
+def _backups_by_file():
+    """Voci dell'archivio dei backup raggruppate per file originale (dalla più vecchia)."""
+    groups = defaultdict(list)
+    for entry in list_backups():
+        if entry["original_key"]:
+            groups[entry["original_key"]].append(entry)
+    return groups
+
+
+def storage_report() -> list[dict]:
+    """
+    Confronto, per ogni file con storico, tra lo spazio occupato dalle revisioni
+    e quello di una copia completa per salvataggio (stimato dalla dimensione
+    media per riga degli snapshot), più i file originali nell'archivio dei backup.
+    Il manifest è escluso: è un indice, come il catalogo dei forecast.
+    """
+    backups = _backups_by_file()
+    report = []
+    if not os.path.exists(REVISION_DIR):
+        return report
+    for key in sorted(os.listdir(REVISION_DIR)):
+        manifest = os.path.join(REVISION_DIR, key, _MANIFEST)
+        if not os.path.exists(manifest):
+            continue
+        with open(manifest, "r", encoding="utf-8") as f:
+            revisions = json.load(f)
+        if not revisions:
+            continue
+        snapshots = [r for r in revisions if r["kind"] == SNAPSHOT]
+        snapshot_rows = sum(r["row_count"] for r in snapshots)
+        bytes_per_row = sum(r["byte_size"] for r in snapshots) / snapshot_rows if snapshot_rows else 0
+        stored = sum(r["byte_size"] for r in revisions)
+        full_copies = int(sum(r["row_count"] for r in revisions) * bytes_per_row)
+        report.append({
+            "file": revisions[-1].get("original_filename") or key,
+            "revisions": len(revisions),
+            "snapshots": len(snapshots),
+            "stored_bytes": stored,
+            "full_copy_bytes": full_copies,
+            "backups": len(backups.get(key, [])),
+            "backup_bytes": sum(e["byte_size"] for e in backups.get(key, [])),
+        })
+    return report
+
+
+def import_backups(dry_run=False) -> list[dict]:
+    """
+    Crea lo storico dei file che non ne hanno ancora uno a partire
+    dall'archivio dei backup (inclusi i BACKUP_*.txt non ancora importati),
+    in ordine di timestamp: una revisione per backup.
+    """
+    from src.edi.parser import parse_edi_bytes
+
+    if not dry_run:
+        import_legacy()
+    imported = []
+    for key, entries in sorted(_backups_by_file().items()):
+        original_filename = entries[-1]["original_filename"]
+        if list_revisions(original_filename):
+            continue
+        previous = None
+        for entry in entries:
+            df = parse_edi_bytes(read_backup(entry))
+            meta = {"customer": entry["customer"], "timestamp": entry["timestamp"],
+                    "original_filename": original_filename, "content_sha256": entry["content_sha256"]}
+            if not dry_run:
+                record_revision(meta, df, previous)
+            previous = (meta, df)
+        imported.append({"file": original_filename, "revisions": len(entries)})
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast revision history")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    cmd_list = subparsers.add_parser("list", help="List the revisions of an original file")
+    cmd_list.add_argument("file", help="Original file name (e.g. C_213CBDELFORNA.txt)")
+    cmd_show = subparsers.add_parser("show", help="Rebuild a revision of an original file")
+    cmd_show.add_argument("file", help="Original file name")
+    cmd_show.add_argument("--revision", type=int, help="Revision number (default: latest)")
+    cmd_show.add_argument("--as-of", help="Forecast as it was at this time (YYYYmmdd[_HHMMSS] or ISO date)")
+    cmd_show.add_argument("--output", help="Write the rows to this CSV file instead of printing them")
+    subparsers.add_parser("report", help="Storage used by the history compared with full copies")
+    cmd_import = subparsers.add_parser("import-backups", help="Build the history of files without one from the TXT backups")
+    cmd_import.add_argument("--dry-run", action="store_true", help="Only list what would be imported")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    if args.command == "list":
+        print(f"{'rev':>4} {'kind':<9} {'timestamp':<16} {'rows':>6} {'+':>5} {'-':>5} {'~':>5} {'KB':>8}")
+        for r in list_revisions(args.file):
+            changes = r.get("changes") or {}
+            print(f"{r['revision']:>4} {r['kind']:<9} {r.get('timestamp') or '':<16} {r['row_count']:>6} "
+                  f"{changes.get('added', ''):>5} {changes.get('removed', ''):>5} {changes.get('changed', ''):>5} "
+                  f"{r['byte_size'] / 1024:>8.1f}")
+
+    elif args.command == "show":
+        if args.as_of:
+            header, df = load_as_of(args.file, args.as_of)
+        else:
+            header, df = load_revision(args.file, args.revision)
+        print(f"Revision {header['revision']} ({header['kind']}) saved {header.get('timestamp')}: {len(df)} rows")
+        if args.output:
+            df.to_csv(args.output, index=False, sep=";", encoding="utf-8-sig")
+        else:
+            print(df.to_string(index=False))
+
+    elif args.command == "report":
+        rows = storage_report()
+        print(f"{'file':<30} {'revs':>5} {'snaps':>5} {'history KB':>11} {'full copies KB':>15} {'originals KB':>13}")
+        for r in rows:
+            print(f"{r['file']:<30} {r['revisions']:>5} {r['snapshots']:>5} {r['stored_bytes'] / 1024:>11.1f} "
+                  f"{r['full_copy_bytes'] / 1024:>15.1f} {r['backup_bytes'] / 1024:>13.1f}")
+        if rows:
+            stored = sum(r["stored_bytes"] for r in rows)
+            full = sum(r["full_copy_bytes"] for r in rows)
+            print(f"Total: {stored / 1024:.1f} KB of history vs {full / 1024:.1f} KB as full copies "
+                  f"({1 - stored / full:.0%} saved)" if full else f"Total: {stored / 1024:.1f} KB of history")
+
+    elif args.command == "import-backups":
+        for entry in import_backups(dry_run=args.dry_run):
+            print(f"{entry['file']}: {entry['revisions']} revisions {'to import' if args.dry_run else 'imported'}")
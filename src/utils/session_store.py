@@ -0,0 +1,313 @@
+"""
+Dati di sessione della pagina di upload con budget di memoria.
+
+Il testo del file caricato e il DataFrame restano in sessione fino al
+salvataggio o al reset: con più utenti e stampe grandi la memoria del
+processo Streamlit cresceva senza limiti. I valori vengono quindi registrati
+qui, per sessione, e in st.session_state resta solo un SessionHandle.
+
+- Budget per sessione (SESSION_MEMORY_BUDGET_MB): oltre il budget i valori
+  della sessione usati meno di recente vengono scritti su disco in
+  SESSION_DIR/<namespace>/<session_id>/ (DataFrame in Parquet, testo in
+  UTF-8) e riletti su richiesta; un valore più grande del budget va
+  direttamente su disco.
+- Budget del processo (SESSION_GLOBAL_BUDGET_MB): si scaricano su disco prima
+  i valori delle sessioni inattive da più tempo (LRU).
+- I dati delle sessioni inattive da più di SESSION_EXPIRY_HOURS vengono
+  eliminati: Streamlit non segnala la chiusura di una sessione.
+
+Ogni processo scrive nel proprio namespace (worker-<host>-<EDI_WORKER_ID>,
+altrimenti proc-<host>-<pid>): con più worker sulla stessa directory dei
+dati un processo elimina solo i dati propri rimasti da un avvio precedente e
+quelli dei processi terminati sullo stesso host, mai le sessioni attive degli
+altri worker.
+
+Un valore riletto dal disco torna in memoria solo se rientra nei budget; il
+file resta valido finché il valore non viene sostituito, così scaricarlo di
+nuovo non richiede una nuova scrittura.
+"""
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from src.edi.schema import frame_memory
+from src.utils.config import (
+    SESSION_DIR, SESSION_MEMORY_BUDGET_MB, SESSION_GLOBAL_BUDGET_MB, SESSION_EXPIRY_HOURS, WORKER_ID
+)
+from src.utils.logger import setup_logger
+from src.utils.metrics import register_collector
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("session_store")
+
+_MB = 1024 * 1024
+_STALE_PURGE_SECONDS = 3600
+
+_entries = OrderedDict()  # (session_id, key) -> voce, dalla meno alla più usata di recente
+_last_seen = {}           # session_id -> ultimo accesso (time.time())
+_lock = threading.RLock()
+_stale_purged_at = 0.0
+
+
+class SessionHandle:
+    """Riferimento a un valore del session store, salvato in st.session_state al posto del valore."""
+
+    __slots__ = ("session_id", "key")
+
+    def __init__(self, session_id, key):
+        self.session_id = session_id
+        self.key = key
+
+    def load(self):
+        """Valore registrato; KeyError se è stato rilasciato o è scaduto."""
+        return get(self.session_id, self.key)
+
+    def __repr__(self):
+        return f"SessionHandle({self.session_id!r}, {self.key!r})"
+
+
+# -----------------------------
+# SPILL SU DISCO
+# -----------------------------
+def _value_bytes(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        return frame_memory(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+def _namespace():
+    """Directory di questo processo in SESSION_DIR (stabile tra i riavvii di un worker)."""
+    host = socket.gethostname()
+    return f"worker-{host}-{WORKER_ID}" if WORKER_ID else f"proc-{host}-{os.getpid()}"
+
+
+def _session_dir(session_id):
+    return os.path.join(SESSION_DIR, _namespace(), session_id)
+
+
+def _spill_path(session_id, key, kind):
+    extension = {"frame": ".parquet", "text": ".txt", "bytes": ".bin"}[kind]
+    return os.path.join(_session_dir(session_id), key.replace("/", "__") + extension)
+
+
+def _write_spill(path, kind, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if kind == "frame":
+        # Parquet conserva i tipi compatti (categoriche, stringhe pyarrow, date)
+        value.to_parquet(tmp_path, engine="pyarrow", compression="zstd")
+    elif kind == "text":
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            f.write(value)
+    else:
+        with open(tmp_path, "wb") as f:
+            f.write(value)
+    os.replace(tmp_path, path)
+
+
+def _read_spill(path, kind):
+    if kind == "frame":
+        df = pd.read_parquet(path, engine="pyarrow", memory_map=True)
+        # pandas rilegge le colonne "string" con storage python: si ripristina pyarrow
+        strings = [column for column, dtype in df.dtypes.items() if isinstance(dtype, pd.StringDtype)]
+        return df.astype({column: pd.StringDtype("pyarrow") for column in strings}) if strings else df
+    if kind == "text":
+        with open(path, encoding="utf-8", newline="") as f:
+            return f.read()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _remove_file(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _spill(entry_key, entry):
+    """Libera la memoria di una voce scrivendola su disco (se non c'è già una copia valida)."""
+    session_id, key = entry_key
+    if entry["path"] is None:
+        path = _spill_path(session_id, key, entry["kind"])
+        start = time.perf_counter()
+        _write_spill(path, entry["kind"], entry["value"])
+        entry["path"] = path
+        entry["disk_bytes"] = os.path.getsize(path)
+        logger.debug(f"Spilled {key} of session {session_id[:8]} to disk: {entry['bytes'] / _MB:.1f} MB in memory -> "
+                     f"{entry['disk_bytes'] / _MB:.1f} MB on disk ({(time.perf_counter() - start) * 1000:.0f} ms)")
+    entry["value"] = None
+
+
+# -----------------------------
+# BUDGET
+# -----------------------------
+def _memory_bytes(session_id=None) -> int:
+    return sum(entry["bytes"] for (owner, _), entry in _entries.items()
+               if entry["value"] is not None and (session_id is None or owner == session_id))
+
+
+def _enforce_budgets(session_id):
+    """Scarica su disco le voci in eccesso: prima nella sessione, poi nelle sessioni inattive da più tempo."""
+    session_budget = SESSION_MEMORY_BUDGET_MB * _MB
+    session_bytes = _memory_bytes(session_id)
+    for entry_key, entry in list(_entries.items()):
+        if session_bytes <= session_budget:
+            break
+        if entry_key[0] == session_id and entry["value"] is not None:
+            session_bytes -= entry["bytes"]
+            _spill(entry_key, entry)
+
+    global_budget = SESSION_GLOBAL_BUDGET_MB * _MB
+    total_bytes = _memory_bytes()
+    if total_bytes <= global_budget:
+        return
+    # Sessioni dalla meno recente; la sessione corrente per ultima
+    by_idleness = sorted(_entries.items(), key=lambda item: (item[0][0] == session_id, _last_seen.get(item[0][0], 0)))
+    for entry_key, entry in by_idleness:
+        if total_bytes <= global_budget:
+            break
+        if entry["value"] is not None:
+            total_bytes -= entry["bytes"]
+            logger.info(f"Memory budget exceeded: evicting {entry_key[1]} of idle session {entry_key[0][:8]}")
+            _spill(entry_key, entry)
+
+
+def _fits(session_id, extra_bytes) -> bool:
+    return (_memory_bytes(session_id) + extra_bytes <= SESSION_MEMORY_BUDGET_MB * _MB
+            and _memory_bytes() + extra_bytes <= SESSION_GLOBAL_BUDGET_MB * _MB)
+
+
+# -----------------------------
+# API
+# -----------------------------
+def put(session_id, key, value) -> SessionHandle:
+    """
+    Registra (o sostituisce) il valore `key` della sessione. Accetta DataFrame,
+    testo e bytes. Ritorna l'handle da tenere in st.session_state.
+    """
+    if isinstance(value, pd.DataFrame):
+        kind = "frame"
+    elif isinstance(value, str):
+        kind = "text"
+    elif isinstance(value, (bytes, bytearray)):
+        kind = "bytes"
+    else:
+        raise TypeError(f"Unsupported session value: {type(value).__name__}")
+
+    with _lock:
+        expire_idle()
+        _last_seen[session_id] = time.time()
+        entry_key = (session_id, key)
+        previous = _entries.pop(entry_key, None)
+        if previous:
+            _remove_file(previous["path"])
+        _entries[entry_key] = {"kind": kind, "value": value, "bytes": _value_bytes(value),
+                               "path": None, "disk_bytes": 0}
+        _enforce_budgets(session_id)
+    return SessionHandle(session_id, key)
+
+
+def get(session_id, key):
+    """Valore registrato (riletto dal disco se scaricato); KeyError se non esiste."""
+    with _lock:
+        entry_key = (session_id, key)
+        entry = _entries[entry_key]
+        _last_seen[session_id] = time.time()
+        _entries.move_to_end(entry_key)
+        if entry["value"] is not None:
+            return entry["value"]
+        value = _read_spill(entry["path"], entry["kind"])
+        if _fits(session_id, entry["bytes"]):
+            entry["value"] = value
+        return value
+
+
+def release(session_id, prefix=""):
+    """Elimina i valori della sessione (quelli con chiave che inizia con `prefix`). Ritorna quanti."""
+    with _lock:
+        released = [entry_key for entry_key in _entries if entry_key[0] == session_id and entry_key[1].startswith(prefix)]
+        for entry_key in released:
+            _remove_file(_entries.pop(entry_key)["path"])
+        if not any(owner == session_id for owner, _ in _entries):
+            _last_seen.pop(session_id, None)
+            shutil.rmtree(_session_dir(session_id), ignore_errors=True)
+    return len(released)
+
+
+def _pid_alive(pid) -> bool:
+    if os.name == "nt":
+        return True  # os.kill(pid, 0) su Windows termina il processo: nessuna pulizia
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _purge_stale(now, max_idle):
+    """
+    Elimina i dati scaricati che nessun processo può più rileggere: le sessioni
+    del proprio namespace non registrate qui (avvio precedente dello stesso
+    worker), i namespace dei processi terminati su questo host e le directory
+    scadute del layout precedente (SESSION_DIR/<session_id>).
+    """
+    if not os.path.isdir(SESSION_DIR):
+        return
+    own = _namespace()
+    dead_prefix = f"proc-{socket.gethostname()}-"
+    for name in os.listdir(SESSION_DIR):
+        path = os.path.join(SESSION_DIR, name)
+        if name == own:
+            for session_id in os.listdir(path):
+                if session_id not in _last_seen:
+                    shutil.rmtree(os.path.join(path, session_id), ignore_errors=True)
+        elif name.startswith(dead_prefix) and name[len(dead_prefix):].isdigit():
+            if not _pid_alive(int(name[len(dead_prefix):])):
+                shutil.rmtree(path, ignore_errors=True)
+        elif not name.startswith(("proc-", "worker-")) and now - os.path.getmtime(path) > max_idle:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def expire_idle(now=None) -> int:
+    """Elimina i dati delle sessioni inattive da più di SESSION_EXPIRY_HOURS. Ritorna quante."""
+    global _stale_purged_at
+    now = now or time.time()
+    max_idle = SESSION_EXPIRY_HOURS * 3600
+    with _lock:
+        if now - _stale_purged_at > _STALE_PURGE_SECONDS:
+            _stale_purged_at = now
+            _purge_stale(now, max_idle)
+        expired = [session_id for session_id, seen in _last_seen.items() if now - seen > max_idle]
+        for session_id in expired:
+            release(session_id)
+            logger.info(f"Session data expired: {session_id[:8]}")
+    return len(expired)
+
+
+def session_usage(session_id=None) -> dict:
+    """Memoria e disco usati dalla sessione e dall'intero processo, con i budget (byte)."""
+    with _lock:
+        return {
+            "session_bytes": _memory_bytes(session_id) if session_id else 0,
+            "session_disk_bytes": sum(entry["disk_bytes"] for (owner, _), entry in _entries.items()
+                                      if owner == session_id and entry["value"] is None),
+            "session_budget": int(SESSION_MEMORY_BUDGET_MB * _MB),
+            "total_bytes": _memory_bytes(),
+            "total_disk_bytes": sum(entry["disk_bytes"] for entry in _entries.values()),
+            "global_budget": int(SESSION_GLOBAL_BUDGET_MB * _MB),
+            "sessions": len(_last_seen),
+        }
+
+
+register_collector("session_store", lambda: {
+    key: value for key, value in session_usage().items() if not key.startswith("session_")
+})
@@ -0,0 +1,101 @@
+"""
+Avvio dell'app: operazioni una tantum del processo e precaricamento in
+background dei moduli pesanti.
+
+app.py importa solo ciò che serve alle pagine di accesso (info, login,
+registrazione) e ogni pagina viene importata al primo utilizzo: pandas,
+pyarrow e requests non rallentano il primo rendering. Perché il primo utente
+che apre upload, view o demand non attenda comunque gli import, al primo
+avvio dell'app on_startup() crea le directory dei dati, avvia la coda di
+invio (che recupera l'outbox) e le metriche, poi importa quei moduli in un
+thread in background (una sola volta per processo, STARTUP_WARMUP per
+disattivare il precaricamento). Sempre in background vengono recuperati i
+salvataggi di forecast interrotti (giornale di src/edi/pipeline.py).
+
+I tempi di import del warm-up finiscono nel log e nelle metriche
+(warmup_import_seconds); il profilo completo degli import è in
+benchmarks/startup.py.
+"""
+import importlib
+import threading
+import time
+
+from src.utils.config import STARTUP_WARMUP, ensure_data_dirs
+from src.utils.dispatch_queue import get_dispatch_queue
+from src.utils.logger import setup_logger
+from src.utils.metrics import observe, start_exporters
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("startup")
+
+# Dal più usato: le pagine importano a loro volta pandas, pyarrow e il parser
+WARMUP_MODULES = (
+    "pages.upload_forecast_page",
+    "pages.view_forecast_page",
+    "pages.demand_page",
+    "pages.profile_page",
+    "pages.user_list_page",
+    "requests",
+    "tenacity",
+)
+
+_lock = threading.Lock()
+_started = False
+_status = {"done": False, "seconds": None, "modules": {}}  # modulo -> secondi di import
+
+
+def _warm_up(modules):
+    start = time.perf_counter()
+    for module in modules:
+        module_start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning(f"Warm-up import of {module} failed: {e}")
+            continue
+        elapsed = time.perf_counter() - module_start
+        _status["modules"][module] = elapsed
+        observe("warmup_import_seconds", elapsed, module=module)
+    _status["seconds"] = time.perf_counter() - start
+    _status["done"] = True
+    slowest = sorted(_status["modules"].items(), key=lambda item: -item[1])[:3]
+    logger.info(f"Warm-up completed in {_status['seconds']:.2f}s "
+                f"({', '.join(f'{module} {seconds * 1000:.0f} ms' for module, seconds in slowest)})")
+
+
+def _recover_saves():
+    # Import qui: la pipeline carica pandas, che non deve rallentare il primo rendering
+    try:
+        from src.edi.pipeline import recover_interrupted_saves
+        recovered = recover_interrupted_saves()
+    except Exception as e:
+        logger.error(f"Recovery of interrupted saves failed: {e}")
+        return
+    if recovered:
+        logger.warning(f"{recovered} interrupted forecast saves recovered")
+
+
+def on_startup(warmup_modules=WARMUP_MODULES):
+    """
+    Operazioni di avvio del processo (una sola volta): directory dei dati, coda
+    di invio email/notifiche, metriche, recupero dei salvataggi interrotti e
+    precaricamento dei moduli in background.
+    """
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    start = time.perf_counter()
+    ensure_data_dirs()
+    get_dispatch_queue()
+    start_exporters()
+    logger.info(f"Startup completed in {(time.perf_counter() - start) * 1000:.0f} ms")
+    threading.Thread(target=_recover_saves, name="save-recovery", daemon=True).start()
+    if STARTUP_WARMUP:
+        threading.Thread(target=_warm_up, args=(warmup_modules,), name="warmup", daemon=True).start()
+
+
+def warmup_status() -> dict:
+    """{"done": bool, "seconds": durata complessiva, "modules": {modulo: secondi}}."""
+    return {**_status, "modules": dict(_status["modules"])}
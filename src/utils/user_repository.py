@@ -0,0 +1,321 @@
+"""
+Archivio utenti con backend intercambiabili.
+
+- "sqlite": database SQLite in WAL mode con email come chiave primaria:
+            letture puntuali indicizzate e aggiornamenti di una sola riga
+            in transazione, sicuri anche con più sessioni/processi;
+- "json":   formato storico users.json ({email: user_data}), riscritto per
+            intero (in modo atomico, sotto lock tra processi) ad ogni modifica.
+
+version() cambia ad ogni scrittura, anche di altri processi: in SQLite è un
+contatore nella tabella meta incrementato nella stessa transazione della
+scrittura, in JSON la firma (mtime, size) del file. Dopo una scrittura,
+take_write_versions() restituisce le versioni prima e dopo di essa, per
+aggiornare le cache senza svuotarle.
+
+Il backend è scelto con USER_STORE_BACKEND. Al primo avvio del backend SQLite
+gli utenti di users.json vengono importati automaticamente (una sola volta);
+l'import può essere rilanciato a mano con
+
+    python -m src.utils.user_repository import [--force]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+from src.utils.config import USERS_FILE, USERS_DB_FILE, USER_STORE_BACKEND, ensure_data_dirs
+from src.utils.logger import setup_logger
+from src.utils.file_io import atomic_write, file_lock
+
+# Inizializza il logger per questo modulo
+logger = setup_logger("user_repository")
+
+
+class UserAlreadyExistsError(ValueError):
+    """Registrazione di un'email già presente."""
+
+
+def _file_signature(path):
+    """(mtime_ns, size) del file, None se non esiste."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_users_json(path):
+    """Legge users.json (lista o dict) e restituisce {email_minuscola: user_data}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return {user["email"].lower(): user for user in data if "email" in user}
+    return {k.lower(): v for k, v in data.items()}
+
+
+# -----------------------------
+# BACKEND JSON (storico)
+# -----------------------------
+class JsonUserRepository:
+    name = "json"
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            # Vecchio formato a lista: convertilo subito
+            users = _read_users_json(self.path)
+            self._save(users)
+            return users
+        return {k.lower(): v for k, v in data.items()}
+
+    def _save(self, users):
+        before = _file_signature(self.path)
+        # Un lettore concorrente vede sempre il file precedente o quello nuovo completo
+        with atomic_write(self.path) as f:
+            json.dump(users, f, indent=2, ensure_ascii=False)
+        self._local.write_versions = (before, _file_signature(self.path))
+
+    def get(self, email):
+        return self._load().get(email.lower())
+
+    def all(self):
+        return list(self._load().values())
+
+    def add(self, user):
+        with self._lock, file_lock("users_json"):
+            users = self._load()
+            email = user["email"].lower()
+            if email in users:
+                raise UserAlreadyExistsError(email)
+            users[email] = user
+            self._save(users)
+
+    def update(self, email, fields):
+        with self._lock, file_lock("users_json"):
+            users = self._load()
+            email = email.lower()
+            if email not in users:
+                return False
+            users[email].update(fields)
+            self._save(users)
+            return True
+
+    def replace_all(self, users):
+        with self._lock, file_lock("users_json"):
+            self._save({k.lower(): v for k, v in users.items()})
+
+    def version(self):
+        """Firma che cambia ad ogni scrittura del file (usata per invalidare le cache)."""
+        return _file_signature(self.path)
+
+    def take_write_versions(self):
+        """(versione prima, versione dopo) dell'ultima scrittura di questo thread, poi azzerate."""
+        versions = getattr(self._local, "write_versions", (None, None))
+        self._local.write_versions = (None, None)
+        return versions
+
+
+# -----------------------------
+# BACKEND SQLITE
+# -----------------------------
+class SqliteUserRepository:
+    name = "sqlite"
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        email TEXT PRIMARY KEY,
+        data  TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key   TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """
+
+    def __init__(self, path=USERS_DB_FILE, import_from=USERS_FILE):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self._SCHEMA)
+        if import_from and not self._meta("json_imported"):
+            import_users_json(import_from, self)
+
+    def _conn(self):
+        """Una connessione per thread (Streamlit esegue ogni sessione in un thread diverso)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout = 30000")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, key):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _bump_version(self, conn):
+        """Incrementa il contatore delle scritture, dentro la transazione della scrittura."""
+        before = int(self._meta("version") or 0)
+        self._set_meta(conn, "version", str(before + 1))
+        self._local.pending_versions = (before, before + 1)
+
+    def _commit(self, conn):
+        conn.execute("COMMIT")
+        self._local.write_versions = getattr(self._local, "pending_versions", (None, None))
+
+    def get(self, email):
+        row = self._conn().execute("SELECT data FROM users WHERE email = ?", (email.lower(),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self):
+        return [json.loads(row[0]) for row in self._conn().execute("SELECT data FROM users ORDER BY rowid")]
+
+    def add(self, user):
+        email = user["email"].lower()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO users (email, data) VALUES (?, ?)",
+                (email, json.dumps(user, ensure_ascii=False)),
+            )
+            self._bump_version(conn)
+            self._commit(conn)
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK")
+            raise UserAlreadyExistsError(email)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update(self, email, fields):
+        """Aggiorna i campi indicati di un solo utente (lettura + scrittura nella stessa transazione)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM users WHERE email = ?", (email.lower(),)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            user = json.loads(row[0])
+            user.update(fields)
+            conn.execute(
+                "UPDATE users SET data = ? WHERE email = ?",
+                (json.dumps(user, ensure_ascii=False), email.lower()),
+            )
+            self._bump_version(conn)
+            self._commit(conn)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def replace_all(self, users):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM users")
+            conn.executemany(
+                "INSERT INTO users (email, data) VALUES (?, ?)",
+                [(k.lower(), json.dumps(v, ensure_ascii=False)) for k, v in users.items()],
+            )
+            self._bump_version(conn)
+            self._commit(conn)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def version(self):
+        """
+        Contatore delle scritture, anche di altri processi. A differenza di
+        mtime/size dei file (che dopo un checkpoint, con il -wal riusato e
+        timestamp grossolani, possono restare uguali) cambia ad ogni commit.
+        """
+        return int(self._meta("version") or 0)
+
+    def take_write_versions(self):
+        """(versione prima, versione dopo) dell'ultima scrittura di questo thread, poi azzerate."""
+        versions = getattr(self._local, "write_versions", (None, None))
+        self._local.write_versions = self._local.pending_versions = (None, None)
+        return versions
+
+
+def import_users_json(json_path=USERS_FILE, repo=None, force=False) -> int:
+    """
+    Importa users.json nel backend SQLite (import one-shot).
+    Gli utenti già presenti nel database non vengono sovrascritti, salvo `force`.
+
+    Returns:
+        int: numero di utenti importati
+    """
+    repo = repo or get_user_repository()
+    users = _read_users_json(json_path)
+    conn = repo._conn()
+    verb = "INSERT OR REPLACE" if force else "INSERT OR IGNORE"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        before = conn.total_changes
+        conn.executemany(
+            f"{verb} INTO users (email, data) VALUES (?, ?)",
+            [(email, json.dumps(user, ensure_ascii=False)) for email, user in users.items()],
+        )
+        imported = conn.total_changes - before
+        repo._set_meta(conn, "json_imported", str(json_path))
+        repo._bump_version(conn)
+        repo._commit(conn)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if users:
+        logger.info(f"Imported {imported} users from {json_path} into {repo.path}")
+    return imported
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_user_repository():
+    """Restituisce l'archivio utenti configurato (istanza unica per processo)."""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            if USER_STORE_BACKEND == "json":
+                _repository = JsonUserRepository()
+            elif USER_STORE_BACKEND == "sqlite":
+                _repository = SqliteUserRepository()
+            else:
+                raise ValueError(f"Unknown user store backend: {USER_STORE_BACKEND}")
+        return _repository
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="User store tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    cmd_import = subparsers.add_parser("import", help="Import users.json into the SQLite user store")
+    cmd_import.add_argument("--source", default=str(USERS_FILE), help="users.json path")
+    cmd_import.add_argument("--force", action="store_true", help="Overwrite users already in the database")
+    args = parser.parse_args()
+    ensure_data_dirs()
+
+    if args.command == "import":
+        count = import_users_json(args.source, SqliteUserRepository(import_from=None), force=args.force)
+        print(f"Imported {count} users into {USERS_DB_FILE}")